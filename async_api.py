@@ -0,0 +1,370 @@
+import asyncio
+import time
+import weakref
+
+from main import (
+    OPENF1_API_BASE,
+    HTTP_POOL_SIZE,
+    HTTP_TIMEOUT,
+    RACE_RESULT_CACHE_PATTERN,
+    RACE_RESULTS_MAX_WORKERS,
+    RETRY_STATUS_CODES,
+    TokenBucket,
+    cached_races,
+    driver_cache_entry,
+    driver_cached,
+    driver_fallback,
+    driver_info,
+    get_http_client,
+    load_cache,
+    load_driver_names,
+    load_race_results,
+    merge_races,
+    newest_session_start,
+    project_results,
+    retry_after_seconds,
+    save_cache,
+    save_driver_names,
+    season_drivers,
+    season_results,
+    session_driver_names,
+    sessions_request,
+    sessions_response,
+    sorted_races,
+)
+from metrics import logger, metrics
+
+try:
+    import httpx
+except ImportError as e:  # optional dependency, see the "async" extra
+    raise ImportError(
+        "async_api needs httpx; install it with pip install 'f1-chart[async]'"
+    ) from e
+
+# asyncio counterparts of get_races, get_race_results and get_driver_map for
+# use inside an event loop (e.g. an async web app). They share the caches,
+# rate limits and retry policy of the blocking versions, wait with
+# asyncio.sleep instead of time.sleep, and concurrent calls for the same data
+# share one upstream request.
+
+
+class InFlight:
+    # Runs at most one task per key; callers asking for a key that is already
+    # being fetched wait for the same result
+    def __init__(self):
+        self.tasks = {}
+
+    async def run(self, key, factory):
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.tasks[key] = task
+            task.add_done_callback(lambda _: self.tasks.pop(key, None))
+        # shield: one caller being cancelled doesn't cancel the others
+        return await asyncio.shield(task)
+
+
+class AsyncOpenF1Client:
+    def __init__(
+        self,
+        base_url=None,
+        rate_limits=None,
+        pool_size=HTTP_POOL_SIZE,
+        timeout=HTTP_TIMEOUT,
+    ):
+        self.base_url = base_url
+        if rate_limits is None:
+            # The blocking client's buckets: sync and async requests from this
+            # process share one budget
+            self.buckets = get_http_client().buckets
+        else:
+            self.buckets = [TokenBucket(*limit) for limit in rate_limits]
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+        self.in_flight = InFlight()
+
+    def url(self, path):
+        return f"{self.base_url or OPENF1_API_BASE}{path}"
+
+    async def acquire(self):
+        for bucket in self.buckets:
+            while True:
+                wait = bucket.reserve()
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+    async def get(self, path, max_retries=3, headers=None):
+        key = (path, tuple(sorted((headers or {}).items())))
+        return await self.in_flight.run(
+            key, lambda: self.fetch(path, max_retries, headers)
+        )
+
+    async def fetch(self, path, max_retries=3, headers=None):
+        url = self.url(path)
+        for attempt in range(max_retries):
+            await self.acquire()
+            resp = None
+            metrics.incr("http.requests")
+            if attempt:
+                metrics.incr("http.retries")
+            try:
+                start = time.perf_counter()
+                resp = await self.client.get(url, headers=headers)
+                metrics.record_time("http", time.perf_counter() - start)
+                metrics.incr("http.bytes", len(resp.content))
+                if resp.status_code == 429:
+                    metrics.incr("http.429")
+                if resp.status_code == 304:
+                    # Not modified: an answer, not an error (httpx raises on it)
+                    return resp
+                resp.raise_for_status()
+                return resp
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in RETRY_STATUS_CODES:
+                    metrics.incr("http.errors")
+                    raise
+                error = e
+            except httpx.TransportError as e:
+                error = e
+            logger.warning(
+                "API request failed (attempt %d/%d): %s",
+                attempt + 1,
+                max_retries,
+                error,
+            )
+            if attempt < max_retries - 1:
+                wait_time = retry_after_seconds(resp, 2**attempt)
+                logger.info("Retrying in %s seconds...", wait_time)
+                await asyncio.sleep(wait_time)
+            else:
+                metrics.incr("http.errors")
+                raise error
+
+    async def get_json(self, path, max_retries=3):
+        return (await self.get(path, max_retries=max_retries)).json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+# One client per event loop: httpx connections can't move between loops
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncOpenF1Client()
+    return client
+
+
+async def async_fetch_sessions(year, since=None, meta=None, max_retries=3, client=None):
+    path, headers = sessions_request(year, since, meta)
+    client = client or get_async_client()
+    resp = await client.get(path, max_retries=max_retries, headers=headers)
+    return sessions_response(resp, path, meta)
+
+
+async def async_get_races(
+    year, force_update=False, update_cache=False, max_retries=3, ttl=None, client=None
+):
+    client = client or get_async_client()
+    key = ("races", year, force_update, update_cache, ttl)
+    return await client.in_flight.run(
+        key,
+        lambda: _get_races(year, force_update, update_cache, max_retries, ttl, client),
+    )
+
+
+async def _get_races(year, force_update, update_cache, max_retries, ttl, client):
+    sessions, existing_sessions, meta = await asyncio.to_thread(
+        cached_races, year, force_update, update_cache, ttl
+    )
+    if sessions is None:
+        try:
+            new_sessions, new_meta = await async_fetch_sessions(
+                year,
+                since=newest_session_start(existing_sessions),
+                meta=meta,
+                max_retries=max_retries,
+                client=client,
+            )
+        except httpx.HTTPError:
+            logger.warning("Failed to fetch races after %d attempts", max_retries)
+            if not existing_sessions:
+                raise
+            logger.warning("Using existing cached data")
+            sessions = existing_sessions
+        else:
+            sessions = await asyncio.to_thread(
+                merge_races, year, existing_sessions, new_sessions, new_meta
+            )
+    return sorted_races(sessions)
+
+
+async def async_get_race_results(session_key, max_retries=3, client=None):
+    cache_file = RACE_RESULT_CACHE_PATTERN.format(session_key=session_key)
+    data = await asyncio.to_thread(load_cache, cache_file)
+    if data is not None:
+        return data
+    client = client or get_async_client()
+    try:
+        data = await client.get_json(
+            f"/session_result?session_key={session_key}", max_retries=max_retries
+        )
+    except httpx.HTTPError:
+        logger.warning(
+            "Failed to fetch race results for session %s after %d attempts",
+            session_key,
+            max_retries,
+        )
+        return []
+    await asyncio.to_thread(save_cache, cache_file, data)
+    return data
+
+
+async def async_get_race_results_many(
+    session_keys,
+    max_workers=RACE_RESULTS_MAX_WORKERS,
+    max_retries=3,
+    project=False,
+    client=None,
+):
+    # Same result as get_race_results_many: results by session key, in order.
+    # The cached sessions are read in one go, off the event loop.
+    session_keys = list(dict.fromkeys(session_keys))
+    cached = await asyncio.to_thread(load_race_results, session_keys)
+    limit = asyncio.Semaphore(max_workers)
+
+    async def fetch(session_key):
+        data = cached.get(session_key)
+        if data is None:
+            async with limit:
+                data = await async_get_race_results(session_key, max_retries, client)
+        return project_results(data) if project else data
+
+    results = await asyncio.gather(*(fetch(key) for key in session_keys))
+    return dict(zip(session_keys, results))
+
+
+async def async_fetch_drivers(path, max_retries=5, client=None):
+    try:
+        return await (client or get_async_client()).get_json(
+            path, max_retries=max_retries
+        )
+    except httpx.HTTPError:
+        logger.warning(
+            "- Failed after %d attempts, using driver number as fallback", max_retries
+        )
+        return None
+
+
+async def async_get_driver_map(
+    driver_session_pairs, max_retries=5, by_session=False, teams=False, client=None
+):
+    # Same result as get_driver_map, with the missing sessions (or pairs)
+    # fetched concurrently
+    driver_session_pairs = list(driver_session_pairs)
+    cache = await asyncio.to_thread(
+        load_driver_names,
+        {
+            f"{driver_number}:{session_key}"
+            for driver_number, session_key in driver_session_pairs
+        },
+    )
+    new_names = {}
+    if by_session:
+        missing = {}
+        for driver_number, session_key in driver_session_pairs:
+            if not driver_cached(cache.get(f"{driver_number}:{session_key}"), teams):
+                missing.setdefault(session_key, set()).add(driver_number)
+        replies = await asyncio.gather(
+            *(
+                async_fetch_drivers(
+                    f"/drivers?session_key={session_key}", max_retries, client
+                )
+                for session_key in missing
+            )
+        )
+        for (session_key, driver_numbers), data in zip(missing.items(), replies):
+            new_names.update(
+                session_driver_names(data, session_key, driver_numbers, cache)
+            )
+    else:
+        missing = [
+            (driver_number, session_key)
+            for driver_number, session_key in dict.fromkeys(driver_session_pairs)
+            if not driver_cached(cache.get(f"{driver_number}:{session_key}"), teams)
+        ]
+        replies = await asyncio.gather(
+            *(
+                async_fetch_drivers(
+                    f"/drivers?driver_number={driver_number}&session_key={session_key}",
+                    max_retries,
+                    client,
+                )
+                for driver_number, session_key in missing
+            )
+        )
+        for (driver_number, session_key), data in zip(missing, replies):
+            key = f"{driver_number}:{session_key}"
+            new_names[key] = (
+                driver_cache_entry(data[0], driver_number)
+                if data
+                else driver_fallback(cache.get(key), driver_number)
+            )
+    cache.update(new_names)
+    await asyncio.to_thread(save_driver_names, new_names)
+    driver_map = {}
+    for driver_number, session_key in driver_session_pairs:
+        info = driver_info(cache[f"{driver_number}:{session_key}"])
+        driver_map[(str(driver_number), str(session_key))] = (
+            info if teams else info["name"]
+        )
+    return driver_map
+
+
+async def async_load_season(
+    year, force_update=False, update_cache=False, ttl=None, client=None
+):
+    # Same result as main.load_season: (all_race_results, driver_number_to_name,
+    # driver_teams) or None. Scoring and plotting are CPU-bound; run main.score_season in a
+    # thread (asyncio.to_thread) if the event loop must stay responsive.
+    with metrics.stage("fetch_seasons", year=year):
+        races = await async_get_races(
+            year,
+            force_update=force_update,
+            update_cache=update_cache,
+            ttl=ttl,
+            client=client,
+        )
+    if not races:
+        logger.warning("No races found for this season.")
+        return None
+    with metrics.stage("fetch_results", year=year):
+        results_by_session = await async_get_race_results_many(
+            (race["session_key"] for race in races), project=True, client=client
+        )
+    all_race_results, driver_session_pairs, lookup = season_results(
+        races, results_by_session
+    )
+    if not all_race_results:
+        logger.warning("No race results available for this season.")
+        return None
+    with metrics.stage("driver_map", year=year):
+        driver_map = await async_get_driver_map(
+            driver_session_pairs, by_session=True, teams=True, client=client
+        )
+    return season_drivers(all_race_results, driver_map, lookup)
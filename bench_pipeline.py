@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_openf1 import MockOpenF1
+
+# End-to-end benchmark against the local mock OpenF1 server: runs main.py in
+# a fresh process per scenario and reports wall time, API requests (from the
+# mock's counters) and peak RSS. Results can be saved and compared with a
+# previous run, e.g. before and after an optimization.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs main.main() with the given argv and reports the peak RSS (KB on Linux)
+# of the process and of any worker processes it started
+RUNNER = """
+import resource, sys
+sys.argv = sys.argv[1:]
+import main
+main.main()
+peak = max(
+    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+)
+print(f"PEAK_RSS_KB={peak}", file=sys.stderr)
+"""
+
+SCENARIOS = ("cold", "warm", "incremental", "multi-season")
+
+
+def run_main(mock, workdir, args, env):
+    mock.reset_stats()
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", RUNNER, "main.py", *args],
+        cwd=workdir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"main.py {' '.join(args)} failed:\n{proc.stderr}")
+    peak_kb = 0
+    for line in proc.stderr.splitlines():
+        if line.startswith("PEAK_RSS_KB="):
+            peak_kb = int(line.split("=", 1)[1])
+    return {
+        "wall_s": round(wall, 3),
+        "requests": mock.stats["requests"],
+        "rate_limited": mock.stats["429"],
+        "failed": mock.stats["500"],
+        "bytes": mock.stats["bytes"],
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+    }
+
+
+def run_scenario(name, mock, env, year, years, extra_args):
+    # Each scenario starts from an empty cache directory
+    with tempfile.TemporaryDirectory() as workdir:
+        os.mkdir(os.path.join(workdir, ".cache"))
+        single = ["--year", str(year), *extra_args]
+        if name == "cold":
+            return run_main(mock, workdir, single, env)
+        if name == "warm":
+            run_main(mock, workdir, single, env)
+            return run_main(mock, workdir, single, env)
+        if name == "incremental":
+            # Cache a season with its last race missing, then pick that race up
+            released = mock.released[year]
+            mock.released[year] = released - 1
+            try:
+                run_main(mock, workdir, single, env)
+            finally:
+                mock.released[year] = released
+            return run_main(mock, workdir, [*single, "--update-cache"], env)
+        if name == "multi-season":
+            years_arg = f"{years[0]}-{years[-1]}"
+            return run_main(mock, workdir, ["--years", years_arg, *extra_args], env)
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def format_row(name, result, baseline=None):
+    row = (
+        f"{name:<14}{result['wall_s']:>8.2f} s{result['requests']:>8} req"
+        f"{result['rate_limited']:>5} 429{result['failed']:>5} 5xx"
+        f"{result['peak_rss_mb']:>9.1f} MB"
+    )
+    if baseline:
+        change = (result["wall_s"] / baseline["wall_s"] - 1) * 100
+        row += f"  ({change:+.0f}% time, {result['requests'] - baseline['requests']:+d} req)"
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark main.py end to end against the mock OpenF1 server"
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=SCENARIOS,
+        help="Scenario to run, may be repeated (default: all)",
+    )
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--first-year", type=int, default=2021)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--failure-ratio", type=float, default=0.0)
+    parser.add_argument(
+        "--client-rate-limits",
+        default="",
+        help='F1_RATE_LIMITS for main.py, e.g. "3/1,30/60" for the real API limits '
+        "(default: none)",
+    )
+    parser.add_argument(
+        "--cache-backend", choices=("json", "sqlite"), help="Passed on to main.py"
+    )
+    parser.add_argument(
+        "--output-mode", default="json", help="Passed on to main.py (default json)"
+    )
+    parser.add_argument("--save", metavar="FILE", help="Write the results as JSON")
+    parser.add_argument(
+        "--compare", metavar="FILE", help="Show changes against saved results"
+    )
+    args = parser.parse_args()
+
+    years = list(range(args.first_year, args.year + 1))
+    mock = MockOpenF1(
+        seasons=years,
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit_ratio=args.rate_limit_ratio,
+        failure_ratio=args.failure_ratio,
+    )
+    extra_args = ["--output-mode", args.output_mode]
+    if args.cache_backend:
+        extra_args += ["--cache-backend", args.cache_backend]
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+    results = {}
+    with mock:
+        env = dict(
+            os.environ,
+            OPENF1_API_BASE=mock.url,
+            F1_RATE_LIMITS=args.client_rate_limits,
+            PYTHONPATH=os.pathsep.join(
+                filter(None, [HERE, os.environ.get("PYTHONPATH")])
+            ),
+        )
+        for name in args.scenario or SCENARIOS:
+            results[name] = run_scenario(name, mock, env, args.year, years, extra_args)
+            print(format_row(name, results[name], baseline.get(name)))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Startup-time benchmark: how long a fresh interpreter takes to import main,
+# and which heavy modules that pulls in. Exits non-zero when the median is
+# above --max-ms or a heavy module gets imported eagerly again.
+
+HEAVY_MODULES = ("pandas", "numpy", "plotly", "pycountry")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def eager_heavy_modules():
+    code = (
+        "import sys, main; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+    return [m for m in out.split(",") if m]
+
+
+def time_import(runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], cwd=HERE, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure main.py startup time")
+    parser.add_argument("--runs", type=int, default=10, help="Number of runs")
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=500,
+        help="Fail if the median import time exceeds this many milliseconds",
+    )
+    args = parser.parse_args()
+
+    heavy = eager_heavy_modules()
+    timings = time_import(args.runs)
+    median = statistics.median(timings)
+    print(
+        f"import main: median {median:.0f} ms, min {min(timings):.0f} ms,"
+        f" max {max(timings):.0f} ms over {args.runs} runs"
+    )
+    if heavy:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(heavy)}")
+    if median > args.max_ms:
+        print(f"FAIL: median above {args.max_ms:.0f} ms")
+    return 1 if heavy or median > args.max_ms else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Single-file cache backend: one SQLite database in WAL mode instead of one
+# JSON file per key. Values are stored as JSON text; season and race result
+# entries are also indexed by year / session_key, and driver names (with
+# their team, when known) live in their own table keyed by (driver_number,
+# session_key).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    year INTEGER,
+    session_key INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_year ON cache (year);
+CREATE INDEX IF NOT EXISTS cache_session_key ON cache (session_key);
+CREATE TABLE IF NOT EXISTS driver_names (
+    driver_number TEXT NOT NULL,
+    session_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    team_name TEXT,
+    team_colour TEXT,
+    PRIMARY KEY (driver_number, session_key)
+);
+CREATE INDEX IF NOT EXISTS driver_names_session_key ON driver_names (session_key);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+INSERT_DRIVER = (
+    "INSERT OR REPLACE INTO driver_names"
+    " (driver_number, session_key, name, team_name, team_colour)"
+    " VALUES (?, ?, ?, ?, ?)"
+)
+
+YEAR_KEY_RE = re.compile(r"^(?:season|standings)_(\d+)[_.]")
+SESSION_KEY_RE = re.compile(r"^race_result_(\d+)\.json$")
+
+# Columns added to driver_names after its first release
+DRIVER_TEAM_COLUMNS = ("team_name", "team_colour")
+
+# SQLite parameter limit is 999 on older builds
+MAX_QUERY_PARAMS = 900
+
+logger = logging.getLogger("f1chart.cache")
+
+
+def parse_key(key):
+    year = YEAR_KEY_RE.match(key)
+    session_key = SESSION_KEY_RE.match(key)
+    return (
+        int(year.group(1)) if year else None,
+        int(session_key.group(1)) if session_key else None,
+    )
+
+
+def split_driver_key(key):
+    driver_number, _, session_key = key.partition(":")
+    return driver_number, session_key
+
+
+def driver_row(key, entry):
+    # driver_names row for a driver cache entry: a plain name (team columns
+    # NULL), or a dict with the name and team as written by
+    # main.driver_cache_entry (unknown team fields stored as "")
+    if isinstance(entry, str):
+        return split_driver_key(key) + (entry, None, None)
+    return split_driver_key(key) + (
+        entry["name"],
+        *(entry.get(column, "") for column in DRIVER_TEAM_COLUMNS),
+    )
+
+
+def driver_entry(name, team_name, team_colour):
+    if team_name is None and team_colour is None:
+        return name
+    team = {"team_name": team_name, "team_colour": team_colour}
+    return dict(name=name, **{k: v for k, v in team.items() if v})
+
+
+class SQLiteCache:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        with conn:
+            # Under the write lock, so concurrent openers add each column once
+            conn.execute("BEGIN IMMEDIATE")
+            columns = {
+                row[1] for row in conn.execute("PRAGMA table_info(driver_names)")
+            }
+            for column in DRIVER_TEAM_COLUMNS:
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE driver_names ADD COLUMN {column} TEXT")
+
+    def connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
+
+    def get(self, key):
+        row = (
+            self.connection()
+            .execute("SELECT value FROM cache WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        year, session_key = parse_key(key)
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, year, session_key, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value), year, session_key, time.time()),
+            )
+
+    def get_race_results(self, session_keys):
+        # {session_key: value} of the cached race_result entries among
+        # session_keys, a few queries for any number of sessions
+        session_keys = list(session_keys)
+        results = {}
+        conn = self.connection()
+        for i in range(0, len(session_keys), MAX_QUERY_PARAMS):
+            chunk = session_keys[i : i + MAX_QUERY_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                "SELECT session_key, value FROM cache"
+                f" WHERE session_key IN ({placeholders})",
+                [int(k) for k in chunk],
+            )
+            for session_key, value in rows:
+                results[session_key] = json.loads(value)
+        return results
+
+    def get_driver_names(self, keys=None):
+        # keys are "{driver_number}:{session_key}" strings as in the JSON cache;
+        # values are the same entries as in the JSON cache too
+        conn = self.connection()
+        if keys is None:
+            rows = conn.execute(
+                "SELECT driver_number, session_key, name, team_name, team_colour"
+                " FROM driver_names"
+            )
+            return {f"{d}:{s}": driver_entry(*entry) for d, s, *entry in rows}
+        names = {}
+        for key in keys:
+            driver_number, session_key = split_driver_key(key)
+            row = conn.execute(
+                "SELECT name, team_name, team_colour FROM driver_names"
+                " WHERE driver_number = ? AND session_key = ?",
+                (driver_number, session_key),
+            ).fetchone()
+            if row:
+                names[key] = driver_entry(*row)
+        return names
+
+    def set_driver_names(self, names):
+        rows = [driver_row(key, entry) for key, entry in names.items()]
+        with self.connection() as conn:
+            conn.executemany(INSERT_DRIVER, rows)
+
+    def migrate_json_dir(self, cache_dir, driver_cache_file):
+        # One-shot import of the legacy one-file-per-key cache. The JSON files
+        # are left in place; the marker in meta stops the import from running
+        # again. The import holds the database's write lock, so when several
+        # processes open a fresh database only the first one runs it.
+        conn = self.connection()
+        marker = "SELECT 1 FROM meta WHERE key = 'json_migrated'"
+        if conn.execute(marker).fetchone():
+            return 0
+        migrated = 0
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute(marker).fetchone():
+                return 0
+            for filename in sorted(os.listdir(cache_dir)):
+                path = os.path.join(cache_dir, filename)
+                if not filename.endswith(".json") or not os.path.isfile(path):
+                    continue
+                try:
+                    with open(path, "r") as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping unreadable cache file %s: %s", filename, e)
+                    continue
+                if filename == driver_cache_file:
+                    conn.executemany(
+                        INSERT_DRIVER, [driver_row(k, v) for k, v in data.items()]
+                    )
+                else:
+                    year, session_key = parse_key(filename)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache"
+                        " (key, value, year, session_key, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (
+                            filename,
+                            json.dumps(data),
+                            year,
+                            session_key,
+                            os.path.getmtime(path),
+                        ),
+                    )
+                migrated += 1
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                (str(time.time()),),
+            )
+        if migrated:
+            logger.info("Migrated %d JSON cache files into %s", migrated, self.path)
+        return migrated
@@ -0,0 +1,249 @@
+import os
+import tempfile
+
+from main import (
+    EXPORT_FORMATS,
+    EXPORT_TABLE_PATTERN,
+    MISSING_POSITION,
+    ResultColumns,
+    driver_sessions,
+    load_season,
+    season_drivers,
+)
+from metrics import logger, metrics
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError as e:  # optional dependency, see the "columnar" extra
+    raise ImportError(
+        "columnar needs pyarrow; install it with pip install 'f1-chart[columnar]'"
+    ) from e
+
+# Columnar export of the normalized season data: sessions, results and driver
+# names, one file per table and year under <root>/<table>/year=<year>/ (hive
+# style, so pyarrow.dataset, pandas, DuckDB or Spark can read the whole tree).
+# Arrow IPC files are memory-mapped when read back, so loading a decade of
+# seasons is a handful of zero-copy reads instead of thousands of json.load
+# calls. read_season returns the same data as main.load_season, with each
+# session's results as main.ResultColumns views of the mapped columns, and
+# is used by main.py --from-export.
+
+SCHEMAS = {
+    "sessions": pa.schema(
+        [
+            ("session_key", pa.int64()),
+            ("meeting_key", pa.int64()),
+            ("year", pa.int32()),
+            ("session_name", pa.string()),
+            ("session_type", pa.string()),
+            # ISO 8601 as returned by the API, so it sorts and round-trips
+            ("date_start", pa.string()),
+            ("meeting_name", pa.string()),
+            ("location", pa.string()),
+            ("circuit_short_name", pa.string()),
+            ("country_code", pa.string()),
+        ]
+    ),
+    "results": pa.schema(
+        [
+            ("session_key", pa.int64()),
+            ("driver_number", pa.int64()),
+            ("position", pa.int64()),
+            ("points", pa.float64()),
+        ]
+    ),
+    "drivers": pa.schema(
+        [
+            ("session_key", pa.int64()),
+            ("driver_number", pa.int64()),
+            ("name", pa.string()),
+            ("team_name", pa.string()),
+            ("team_colour", pa.string()),
+        ]
+    ),
+}
+
+
+def table_path(root, table, year, fmt):
+    return os.path.join(
+        root, EXPORT_TABLE_PATTERN.format(table=table, year=year, format=fmt)
+    )
+
+
+def find_table(root, table, year):
+    # Path of the exported table for year, in whichever format it was written
+    for fmt in EXPORT_FORMATS:
+        path = table_path(root, table, year, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def rows_table(rows, table):
+    schema = SCHEMAS[table]
+    return pa.Table.from_pylist(
+        [{name: row.get(name) for name in schema.names} for row in rows],
+        schema=schema,
+    )
+
+
+def write_table(data, path, fmt):
+    # Same temp file and rename as main.write_json_atomic
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        if fmt == "parquet":
+            pq.write_table(data, tmp_path)
+        else:
+            with ipc.new_file(tmp_path, data.schema) as writer:
+                writer.write_table(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_table(path):
+    if path.endswith(".parquet"):
+        return pq.read_table(path, memory_map=True)
+    return ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def season_tables(year, loaded):
+    # The sessions, results and drivers tables of a season as returned by
+    # main.load_season: (all_race_results, driver_number_to_name,
+    # driver_teams). Drivers get a row per session they have a result in.
+    all_race_results, driver_number_to_name, driver_teams = loaded
+    sessions = [dict(race, year=race.get("year", year)) for race, _ in all_race_results]
+    results = []
+    drivers = {}
+    for race, race_results in all_race_results:
+        session_key = race["session_key"]
+        for result in race_results:
+            if result.driver_number is None:
+                continue
+            results.append(
+                {
+                    "session_key": session_key,
+                    "driver_number": result.driver_number,
+                    "position": result.position,
+                    "points": result.points,
+                }
+            )
+            key = (str(result.driver_number), str(session_key))
+            drivers[key] = dict(
+                driver_teams.get(key, {}),
+                session_key=int(session_key),
+                driver_number=int(result.driver_number),
+                name=driver_number_to_name.get(key[0], key[0]),
+            )
+    drivers = list(drivers.values())
+    return {
+        "sessions": rows_table(sessions, "sessions"),
+        "results": rows_table(results, "results"),
+        "drivers": rows_table(drivers, "drivers"),
+    }
+
+
+def export_season(year, loaded, root, fmt="arrow"):
+    # Writes the tables of a season loaded with main.load_season. Returns the
+    # paths written.
+    paths = []
+    with metrics.stage("export", year=year):
+        for table, data in season_tables(year, loaded).items():
+            path = table_path(root, table, year, fmt)
+            write_table(data, path, fmt)
+            # Drop the partition's file in the other format, if any
+            for other in EXPORT_FORMATS:
+                stale = table_path(root, table, year, other)
+                if other != fmt and os.path.exists(stale):
+                    os.remove(stale)
+            paths.append(path)
+    logger.info("Exported %s season to %s", year, root)
+    return paths
+
+
+def export_seasons(years, options, root, fmt="arrow"):
+    # Fetches each season (through the usual caches) and exports it
+    paths = []
+    for year in years:
+        loaded = load_season(year, **options)
+        if loaded is not None:
+            paths.extend(export_season(year, loaded, root, fmt))
+    return paths
+
+
+def column_array(table, name, fill=None):
+    # numpy array of a column: a view of the table's buffer unless nulls have
+    # to be replaced with fill
+    column = table.column(name).combine_chunks()
+    if fill is not None and column.null_count:
+        column = pc.fill_null(column, fill)
+    return column.to_numpy(zero_copy_only=False)
+
+
+def session_results(results):
+    # {session_key: ResultColumns} from a results table, slicing the column
+    # arrays (no copies) at each change of session_key
+    if results.column("driver_number").null_count:
+        results = results.filter(pc.is_valid(results.column("driver_number")))
+    session_keys = column_array(results, "session_key")
+    columns = (
+        column_array(results, "driver_number"),
+        column_array(results, "position", MISSING_POSITION),
+        column_array(results, "points", float("nan")),
+    )
+    starts = np.flatnonzero(np.diff(session_keys)) + 1
+    if len(np.unique(session_keys[np.r_[0, starts]])) != len(starts) + 1:
+        # Sessions not stored contiguously: group them, keeping row order
+        order = np.argsort(session_keys, kind="stable")
+        session_keys = session_keys[order]
+        columns = [column[order] for column in columns]
+        starts = np.flatnonzero(np.diff(session_keys)) + 1
+    bounds = zip(np.r_[0, starts].tolist(), np.r_[starts, len(session_keys)].tolist())
+    return {
+        int(session_keys[start]): ResultColumns(
+            *(column[start:end] for column in columns)
+        )
+        for start, end in bounds
+        if end > start
+    }
+
+
+def read_season(year, root):
+    # Same result as main.load_season, read from an export: (all_race_results,
+    # driver_number_to_name, driver_teams), or None if the season wasn't
+    # exported
+    with metrics.stage("read_export", year=year):
+        tables = {}
+        for table in SCHEMAS:
+            path = find_table(root, table, year)
+            if path is None:
+                logger.warning("No exported %s for %s in %s", table, year, root)
+                return None
+            tables[table] = read_table(path)
+        by_session = session_results(tables["results"])
+        all_race_results = []
+        for race in tables["sessions"].to_pylist():
+            race = {name: value for name, value in race.items() if value is not None}
+            if by_session.get(race["session_key"]):
+                all_race_results.append((race, by_session[race["session_key"]]))
+        driver_map = {
+            (str(row.pop("driver_number")), str(row.pop("session_key"))): {
+                name: value for name, value in row.items() if value is not None
+            }
+            for row in tables["drivers"].to_pylist()
+        }
+    if not all_race_results:
+        logger.warning("No race results available for this season.")
+        return None
+    lookup = driver_sessions([race for race, _ in all_race_results])
+    return season_drivers(all_race_results, driver_map, lookup)
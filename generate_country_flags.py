@@ -0,0 +1,31 @@
+import os
+
+# Regenerates country_flags.py from pycountry's ISO 3166 data, so flag lookups
+# at runtime are a plain dict access and never load the pycountry database.
+# Usage: python generate_country_flags.py
+
+OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "country_flags.py")
+
+HEADER = """\
+# Generated by generate_country_flags.py from pycountry {version}; do not edit.
+# ISO 3166-1 alpha-3 -> alpha-2 country codes.
+
+ALPHA3_TO_ALPHA2 = {{
+"""
+
+
+def main():
+    import pycountry
+    from importlib.metadata import version
+
+    rows = sorted((c.alpha_3, c.alpha_2) for c in pycountry.countries)
+    with open(OUTPUT, "w") as f:
+        f.write(HEADER.format(version=version("pycountry")))
+        for alpha_3, alpha_2 in rows:
+            f.write(f'    "{alpha_3}": "{alpha_2}",\n')
+        f.write("}\n")
+    print(f"Wrote {len(rows)} codes to {OUTPUT}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,108 +1,579 @@
+# pandas, plotly and numpy are imported inside the functions that use them:
+# they dominate startup time and many runs never need them
 import requests
-import pandas as pd
-import plotly.express as px
-import pycountry
 import argparse
 from datetime import datetime
 import os
 import json
+import hashlib
+import sys
 import time
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import NamedTuple
+from urllib.parse import quote
 
-OPENF1_API_BASE = "https://api.openf1.org/v1"
+from metrics import configure_logging, logger, logging_options, metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# Override with e.g. the local mock_openf1.py server for offline runs
+OPENF1_API_BASE = os.environ.get("OPENF1_API_BASE", "https://api.openf1.org/v1")
 
 # Cache file patterns
 DRIVER_CACHE_FILE = "driver_name_cache.json"
-SEASON_CACHE_PATTERN = "season_{year}_races.json"
+SEASON_CACHE_PATTERN = "season_{year}_sessions.json"
+SEASON_META_PATTERN = "season_{year}_sessions.meta.json"
 RACE_RESULT_CACHE_PATTERN = "race_result_{session_key}.json"
+STANDINGS_CACHE_PATTERN = "standings_{year}.json"
+# Cache writes are serialized through a fixed set of lock files, keys hashed
+# onto them, instead of one lock file per key
+CACHE_LOCK_PATTERN = ".lock-{slot}"
+CACHE_LOCK_FILES = 16
+# Bump when the chart styling changes so cached charts are redrawn
+RENDER_CACHE_VERSION = 2
+
+# Chart files
+CHART_OUTPUT = "f1_standings.html"
+SEASON_CHART_PATTERN = "f1_standings_{year}.html"
+COMBINED_CHART_PATTERN = "f1_standings_{first}-{last}.html"
+
+# How plotly.js reaches the browser: "inline" embeds the full bundle in every
+# HTML file, "directory" shares one plotly.min.js next to the charts, "cdn"
+# loads it from the plotly CDN, and "json" writes only the figure spec, to be
+# opened through the shared viewer page
+OUTPUT_MODES = ("inline", "directory", "cdn", "json")
+# Large-data charts: WebGL traces, the drivers outside the top
+# LARGE_CHART_TOP_DRIVERS drawn as one min-max band, at most
+# LARGE_CHART_MAX_POINTS points per line and markers only up to
+# LARGE_CHART_MAX_MARKERS points. "auto" switches to it above
+# LARGE_CHART_CELLS (races x drivers).
+LARGE_CHART_SETTINGS = ("auto", "on", "off")
+LARGE_CHART = os.environ.get("F1_LARGE_CHART", "auto")
+LARGE_CHART_CELLS = 20000
+LARGE_CHART_TOP_DRIVERS = 40
+LARGE_CHART_MAX_POINTS = 400
+LARGE_CHART_MAX_MARKERS = 60
+# Static image outputs, rendered with plotly's write_image (needs kaleido)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".svg", ".pdf")
+# The render_key of each chart in a directory, by file name, kept next to them
+RENDER_MANIFEST_FILE = "render_manifest.json"
+PLOTLY_JS_FILE = "plotly.min.js"
+VIEWER_FILE = "viewer.html"
+VIEWER_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>F1 Standings</title>
+<script src="plotly.min.js"></script>
+</head>
+<body>
+<div id="chart"></div>
+<script>
+// Usage: viewer.html?chart=f1_standings_2024.json (serve the directory over HTTP)
+const chart = new URLSearchParams(location.search).get("chart") || "f1_standings.json";
+fetch(chart)
+  .then((resp) => resp.json())
+  .then((fig) => Plotly.newPlot("chart", fig.data, fig.layout, {responsive: true}));
+</script>
+</body>
+</html>
+"""
+
+# Columnar export (columnar.py, needs pyarrow): one file per table and season
+EXPORT_FORMATS = ("arrow", "parquet")
+EXPORT_TABLE_PATTERN = "{table}/year={year}/part-0.{format}"
 
 CACHE_DIR = ".cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# "json" keeps one file per key in CACHE_DIR, "sqlite" uses a single indexed
+# database file in CACHE_DIR (existing JSON files are imported on first use)
+CACHE_BACKENDS = ("json", "sqlite")
+CACHE_BACKEND = os.environ.get("F1_CACHE_BACKEND", "json")
+SQLITE_CACHE_FILE = "cache.sqlite3"
+
+# Team details kept from /drivers rows along with the driver's name
+TEAM_FIELDS = ("team_name", "team_colour")
+# Standings columns of teams start with this; driver columns are numbers
+TEAM_COLUMN_PREFIX = "team:"
+# Finishing position results without one (DNF, DSQ) are ranked as
+MISSING_POSITION = 9999
+
+POINTS_TABLE = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
+SPRINT_POINTS_TABLE = [8, 7, 6, 5, 4, 3, 2, 1]
+# Points systems, keyed by the first season they applied in. "race" and
+# "sprint" list the points for 1st, 2nd, ...; "fastest_lap" is a bonus for
+# the driver with the fastest lap of a race, who must finish in the top
+# "fastest_lap_top" (anywhere if not set). Dropped scores (counting only a
+# driver's best results, before 1991) are not modelled.
+SCORING_RULES = {
+    "1950": {"race": [8, 6, 4, 3, 2], "fastest_lap": 1},
+    "1960": {"race": [8, 6, 4, 3, 2, 1]},
+    "1961": {"race": [9, 6, 4, 3, 2, 1]},
+    "1991": {"race": [10, 6, 4, 3, 2, 1]},
+    "2003": {"race": [10, 8, 6, 5, 4, 3, 2, 1]},
+    "2010": {"race": POINTS_TABLE},
+    "2019": {"race": POINTS_TABLE, "fastest_lap": 1, "fastest_lap_top": 10},
+    "2021": {
+        "race": POINTS_TABLE,
+        "sprint": [3, 2, 1],
+        "fastest_lap": 1,
+        "fastest_lap_top": 10,
+    },
+    "2022": {
+        "race": POINTS_TABLE,
+        "sprint": SPRINT_POINTS_TABLE,
+        "fastest_lap": 1,
+        "fastest_lap_top": 10,
+    },
+    "2025": {"race": POINTS_TABLE, "sprint": SPRINT_POINTS_TABLE},
+}
+# Sessions that paid a share of the usual points, by session key, e.g.
+# {9161: 0.5} for a race stopped early with half points
+POINTS_SCALE = {}
+
+# Session type of every points-paying session: OpenF1 files sprints under
+# "Race" too (session_name "Sprint"), so one /sessions request per season
+# returns both
+SCORING_SESSION_TYPE = "Race"
+
+# How long a cached, still-running season is trusted before it is revalidated
+SEASON_CACHE_TTL = int(os.environ.get("F1_SEASON_CACHE_TTL", 6 * 60 * 60))
+
+# Upper bound on concurrent session_result requests when fetching a season
+RACE_RESULTS_MAX_WORKERS = 8
+
+# OpenF1 published limits for unauthenticated use: (requests, per seconds).
+# F1_RATE_LIMITS overrides them as "requests/seconds,...", or "" for no limit
+# (e.g. against the local mock_openf1.py server)
+OPENF1_RATE_LIMITS = tuple(
+    (int(rate), float(per))
+    for rate, per in (
+        limit.split("/")
+        for limit in os.environ.get("F1_RATE_LIMITS", "3/1,30/60").split(",")
+        if limit
+    )
+)
+HTTP_POOL_SIZE = 10
+HTTP_TIMEOUT = 30
+# main.py serve: port, memory cap for cached seasons and charts, and seconds
+# between checks for new races in the current season
+SERVE_PORT = 8000
+SERVE_CACHE_MB = 256
+SERVE_REFRESH_INTERVAL = 15 * 60
+# Status codes worth retrying; other 4xx responses fail immediately
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+_cache_store = None
+_cache_store_lock = threading.Lock()
+
+
+def get_cache_store():
+    global _cache_store
+    path = os.path.join(CACHE_DIR, SQLITE_CACHE_FILE)
+    with _cache_store_lock:
+        if _cache_store is None or _cache_store.path != path:
+            from cache_store import SQLiteCache
+
+            if _cache_store is not None:
+                _cache_store.close()
+            _cache_store = SQLiteCache(path)
+            _cache_store.migrate_json_dir(CACHE_DIR, DRIVER_CACHE_FILE)
+        return _cache_store
+
+
+def close_cache_store():
+    global _cache_store
+    with _cache_store_lock:
+        if _cache_store is not None:
+            _cache_store.close()
+            _cache_store = None
+
+
+_key_locks = {}
+_key_locks_lock = threading.Lock()
+
+
+@contextmanager
+def cache_lock(filename):
+    # Exclusive per-key lock, held across threads (threading.Lock) and across
+    # processes (flock on one of CACHE_LOCK_FILES lock files), e.g. cron plus
+    # a manual run. Keys sharing a lock file just wait for each other.
+    slot = int(hashlib.sha256(filename.encode()).hexdigest(), 16) % CACHE_LOCK_FILES
+    lock_path = os.path.join(CACHE_DIR, CACHE_LOCK_PATTERN.format(slot=slot))
+    with _key_locks_lock:
+        thread_lock = _key_locks.setdefault(lock_path, threading.Lock())
+    with thread_lock:
+        with open(lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def write_json_atomic(path, data):
+    # Write to a temp file in the same directory, then rename over the target,
+    # so readers see either the old or the new file, never a partial one
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".",
+        prefix=f".{os.path.basename(path)}.",
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 
 def load_cache(filename):
-    path = os.path.join(CACHE_DIR, filename)
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f)
-    return None
+    data = None
+    if CACHE_BACKEND == "sqlite":
+        data = get_cache_store().get(filename)
+    else:
+        path = os.path.join(CACHE_DIR, filename)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+    metrics.incr("cache.hits" if data is not None else "cache.misses")
+    return data
+
+
+def load_race_results(session_keys):
+    # {session_key: cached session_result payload} for the cached sessions
+    # among session_keys; one batched query with the sqlite backend
+    if CACHE_BACKEND == "sqlite":
+        rows = get_cache_store().get_race_results(session_keys)
+        found = {key: rows[int(key)] for key in session_keys if int(key) in rows}
+        metrics.incr("cache.hits", len(found))
+        metrics.incr("cache.misses", len(session_keys) - len(found))
+        return found
+    found = {}
+    for session_key in session_keys:
+        data = load_cache(RACE_RESULT_CACHE_PATTERN.format(session_key=session_key))
+        if data is not None:
+            found[session_key] = data
+    return found
 
 
 def save_cache(filename, data):
-    path = os.path.join(CACHE_DIR, filename)
-    with open(path, "w") as f:
-        json.dump(data, f)
+    if CACHE_BACKEND == "sqlite":
+        get_cache_store().set(filename, data)
+        return
+    with cache_lock(filename):
+        write_json_atomic(os.path.join(CACHE_DIR, filename), data)
 
 
-def get_races(year, force_update=False, update_cache=False, max_retries=3):
-    cache_file = SEASON_CACHE_PATTERN.format(year=year)
-    sessions = None
-    existing_sessions = None
+def load_driver_names(keys):
+    # Returns the cached "{driver_number}:{session_key}" -> name entries for keys
+    if CACHE_BACKEND == "sqlite":
+        names = get_cache_store().get_driver_names(keys)
+    else:
+        cache = load_cache(DRIVER_CACHE_FILE) or {}
+        names = {key: cache[key] for key in keys if key in cache}
+    metrics.incr("driver_cache.hits", len(names))
+    metrics.incr("driver_cache.misses", len(keys) - len(names))
+    return names
 
-    if force_update:
-        # Force update: ignore existing cache completely
-        sessions = None
-    elif update_cache:
-        # Update cache: load existing cache and merge with new data
-        existing_sessions = load_cache(cache_file)
-        if existing_sessions:
-            print(
-                f"Found {len(existing_sessions)} races in cache, checking for new races..."
+
+def save_driver_names(names):
+    # Adds names to the driver cache without dropping existing entries. The
+    # read-merge-write runs under the key lock so concurrent runs don't lose
+    # each other's names.
+    if not names:
+        return
+    if CACHE_BACKEND == "sqlite":
+        get_cache_store().set_driver_names(names)
+        return
+    with cache_lock(DRIVER_CACHE_FILE):
+        cache = load_cache(DRIVER_CACHE_FILE) or {}
+        cache.update(names)
+        write_json_atomic(os.path.join(CACHE_DIR, DRIVER_CACHE_FILE), cache)
+
+
+class TokenBucket:
+    def __init__(self, rate, per, tokens=None):
+        # Starts full unless given a number of tokens (below 1 delays the
+        # first request)
+        self.capacity = rate
+        self.tokens = float(rate if tokens is None else tokens)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # Take a token if one is available, else return how long to wait for one
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.fill_rate
             )
-    else:
-        # Normal mode: use cache if available
-        sessions = load_cache(cache_file)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.fill_rate
 
-    if sessions is None or update_cache:
-        url = f"{OPENF1_API_BASE}/sessions?year={year}&session_name=Race"
+    def acquire(self):
+        while True:
+            wait = self.reserve()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+def retry_after_seconds(resp, default):
+    # Retry-After is either a number of seconds or an HTTP date
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not isinstance(value, str):
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class OpenF1Client:
+    # One keep-alive session, one rate limiter and one retry policy shared by
+    # every OpenF1 call, including calls made from worker threads.
+    def __init__(
+        self,
+        base_url=None,
+        rate_limits=OPENF1_RATE_LIMITS,
+        pool_size=HTTP_POOL_SIZE,
+        timeout=HTTP_TIMEOUT,
+    ):
+        self.base_url = base_url
+        # (rate, per) pairs, optionally with the tokens to start with
+        self.buckets = [TokenBucket(*limit) for limit in rate_limits]
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path):
+        return f"{self.base_url or OPENF1_API_BASE}{path}"
+
+    def get(self, path, max_retries=3, headers=None):
+        url = self.url(path)
         for attempt in range(max_retries):
+            for bucket in self.buckets:
+                bucket.acquire()
+            resp = None
+            metrics.incr("http.requests")
+            if attempt:
+                metrics.incr("http.retries")
             try:
-                resp = requests.get(url, timeout=30)
+                start = time.perf_counter()
+                resp = self.session.get(url, timeout=self.timeout, headers=headers)
+                metrics.record_time("http", time.perf_counter() - start)
+                if isinstance(resp.content, bytes):
+                    metrics.incr("http.bytes", len(resp.content))
+                if resp.status_code == 429:
+                    metrics.incr("http.429")
+                    raise requests.exceptions.HTTPError(
+                        f"429 Rate limited for url: {url}", response=resp
+                    )
                 resp.raise_for_status()
-                new_sessions = resp.json()
-
-                if update_cache and existing_sessions:
-                    # Merge new sessions with existing ones
-                    existing_keys = {s.get("session_key") for s in existing_sessions}
-                    new_races = [
-                        s
-                        for s in new_sessions
-                        if s.get("session_key") not in existing_keys
-                    ]
-                    if new_races:
-                        print(f"Found {len(new_races)} new races to add to cache")
-                        sessions = existing_sessions + new_races
-                    else:
-                        print("No new races found")
-                        sessions = existing_sessions
-                else:
-                    sessions = new_sessions
-
-                save_cache(cache_file, sessions)
-                break
+                return resp
             except (
                 requests.exceptions.Timeout,
                 requests.exceptions.ConnectionError,
                 requests.exceptions.HTTPError,
             ) as e:
-                print(f"API request failed (attempt {attempt + 1}/{max_retries}): {e}")
+                status = getattr(e.response, "status_code", None)
+                if status is not None and status not in RETRY_STATUS_CODES:
+                    metrics.incr("http.errors")
+                    raise
+                logger.warning(
+                    "API request failed (attempt %d/%d): %s",
+                    attempt + 1,
+                    max_retries,
+                    e,
+                )
                 if attempt < max_retries - 1:
-                    wait_time = 2**attempt
-                    print(f"Retrying in {wait_time} seconds...")
+                    wait_time = retry_after_seconds(resp, 2**attempt)
+                    logger.info("Retrying in %s seconds...", wait_time)
                     time.sleep(wait_time)
                 else:
-                    print(f"Failed to fetch races after {max_retries} attempts")
-                    if update_cache and existing_sessions:
-                        print("Using existing cached data")
-                        sessions = existing_sessions
-                    else:
-                        raise
+                    metrics.incr("http.errors")
+                    raise
+
+    def get_json(self, path, max_retries=3):
+        return self.get(path, max_retries=max_retries).json()
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = OpenF1Client()
+        return _http_client
+
+
+def season_cache_is_fresh(year, meta, ttl, now=None):
+    if now is None:
+        now = time.time()
+    if meta is None:
+        # Cache written before freshness metadata existed: keep trusting past
+        # seasons as before, revalidate the current one
+        return year < datetime.now().year
+    fetched_at = meta.get("fetched_at", 0)
+    if datetime.fromtimestamp(fetched_at).year > year:
+        # Fetched after the season was over, nothing can change any more
+        return True
+    return now - fetched_at < ttl
+
+
+def sessions_request(year, since=None, meta=None):
+    # Returns (path, headers) for a /sessions request. With since, only
+    # sessions starting after that date are requested. Validators from a
+    # previous fetch of the same URL are sent along.
+    path = f"/sessions?year={year}&session_type={SCORING_SESSION_TYPE}"
+    if since:
+        path += f"&date_start>{quote(since)}"
+    meta = meta or {}
+    headers = {}
+    if meta.get("path") == path:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    return path, headers or None
+
+
+def sessions_response(resp, path, meta=None):
+    # Returns (sessions, meta) for a /sessions reply; a 304 comes back as an
+    # empty list
+    meta = meta or {}
+    new_meta = {"fetched_at": time.time(), "path": path}
+    if resp.status_code == 304:
+        metrics.incr("http.not_modified")
+        new_meta["etag"] = meta.get("etag")
+        new_meta["last_modified"] = meta.get("last_modified")
+        return [], new_meta
+    for header, field in (("ETag", "etag"), ("Last-Modified", "last_modified")):
+        value = resp.headers.get(header)
+        if isinstance(value, str):
+            new_meta[field] = value
+    return resp.json(), new_meta
+
+
+def fetch_sessions(year, since=None, meta=None, max_retries=3):
+    path, headers = sessions_request(year, since, meta)
+    resp = get_http_client().get(path, max_retries=max_retries, headers=headers)
+    return sessions_response(resp, path, meta)
+
+
+def cached_races(year, force_update=False, update_cache=False, ttl=None):
+    # Returns (sessions, existing_sessions, meta): sessions is the cached
+    # season if it can be used as is, else None and the season has to be
+    # (re)fetched, starting after the newest of existing_sessions
+    ttl = SEASON_CACHE_TTL if ttl is None else ttl
+    if force_update:
+        return None, None, None
+    existing_sessions = load_cache(SEASON_CACHE_PATTERN.format(year=year))
+    meta = load_cache(SEASON_META_PATTERN.format(year=year))
+    if existing_sessions is not None and not update_cache:
+        if season_cache_is_fresh(year, meta, ttl):
+            return existing_sessions, existing_sessions, meta
+        logger.info("Season cache is stale, checking for new races...")
+    elif existing_sessions:
+        logger.info(
+            "Found %d races in cache, checking for new races...",
+            len(existing_sessions),
+        )
+    return None, existing_sessions, meta
+
+
+def newest_session_start(sessions):
+    return max(
+        (s["date_start"] for s in sessions or [] if "date_start" in s),
+        default=None,
+    )
+
+
+def merge_races(year, existing_sessions, new_sessions, new_meta):
+    # Adds newly fetched sessions to the cached ones and saves the result
+    sessions = new_sessions
+    if existing_sessions:
+        existing_keys = {s.get("session_key") for s in existing_sessions}
+        new_races = [
+            s for s in new_sessions if s.get("session_key") not in existing_keys
+        ]
+        if new_races:
+            logger.info("Found %d new races to add to cache", len(new_races))
+            sessions = existing_sessions + new_races
+        else:
+            logger.info("No new races found")
+            sessions = existing_sessions
+    save_cache(SEASON_CACHE_PATTERN.format(year=year), sessions)
+    save_cache(SEASON_META_PATTERN.format(year=year), new_meta)
+    return sessions
+
+
+def sorted_races(sessions):
     filtered_sessions = [s for s in sessions if "date_start" in s]
     if len(filtered_sessions) != len(sessions):
-        print(
-            f"Warning: {len(sessions) - len(filtered_sessions)} sessions missing 'date_start' key. Example: {sessions[:2]}"
+        logger.warning(
+            "%d sessions missing 'date_start' key. Example: %s",
+            len(sessions) - len(filtered_sessions),
+            sessions[:2],
         )
-    sessions = sorted(filtered_sessions, key=lambda x: x["date_start"])
-    return sessions
+    return sorted(filtered_sessions, key=lambda x: x["date_start"])
+
+
+def get_races(year, force_update=False, update_cache=False, max_retries=3, ttl=None):
+    # force_update refetches the whole season. Otherwise a cached season is used
+    # as is while fresh (see season_cache_is_fresh); a stale one, or any season
+    # with update_cache, only asks for sessions newer than the newest cached one.
+    sessions, existing_sessions, meta = cached_races(
+        year, force_update, update_cache, ttl
+    )
+    if sessions is None:
+        try:
+            new_sessions, new_meta = fetch_sessions(
+                year,
+                since=newest_session_start(existing_sessions),
+                meta=meta,
+                max_retries=max_retries,
+            )
+        except requests.exceptions.RequestException:
+            logger.warning("Failed to fetch races after %d attempts", max_retries)
+            if not existing_sessions:
+                raise
+            logger.warning("Using existing cached data")
+            sessions = existing_sessions
+        else:
+            sessions = merge_races(year, existing_sessions, new_sessions, new_meta)
+    return sorted_races(sessions)
 
 
 def get_race_results(session_key, max_retries=3):
@@ -110,130 +581,261 @@ def get_race_results(session_key, max_retries=3):
     data = load_cache(cache_file)
     if data is not None:
         return data
-    url = f"{OPENF1_API_BASE}/session_result?session_key={session_key}"
-    for attempt in range(max_retries):
-        try:
-            resp = requests.get(url, timeout=30)
-            resp.raise_for_status()
-            data = resp.json()
-            save_cache(cache_file, data)
-            return data
-        except (
-            requests.exceptions.Timeout,
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError,
-        ) as e:
-            print(
-                f"API request failed for session {session_key} (attempt {attempt + 1}/{max_retries}): {e}"
+    try:
+        data = get_http_client().get_json(
+            f"/session_result?session_key={session_key}", max_retries=max_retries
+        )
+    except requests.exceptions.RequestException:
+        logger.warning(
+            "Failed to fetch race results for session %s after %d attempts",
+            session_key,
+            max_retries,
+        )
+        return []  # Return empty list instead of raising exception
+    save_cache(cache_file, data)
+    return data
+
+
+class RaceResult(NamedTuple):
+    # Compact projection of a session_result row: only the fields the standings
+    # use, so the full API payload doesn't have to stay in memory. A tuple, so
+    # it pickles cheaply to and from worker processes.
+    driver_number: object
+    position: object
+    points: object
+
+    @classmethod
+    def from_api(cls, row):
+        return cls(row.get("driver_number"), row.get("position"), row.get("points"))
+
+    def get(self, name, default=None):
+        # dict-style access so code written for raw result rows keeps working;
+        # only the fields, not tuple methods such as count and index
+        value = getattr(self, name) if name in self._fields else None
+        return default if value is None else value
+
+
+def project_results(data):
+    return [RaceResult.from_api(row) for row in data or []]
+
+
+class ResultColumns:
+    # One session's results as parallel numpy arrays instead of records, e.g.
+    # views of a memory-mapped Arrow export (see columnar.read_season):
+    # integer driver numbers and positions (MISSING_POSITION when there is
+    # none) and float points (NaN when unknown). points_matrices reads the
+    # arrays directly; iterating yields RaceResult records for code that
+    # works row by row.
+    __slots__ = ("driver_number", "position", "points")
+
+    def __init__(self, driver_number, position, points):
+        self.driver_number = driver_number
+        self.position = position
+        self.points = points
+
+    def __len__(self):
+        return len(self.driver_number)
+
+    def __iter__(self):
+        for driver_number, position, points in zip(
+            self.driver_number.tolist(), self.position.tolist(), self.points.tolist()
+        ):
+            yield RaceResult(
+                driver_number,
+                None if position == MISSING_POSITION else position,
+                None if points != points else points,
             )
-            if attempt < max_retries - 1:
-                wait_time = 2**attempt
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                print(
-                    f"Failed to fetch race results for session {session_key} after {max_retries} attempts"
-                )
-                return []  # Return empty list instead of raising exception
 
 
-def get_driver_map(driver_session_pairs, max_retries=5):
-    cache = load_cache(DRIVER_CACHE_FILE) or {}
+def get_race_results_many(
+    session_keys, max_workers=RACE_RESULTS_MAX_WORKERS, max_retries=3, project=False
+):
+    # Fetch results for several sessions at once. Cached sessions are served
+    # straight from disk; only the misses go to the thread pool so a cold season
+    # costs roughly one (the slowest) round trip instead of one per race.
+    # With project=True each payload is reduced to RaceResult records as soon
+    # as it is loaded, and the raw rows are dropped.
+    transform = project_results if project else (lambda data: data)
+    session_keys = list(dict.fromkeys(session_keys))
+    cached = load_race_results(session_keys)
+    results = {key: transform(cached[key]) for key in session_keys if key in cached}
+    missing = [key for key in session_keys if key not in cached]
+    if missing:
+        workers = max(1, min(max_workers, len(missing)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetched = executor.map(
+                lambda key: transform(get_race_results(key, max_retries=max_retries)),
+                missing,
+            )
+            for session_key, data in zip(missing, fetched):
+                results[session_key] = data
+    return {key: results[key] for key in session_keys}
+
+
+def fetch_drivers(path, max_retries=5):
+    # Returns the decoded /drivers payload, or None if every attempt failed
+    try:
+        return get_http_client().get_json(path, max_retries=max_retries)
+    except requests.exceptions.RequestException:
+        logger.warning(
+            "- Failed after %d attempts, using driver number as fallback", max_retries
+        )
+        return None
+
+
+def driver_display_name(driver, driver_number):
+    return driver.get("full_name") or driver.get("broadcast_name") or str(driver_number)
+
+
+def driver_cache_entry(driver, driver_number):
+    # Driver cache value for a /drivers row: a dict with the display name and
+    # whichever TEAM_FIELDS the row has
+    name = driver_display_name(driver, driver_number)
+    team = {field: driver[field] for field in TEAM_FIELDS if driver.get(field)}
+    return dict(name=name, **team)
+
+
+def driver_info(entry):
+    # Driver cache value as a dict; caches from before teams were kept hold
+    # plain names
+    return {"name": entry} if isinstance(entry, str) else entry
+
+
+def driver_cached(entry, teams=False):
+    # Whether a driver cache entry answers the lookup: plain names predate
+    # team data, so they are looked up again when teams are wanted
+    return entry is not None and not (teams and isinstance(entry, str))
+
+
+def driver_fallback(entry, driver_number):
+    # Cache entry for a driver the API didn't return: the name from the
+    # previous entry, if any, else the number
+    return {"name": driver_info(entry)["name"] if entry else str(driver_number)}
+
+
+def session_driver_names(data, session_key, driver_numbers, known=None):
+    # Cache entries for one /drivers?session_key= reply. Drivers absent from
+    # it (or all of them, if the request failed) keep their name from known,
+    # the previous cache entries, or else fall back to their number.
+    names = {}
+    for d in data or []:
+        driver_number = d.get("driver_number")
+        if driver_number is not None:
+            names[f"{driver_number}:{session_key}"] = driver_cache_entry(
+                d, driver_number
+            )
+    for driver_number in driver_numbers:
+        key = f"{driver_number}:{session_key}"
+        if key not in names:
+            names[key] = driver_fallback((known or {}).get(key), driver_number)
+    return names
+
+
+def get_driver_map(driver_session_pairs, max_retries=5, by_session=False, teams=False):
+    # With by_session=True, one /drivers?session_key=X request fills every
+    # driver of that session instead of one request per (driver, session) pair.
+    # Cache keys are "{driver_number}:{session_key}" in both modes. Values are
+    # names, or with teams=True driver_info dicts that also carry the team;
+    # cached names without team data are looked up again for those.
+    driver_session_pairs = list(driver_session_pairs)
+    cache = load_driver_names(
+        {
+            f"{driver_number}:{session_key}"
+            for driver_number, session_key in driver_session_pairs
+        }
+    )
+    new_names = {}
     driver_map = {}
-    updated = False
+    if by_session:
+        missing = {}
+        for driver_number, session_key in driver_session_pairs:
+            if not driver_cached(cache.get(f"{driver_number}:{session_key}"), teams):
+                missing.setdefault(session_key, set()).add(driver_number)
+        for session_key, driver_numbers in missing.items():
+            path = f"/drivers?session_key={session_key}"
+            logger.info(
+                "Getting %d drivers in session %s", len(driver_numbers), session_key
+            )
+            data = fetch_drivers(path, max_retries)
+            new_names.update(
+                session_driver_names(data, session_key, driver_numbers, cache)
+            )
+        cache.update(new_names)
     for driver_number, session_key in driver_session_pairs:
         key = f"{driver_number}:{session_key}"
-        if key in cache:
+        if driver_cached(cache.get(key), teams):
             name = cache[key]
         else:
-            url = f"{OPENF1_API_BASE}/drivers?driver_number={driver_number}&session_key={session_key}"
-            print(f"Getting driver {driver_number} in session {session_key}")
-            success = False
-            for attempt in range(max_retries):
-                try:
-                    resp = requests.get(url, timeout=30)
-                    if resp.status_code == 429:
-                        wait = 2**attempt
-                        print(
-                            f"- Rate limited (429). Waiting {wait}s before retrying..."
-                        )
-                        time.sleep(wait)
-                        continue
-                    resp.raise_for_status()
-                    success = True
-                    break
-                except (
-                    requests.exceptions.Timeout,
-                    requests.exceptions.ConnectionError,
-                    requests.exceptions.HTTPError,
-                ) as e:
-                    print(f"- Request error (attempt {attempt + 1}/{max_retries}): {e}")
-                    if attempt < max_retries - 1:
-                        wait_time = 2**attempt
-                        print(f"- Retrying in {wait_time} seconds...")
-                        time.sleep(wait_time)
-                    else:
-                        print(
-                            f"- Failed after {max_retries} attempts, using driver number as fallback"
-                        )
-
-            if success:
-                data = resp.json()
-                if data:
-                    d = data[0]
-                    name = (
-                        d.get("full_name")
-                        or d.get("broadcast_name")
-                        or str(driver_number)
-                    )
-                else:
-                    name = str(driver_number)
+            path = f"/drivers?driver_number={driver_number}&session_key={session_key}"
+            logger.info("Getting driver %s in session %s", driver_number, session_key)
+            data = fetch_drivers(path, max_retries)
+            if data:
+                name = driver_cache_entry(data[0], driver_number)
             else:
-                # Fallback when all attempts failed
-                name = str(driver_number)
+                # Fallback when no data or all attempts failed
+                name = driver_fallback(cache.get(key), driver_number)
 
             cache[key] = name
-            updated = True
-        driver_map[(str(driver_number), str(session_key))] = name
-    if updated:
-        save_cache(DRIVER_CACHE_FILE, cache)
+            new_names[key] = name
+        info = driver_info(name)
+        driver_map[(str(driver_number), str(session_key))] = (
+            info if teams else info["name"]
+        )
+    save_driver_names(new_names)
     return driver_map
 
 
+# Manual overrides for non-standard codes, applied on top of the ISO 3166
+# alpha-3 table in country_flags.py
+MANUAL_COUNTRY_CODES = {
+    "KSA": "SA",  # Saudi Arabia
+    "MON": "MC",  # Monaco
+    "UAE": "AE",  # United Arab Emirates
+    "RUS": "RU",  # Russia (sometimes used as non-standard)
+    "KOR": "KR",  # South Korea
+    "USA": "US",  # United States
+    "GBR": "GB",  # United Kingdom
+    "GER": "DE",  # Germany
+    "NED": "NL",  # Netherlands
+    "SUI": "CH",  # Switzerland
+    # Add more as needed
+}
+
+_flag_table = None
+
+
+def alpha2_to_flag(code):
+    return "".join(chr(0x1F1E6 + ord(c) - ord("A")) for c in code)
+
+
+def flag_table():
+    # 3-letter code -> flag emoji, built once from the generated ISO table plus
+    # the manual overrides
+    global _flag_table
+    if _flag_table is None:
+        from country_flags import ALPHA3_TO_ALPHA2
+
+        codes = {**ALPHA3_TO_ALPHA2, **MANUAL_COUNTRY_CODES}
+        _flag_table = {code: alpha2_to_flag(alpha2) for code, alpha2 in codes.items()}
+    return _flag_table
+
+
+def flag_table_info():
+    table = flag_table()
+    size = sys.getsizeof(table) + sum(
+        sys.getsizeof(code) + sys.getsizeof(flag) for code, flag in table.items()
+    )
+    return {"entries": len(table), "bytes": size}
+
+
 # Helper to get flag emoji from country code
 def country_code_to_flag(code):
     if not code:
         return ""
     code = code.upper()
-    # Manual overrides for non-standard codes
-    manual_map = {
-        "KSA": "SA",  # Saudi Arabia
-        "MON": "MC",  # Monaco
-        "UAE": "AE",  # United Arab Emirates
-        "RUS": "RU",  # Russia (sometimes used as non-standard)
-        "KOR": "KR",  # South Korea
-        "USA": "US",  # United States
-        "GBR": "GB",  # United Kingdom
-        "GER": "DE",  # Germany
-        "NED": "NL",  # Netherlands
-        "SUI": "CH",  # Switzerland
-        # Add more as needed
-    }
-    if code in manual_map:
-        code = manual_map[code]
     if len(code) == 2 and code.isalpha():
-        return "".join(chr(0x1F1E6 + ord(c) - ord("A")) for c in code)
-    # Try to convert 3-letter code to 2-letter code
-    if len(code) == 3 and code.isalpha():
-        try:
-            country = pycountry.countries.get(alpha_3=code)
-            if country and hasattr(country, "alpha_2"):
-                code2 = country.alpha_2
-                return "".join(chr(0x1F1E6 + ord(c) - ord("A")) for c in code2)
-        except Exception as e:
-            print(e)
-            pass
-    return ""
+        return alpha2_to_flag(code)
+    return flag_table().get(code, "")
 
 
 def season_to_chart(cli_year=None):
@@ -244,58 +846,462 @@ def season_to_chart(cli_year=None):
 
 
 def calculate_standings(races, driver_map):
-    driver_points = {}
-    standings_progression = []
-    for race in races:
-        print(f"Fetching results for race: {race}")  # Debug: print race info
-        results = get_race_results(race["session_key"])
-        print(f"Results: {results}")  # Debug: print race results
-        # Sort by finishing position, treating None as a large number
-        results = sorted(
-            results,
-            key=lambda x: x["position"] if isinstance(x.get("position"), int) else 9999,
-        )
+    # Older entry point, kept for scripts that call it: scores races with the
+    # same single pipeline as main() (each result set fetched once, points by
+    # finishing position under each race's season's SCORING_RULES) and
+    # returns per-race snapshots of points by driver name. Like score_season,
+    # a sprint weekend is one race, standing after its last session.
+    results_by_session = get_race_results_many(
+        (race["session_key"] for race in races), project=True
+    )
+    all_race_results = [
+        (race, results_by_session[race["session_key"]]) for race in races
+    ]
+    rows = meeting_rows(races)
+    progression = []
+    if all_race_results:
+        drivers, matrix = points_matrix(all_race_results)
+        names = [driver_map.get(d, d) for d in drivers]
+        progression = named_progression(names, matrix.cumsum(axis=0)[rows].tolist())
+    logger.debug("%d drivers scored", len(progression[-1]) if progression else 0)
+    return (
+        progression,
+        [race_base_name(races[i]) for i in rows],
+        list(progression[-1]) if progression else [],
+    )
+
+
+def named_progression(names, rows):
+    # Cumulative points rows as {name: points} dicts, adding up drivers that
+    # share a name
+    progression = []
+    for row in rows:
+        points = {}
+        for name, total in zip(names, row):
+            points[name] = points.get(name, 0) + total
+        progression.append(points)
+    return progression
+
+
+def race_base_name(r):
+    return (
+        r.get("meeting_name")
+        or r.get("location")
+        or r.get("circuit_short_name")
+        or r.get("date_start", "Unknown")
+    )
+
+
+def race_display_name(r):
+    # Try to get country code for flag
+    country_code = r.get("country_code") or r.get("country_alpha2")
+    flag = country_code_to_flag(country_code) if country_code else ""
+    base = race_base_name(r)
+    return f"{flag} {base}" if flag else f"{country_code}: {base}"
+
+
+def scoring_rules(season):
+    # Name of the SCORING_RULES entry in force in season
+    names = sorted(SCORING_RULES, key=int)
+    return next((name for name in reversed(names) if int(name) <= season), names[0])
+
+
+def race_season(race, default=None):
+    season = race.get("year") or str(race.get("date_start", ""))[:4]
+    try:
+        return int(season)
+    except ValueError:
+        return default or datetime.now().year
+
+
+# Session kinds scored by position, in the order of rule_tables' second axis
+RANKED = ("race", "sprint")
+
+
+def rule_tables(rule_sets):
+    # Stacks rule dicts into lookup arrays: points[rule, is_sprint, rank]
+    # (ranks past the end of a table score 0), and the fastest lap bonus and
+    # top-N cut-off per rule
+    import numpy as np
+
+    width = max(
+        (len(rules.get(kind, [])) for rules in rule_sets for kind in RANKED), default=0
+    )
+    points = np.zeros((len(rule_sets), len(RANKED), width + 1))
+    for i, rules in enumerate(rule_sets):
+        for j, kind in enumerate(RANKED):
+            table = rules.get(kind, [])
+            points[i, j, : len(table)] = table
+    bonus = np.array([rules.get("fastest_lap", 0) for rules in rule_sets], float)
+    top = np.array(
+        [rules.get("fastest_lap_top") or width + 1 for rules in rule_sets], np.int64
+    )
+    return points, bonus, top
+
+
+def points_matrix(all_race_results, rules=None, drivers=None, season=None, teams=None):
+    # Scores every race in one pass and returns (drivers, matrix) where
+    # matrix[race, driver] is the points scored in that race. drivers lists
+    # driver numbers (as strings) in order of first appearance, starting with
+    # the given drivers. rules is a SCORING_RULES name or a rules dict; by
+    # default each race is scored under the rules of its own season (season
+    # for races that don't say). With teams ({(driver_number, session_key):
+    # {"team_name": ...}}, as from load_season), every result also counts
+    # for its team, in a TEAM_COLUMN_PREFIX column added in the same pass.
+    drivers, matrices = points_matrices(
+        all_race_results, [rules], drivers, season, teams
+    )
+    return drivers, matrices[0]
+
+
+def result_rows(all_race_results, drivers):
+    # (race_idx, driver_idx, positions, reported points) arrays with one entry
+    # per result record. drivers is extended with the new driver numbers (as
+    # strings) in order of first appearance.
+    import numpy as np
+
+    index = {driver: i for i, driver in enumerate(drivers)}
+    race_idx = []
+    driver_idx = []
+    positions = []
+    reported = []
+    for r, (race, results) in enumerate(all_race_results):
         for result in results:
-            driver_num = result.get("driver_number", "Unknown")
-            name = driver_map.get(str(driver_num), str(driver_num))  # Use map
-            driver_points.setdefault(name, 0)
-            # Use API-provided points if available, else fallback to 0
-            points = result.get("points", 0)
-            driver_points[name] += points
-        # Save a snapshot after this race
-        standings_progression.append(driver_points.copy())
-
-    def get_race_name(r):
-        return (
-            r.get("meeting_name")
-            or r.get("location")
-            or r.get("circuit_short_name")
-            or r.get("date_start", "Unknown")
-        )
+            driver = str(result.get("driver_number", "Unknown"))
+            if driver not in index:
+                index[driver] = len(drivers)
+                drivers.append(driver)
+            position = result.get("position")
+            points = result.get("points")
+            race_idx.append(r)
+            driver_idx.append(index[driver])
+            positions.append(
+                position if isinstance(position, int) else MISSING_POSITION
+            )
+            reported.append(points if isinstance(points, (int, float)) else np.nan)
+    return (
+        np.asarray(race_idx, dtype=np.int64),
+        np.asarray(driver_idx, dtype=np.int64),
+        np.asarray(positions, dtype=np.int64),
+        np.asarray(reported, dtype=float),
+    )
+
+
+def result_arrays(all_race_results, drivers):
+    # result_rows for ResultColumns sessions, straight from their arrays: the
+    # only per-value Python work is naming each distinct driver number
+    import numpy as np
 
-    print(f"Driver names: {list(driver_points.keys())}")  # Debug: print driver names
+    lengths = [len(results) for _, results in all_race_results]
+    race_idx = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    numbers = np.concatenate(
+        [results.driver_number for _, results in all_race_results] or [[]]
+    ).astype(np.int64)
+    unique, first, inverse = np.unique(numbers, return_index=True, return_inverse=True)
+    index = {driver: i for i, driver in enumerate(drivers)}
+    for number in unique[np.argsort(first)].tolist():
+        if str(number) not in index:
+            index[str(number)] = len(drivers)
+            drivers.append(str(number))
+    columns = np.array([index[str(n)] for n in unique.tolist()], dtype=np.int64)
     return (
-        standings_progression,
-        [get_race_name(r) for r in races],
-        list(driver_points.keys()),
+        race_idx,
+        columns[inverse.reshape(-1)],
+        np.concatenate(
+            [results.position for _, results in all_race_results] or [[]]
+        ).astype(np.int64),
+        np.concatenate(
+            [results.points for _, results in all_race_results] or [[]]
+        ).astype(float),
+    )
+
+
+def team_cells(all_race_results, drivers, driver_idx, teams):
+    # (rows, columns): the results that also count for a team (as indices
+    # into driver_idx) and their team's column, added to drivers as needed
+    import numpy as np
+
+    rows = []
+    columns = []
+    if teams:
+        index = {driver: i for i, driver in enumerate(drivers)}
+        names = [drivers[i] for i in driver_idx.tolist()]
+        row = 0
+        for race, results in all_race_results:
+            session_key = str(race.get("session_key"))
+            for i in range(row, row + len(results)):
+                team = teams.get((names[i], session_key))
+                if team:
+                    column = TEAM_COLUMN_PREFIX + team["team_name"]
+                    if column not in index:
+                        index[column] = len(drivers)
+                        drivers.append(column)
+                    rows.append(i)
+                    columns.append(index[column])
+            row += len(results)
+    return np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)
+
+
+def points_matrices(all_race_results, rule_sets, drivers=None, season=None, teams=None):
+    # points_matrix under several rule sets at once, as a (rule sets, races,
+    # drivers) array: results are ranked once and each rule set is one lookup
+    # over the same position arrays. Points are awarded by finishing order,
+    # with a missing position sorting last and ties keeping the API order.
+    # Sprints (session_name "Sprint") use the sprint table, POINTS_SCALE
+    # scales whole sessions, and the fastest lap bonus goes to whoever the API
+    # points show got it in the race's own season (so seasons without the
+    # bonus can't award it under other rules).
+    import numpy as np
+
+    drivers = list(drivers or [])
+    if all(isinstance(results, ResultColumns) for _, results in all_race_results):
+        columns = result_arrays(all_race_results, drivers)
+    else:
+        columns = result_rows(all_race_results, drivers)
+    race_idx, driver_idx, positions, reported = columns
+    team_rows, team_idx = team_cells(all_race_results, drivers, driver_idx, teams)
+    cells = (
+        np.concatenate([race_idx, race_idx[team_rows]]),
+        np.concatenate([driver_idx, team_idx]),
+    )
+    order = np.lexsort((positions, race_idx))
+    sorted_races = race_idx[order]
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(len(order)) - np.searchsorted(sorted_races, sorted_races)
+
+    # Every rule set involved gets a row in the lookup tables: the races' own
+    # seasons' rules first, then the requested ones
+    catalog = []
+
+    def rule_index(rules):
+        if isinstance(rules, str):
+            rules = SCORING_RULES[rules]
+        if rules not in catalog:
+            catalog.append(rules)
+        return catalog.index(rules)
+
+    own = np.array(
+        [
+            rule_index(scoring_rules(race_season(race, season)))
+            for race, _ in all_race_results
+        ],
+        dtype=np.int64,
     )
+    per_race = [
+        own if rules is None else np.full(len(own), rule_index(rules))
+        for rules in rule_sets
+    ]
+    tables, bonus, top = rule_tables(catalog)
+    sessions = [race.get("session_key") for race, _ in all_race_results]
+    scale = np.array([POINTS_SCALE.get(key, 1) for key in sessions], float)[race_idx]
+    sprint = np.array(
+        [race.get("session_name") == "Sprint" for race, _ in all_race_results],
+        dtype=np.int64,
+    )[race_idx]
+    ranks = np.minimum(ranks, tables.shape[2] - 1)
+
+    own = own[race_idx]
+    extra = reported - tables[own, sprint, ranks] * scale
+    fastest = (sprint == 0) & (bonus[own] > 0) & np.isclose(extra, bonus[own])
+
+    integral = all(float(v).is_integer() for v in [*tables.flat, *bonus, *scale])
+    matrices = np.zeros(
+        (len(rule_sets), len(all_race_results), len(drivers)),
+        dtype=np.int64 if integral else float,
+    )
+    for matrix, rule in zip(matrices, per_race):
+        rule = rule[race_idx]
+        points = tables[rule, sprint, ranks]
+        points += np.where(fastest & (ranks < top[rule]), bonus[rule], 0)
+        points = (points * scale).astype(matrix.dtype)
+        np.add.at(matrix, cells, np.concatenate([points, points[team_rows]]))
+    return drivers, matrices
+
+
+def snapshot_matrix(snapshot):
+    # Cumulative standings as a (races, drivers) array. Rows stored before a
+    # driver first scored are shorter and padded with zeros.
+    import numpy as np
+
+    progression = snapshot["progression"]
+    matrix = np.zeros(
+        (len(progression), len(snapshot["drivers"])),
+        dtype=np.asarray(progression[-1] if progression else []).dtype,
+    )
+    for i, row in enumerate(snapshot["progression"]):
+        matrix[i, : len(row)] = row
+    return matrix
+
+
+def update_standings_snapshot(
+    snapshot, all_race_results, rules, season=None, teams=None
+):
+    # A snapshot holds the cumulative points after each race, keyed by driver
+    # number: "drivers" lists numbers in order of first appearance (and team
+    # columns, see points_matrix) and each "progression" row has one total per
+    # column. If the snapshot covers a prefix of all_race_results under the
+    # same rules and team line-ups, only the remaining races are scored and
+    # added onto its last row; otherwise the season is computed from scratch.
+    import numpy as np
+
+    session_keys = [race["session_key"] for race, _ in all_race_results]
+    scales = [POINTS_SCALE.get(key, 1) for key in session_keys]
+    line_ups = {}
+    for (driver, session_key), team in (teams or {}).items():
+        line_ups.setdefault(session_key, {})[driver] = team["team_name"]
+    line_ups = [line_ups.get(str(key), {}) for key in session_keys]
+    done = len(snapshot["session_keys"]) if snapshot else 0
+    if (
+        not snapshot
+        or snapshot.get("rules") != rules
+        or snapshot["session_keys"] != session_keys[:done]
+        or snapshot["scales"] != scales[:done]
+        or snapshot.get("teams") != line_ups[:done]
+    ):
+        snapshot = {
+            "session_keys": [],
+            "scales": [],
+            "teams": [],
+            "rules": rules,
+            "drivers": [],
+            "progression": [],
+        }
+        done = 0
+    drivers, deltas = points_matrix(
+        all_race_results[done:],
+        rules,
+        drivers=snapshot["drivers"],
+        season=season,
+        teams=teams,
+    )
+    last = np.zeros(len(drivers), dtype=deltas.dtype)
+    if snapshot["progression"]:
+        # Carries the previous rows' dtype over: a season that picked up
+        # fractional points stays float
+        previous = np.asarray(snapshot["progression"][-1])
+        last = last.astype(np.result_type(deltas, previous))
+        last[: len(previous)] = previous
+    cumulative = np.cumsum(deltas, axis=0) + last
+    return {
+        "session_keys": session_keys,
+        "scales": scales,
+        "teams": line_ups,
+        "rules": rules,
+        "drivers": drivers,
+        "progression": snapshot["progression"] + cumulative.tolist(),
+    }
+
+
+def season_standings(year, all_race_results, use_snapshot=True, teams=None):
+    # Standings are persisted per season, so a refresh that only adds races
+    # costs as much as the new races, not the whole season
+    cache_file = STANDINGS_CACHE_PATTERN.format(year=year)
+    previous = load_cache(cache_file) if use_snapshot else None
+    snapshot = update_standings_snapshot(
+        previous,
+        all_race_results,
+        SCORING_RULES[scoring_rules(year)],
+        season=year,
+        teams=teams,
+    )
+    if snapshot != previous:
+        save_cache(cache_file, snapshot)
+    return snapshot
+
+
+def standings_dataframe(race_names, driver_names, cumulative):
+    # Long-format (Race, Driver, Points) frame ready for plot_standings_dataframe,
+    # built from a (races, drivers) cumulative points matrix. Drivers sharing a
+    # name are merged and the legend order follows the final standings.
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame(np.asarray(cumulative), columns=driver_names)
+    if df.columns.has_duplicates:
+        df = df.T.groupby(level=0, sort=False).sum().T
+    if len(df):
+        df = df[df.iloc[-1].sort_values(ascending=False, kind="stable").index]
+    df.insert(0, "Race", race_names)
+    return df.melt(id_vars=["Race"], var_name="Driver", value_name="Points")
 
 
 def plot_standings(standings_progression, race_names, driver_names):
+    import pandas as pd
+
     df = pd.DataFrame(standings_progression, columns=driver_names)
     df = df.ffill().fillna(0)
     df["Race"] = race_names
     df_melted = df.melt(id_vars=["Race"], var_name="Driver", value_name="Points")
+    plot_standings_dataframe(df_melted)
+
+
+def is_image_output(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def chart_output_path(path, mode):
+    if mode == "json" and not is_image_output(path):
+        return os.path.splitext(path)[0] + ".json"
+    return path
+
+
+def write_chart(fig, output, mode="inline"):
+    # Writes fig to output according to mode (see OUTPUT_MODES); the shared
+    # plotly.js bundle and viewer page are only written once per directory
+    directory = os.path.dirname(output) or "."
+    os.makedirs(directory, exist_ok=True)
+    if is_image_output(output):
+        fig.write_image(output)
+    elif mode == "json":
+        from plotly.offline import get_plotlyjs
+
+        with open(output, "w") as f:
+            f.write(fig.to_json())
+        for filename, content in (
+            (PLOTLY_JS_FILE, get_plotlyjs),
+            (VIEWER_FILE, lambda: VIEWER_HTML),
+        ):
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                with open(path, "w") as f:
+                    f.write(content())
+    elif mode in ("directory", "cdn"):
+        fig.write_html(output, include_plotlyjs=mode)
+    else:
+        fig.write_html(output)
+
+
+def standings_figure(df_melted, title="F1 Driver Standings Progression", colors=None):
+    # colors maps driver names to line colours (their team's); other drivers
+    # get the default palette
+    import plotly.express as px
+
     fig = px.line(
         df_melted,
         x="Race",
         y="Points",
         color="Driver",
         markers=True,
-        title="F1 Driver Standings Progression",
+        title=title,
         labels={"Points": "Points", "Race": "Race"},
         color_discrete_sequence=px.colors.qualitative.Dark24,
+        color_discrete_map=colors or {},
     )
+    dash_teammates(fig.data)
+    return style_figure(fig)
+
+
+def dash_teammates(traces):
+    # Teammates share a colour: every line after the first in a colour is
+    # dashed so they can be told apart
+    seen = set()
+    for trace in traces:
+        if trace.line.color in seen:
+            trace.line.dash = "dash"
+        seen.add(trace.line.color)
+
+
+def style_figure(fig):
     fig.update_layout(
         legend_title_text="Driver",
         legend=dict(orientation="v", yanchor="top", y=1, xanchor="left", x=1.01),
@@ -308,112 +1314,1055 @@ def plot_standings(standings_progression, race_names, driver_names):
     )
     fig.update_xaxes(showgrid=False)
     fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor="#e5e5ef")
-    fig.write_html("f1_standings.html")
+    return fig
 
 
-def main():
-    parser = argparse.ArgumentParser(description="F1 Standings Chart Generator")
-    parser.add_argument(
-        "--year", type=int, help="Year of the F1 season to chart (e.g. 2024)"
-    )
-    parser.add_argument(
-        "--force-update", action="store_true", help="Force update season cache from API"
-    )
-    parser.add_argument(
-        "--update-cache",
-        action="store_true",
-        help="Add new races to cache without replacing existing ones",
+def use_large_chart(season, setting=None):
+    setting = setting or LARGE_CHART
+    if setting == "auto":
+        return season["cumulative"].size > LARGE_CHART_CELLS
+    return setting == "on"
+
+
+def merge_duplicate_drivers(driver_names, cumulative):
+    # Adds up the columns of drivers sharing a name, keeping first-seen order
+    import numpy as np
+
+    names = list(dict.fromkeys(driver_names))
+    if len(names) == len(driver_names):
+        return names, np.asarray(cumulative)
+    index = {name: i for i, name in enumerate(names)}
+    merged = np.zeros((len(cumulative), len(names)), dtype=np.asarray(cumulative).dtype)
+    np.add.at(
+        merged.T, [index[name] for name in driver_names], np.asarray(cumulative).T
     )
-    args = parser.parse_args()
-    year = season_to_chart(args.year)
-    print(f"Fetching F1 {year} season data...")
-    races = get_races(
-        year, force_update=args.force_update, update_cache=args.update_cache
+    return names, merged
+
+
+def thin_indices(count, max_points):
+    # Evenly spread row indices, always keeping the first and last
+    import numpy as np
+
+    if count <= max_points:
+        return np.arange(count)
+    return np.unique(np.linspace(0, count - 1, max_points).round().astype(int))
+
+
+def large_standings_figure(
+    race_names,
+    driver_names,
+    cumulative,
+    title="F1 Driver Standings Progression",
+    colors=None,
+    top_drivers=LARGE_CHART_TOP_DRIVERS,
+    max_points=LARGE_CHART_MAX_POINTS,
+    max_markers=LARGE_CHART_MAX_MARKERS,
+):
+    # Same chart as standings_figure for seasons too big for SVG: one WebGL
+    # trace per top driver, the long tail as a single band, and at most
+    # max_points races per trace
+    import numpy as np
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    names, cumulative = merge_duplicate_drivers(driver_names, cumulative)
+    rows = thin_indices(len(race_names), max_points)
+    x = [race_names[i] for i in rows]
+    values = cumulative[rows]
+    order = (
+        np.argsort(-cumulative[-1], kind="stable")
+        if len(cumulative)
+        else np.arange(len(names))
     )
-    if not races:
-        print("No races found for this season.")
+    shown, tail = order[:top_drivers], order[top_drivers:]
+    mode = "lines+markers" if len(rows) <= max_markers else "lines"
+    palette = px.colors.qualitative.Dark24
+    colors = colors or {}
+    fig = go.Figure()
+    for i, column in enumerate(shown):
+        fig.add_trace(
+            go.Scattergl(
+                x=x,
+                y=values[:, column],
+                name=names[column],
+                mode=mode,
+                line=dict(color=colors.get(names[column], palette[i % len(palette)])),
+                hovertemplate="%{fullData.name}<br>%{x}: %{y}<extra></extra>",
+            )
+        )
+    dash_teammates(fig.data)
+    if len(tail):
+        band = f"Other {len(tail)} drivers"
+        # Upper edge first, then the lower edge filled up to it
+        for bound, fill, label in (
+            (values[:, tail].max(axis=1), None, "up to"),
+            (values[:, tail].min(axis=1), "tonexty", "from"),
+        ):
+            fig.add_trace(
+                go.Scattergl(
+                    x=x,
+                    y=bound,
+                    name=band,
+                    legendgroup=band,
+                    showlegend=fill is not None,
+                    mode="lines",
+                    fill=fill,
+                    line=dict(color="rgba(150, 150, 150, 0.6)", width=1),
+                    fillcolor="rgba(150, 150, 150, 0.25)",
+                    hovertemplate=f"{band}<br>%{{x}}: {label} %{{y}}<extra></extra>",
+                )
+            )
+    fig.update_layout(title=title, xaxis_title="Race", yaxis_title="Points")
+    return style_figure(fig)
+
+
+def season_figure(season, title="F1 Driver Standings Progression"):
+    if use_large_chart(season):
+        return large_standings_figure(
+            season["race_names"],
+            season["driver_names"],
+            season["cumulative"],
+            title,
+            colors=season.get("colors"),
+        )
+    return standings_figure(season_dataframe(season), title, season.get("colors"))
+
+
+def plot_season(season, output=CHART_OUTPUT, title=None, mode="inline"):
+    # Charts a season dict (see score_season), switching to the large-data
+    # figure for very big seasons
+    title = title or "F1 Driver Standings Progression"
+    if not use_large_chart(season):
+        plot_standings_dataframe(
+            season_dataframe(season),
+            output=output,
+            title=title,
+            mode=mode,
+            colors=season.get("colors"),
+        )
         return
-    # Gather all (driver_number, session_key) pairs from all race results
-    driver_session_pairs = set()
+    with metrics.stage("render", output=output):
+        fig = season_figure(season, title)
+        write_chart(fig, chart_output_path(output, mode), mode)
+
+
+def plot_standings_dataframe(
+    df_melted,
+    output=CHART_OUTPUT,
+    title="F1 Driver Standings Progression",
+    mode="inline",
+    colors=None,
+):
+    with metrics.stage("render", output=output):
+        fig = standings_figure(df_melted, title, colors)
+        write_chart(fig, chart_output_path(output, mode), mode)
+
+
+def meeting_of(race):
+    # Sessions of the same race weekend share a meeting_key
+    return race.get("meeting_key") or ("session", race["session_key"])
+
+
+def driver_sessions(races):
+    # {session_key: session whose /drivers reply names its drivers}: the last
+    # session of each meeting, so a sprint weekend costs one lookup
+    last = {}
+    for race in races:
+        last[meeting_of(race)] = race["session_key"]
+    return {race["session_key"]: last[meeting_of(race)] for race in races}
+
+
+def meeting_rows(races):
+    # Index of the last session of each meeting, in order
+    return [
+        i
+        for i, race in enumerate(races)
+        if i + 1 == len(races) or meeting_of(races[i + 1]) != meeting_of(race)
+    ]
+
+
+def season_results(races, results_by_session):
+    # (all_race_results, driver_session_pairs, lookup) for the fetched
+    # results: the sessions that have results, the (driver_number, session)
+    # pairs to look up and the driver_sessions of those sessions
     all_race_results = []
     for race in races:
-        results = get_race_results(race["session_key"])
+        results = results_by_session.get(race["session_key"])
         if results:  # Only include races with results
             all_race_results.append((race, results))
-            for result in results:
-                driver_num = result.get("driver_number")
-                if driver_num is not None:
-                    driver_session_pairs.add((driver_num, race["session_key"]))
         else:
-            print(
-                f"Skipping race {race.get('meeting_name', 'Unknown')} - no results available"
+            logger.warning(
+                "Skipping %s %s - no results available",
+                race.get("session_name", "race"),
+                race.get("meeting_name", "Unknown"),
             )
+    lookup = driver_sessions([race for race, _ in all_race_results])
+    driver_session_pairs = {
+        (result.driver_number, lookup[race["session_key"]])
+        for race, results in all_race_results
+        for result in results
+        if result.driver_number is not None
+    }
+    return all_race_results, driver_session_pairs, lookup
+
+
+def load_season(year, force_update=False, update_cache=False, ttl=None, source=None):
+    # Fetches one season's races, results and drivers. Returns
+    # (all_race_results, driver_number_to_name, driver_teams), see
+    # season_drivers, or None if there is nothing to chart. With source, the
+    # season is read from that columnar export directory instead.
+    if source:
+        import columnar
 
+        return columnar.read_season(year, source)
+    logger.info("Fetching F1 %s season data...", year)
+    with metrics.stage("fetch_seasons", year=year):
+        races = get_races(
+            year,
+            force_update=force_update,
+            update_cache=update_cache,
+            ttl=ttl,
+        )
+    if not races:
+        logger.warning("No races found for this season.")
+        return None
+    with metrics.stage("fetch_results", year=year):
+        results_by_session = get_race_results_many(
+            (race["session_key"] for race in races), project=True
+        )
+    all_race_results, driver_session_pairs, lookup = season_results(
+        races, results_by_session
+    )
     if not all_race_results:
-        print("No race results available for this season.")
-        return
+        logger.warning("No race results available for this season.")
+        return None
     # Fetch driver map using the correct endpoint
-    driver_map_full = get_driver_map(driver_session_pairs)
-    # Build a mapping from driver_number to the most recent name (for charting)
+    with metrics.stage("driver_map", year=year):
+        driver_map_full = get_driver_map(
+            driver_session_pairs, by_session=True, teams=True
+        )
+    return season_drivers(all_race_results, driver_map_full, lookup)
+
+
+def load_cached_season(year):
+    # load_season from the cache alone, whatever its age: no API requests.
+    # Sessions without cached results are left out and drivers without a
+    # cached name go by their number. None if the season isn't cached.
+    races = load_cache(SEASON_CACHE_PATTERN.format(year=year))
+    if not races:
+        return None
+    cached = load_race_results([race["session_key"] for race in races])
+    all_race_results, driver_session_pairs, lookup = season_results(
+        races,
+        {key: project_results(data) for key, data in cached.items()},
+    )
+    if not all_race_results:
+        return None
+    names = load_driver_names(
+        {
+            f"{driver_number}:{session_key}"
+            for driver_number, session_key in driver_session_pairs
+        }
+    )
+    driver_map = {
+        (str(driver_number), str(session_key)): driver_info(
+            names.get(f"{driver_number}:{session_key}", str(driver_number))
+        )
+        for driver_number, session_key in driver_session_pairs
+    }
+    return season_drivers(all_race_results, driver_map, lookup)
+
+
+def season_drivers(all_race_results, driver_map, lookup=None):
+    # (all_race_results, driver_number_to_name, driver_teams) from a
+    # get_driver_map(teams=True) result: the name of each driver number (for
+    # charting), and {(driver_number, session_key): {"team_name": ...,
+    # "team_colour": ...}} for every driver whose team is known. With lookup
+    # (see driver_sessions), each looked up session's teams also apply to the
+    # other sessions of its meeting.
+    sessions = {}
+    for session_key, target in (lookup or {}).items():
+        sessions.setdefault(str(target), []).append(str(session_key))
     driver_number_to_name = {}
-    for (driver_num, session_key), name in driver_map_full.items():
-        driver_number_to_name[str(driver_num)] = name
-
-    # Now recalculate standings using the correct names
-    def calculate_standings_with_names(races, all_race_results, driver_number_to_name):
-        points_table = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
-        driver_points = {}
-        standings_progression = []
-        for race, results in all_race_results:
-            # Sort by finishing position, treating None as a large number
-            results = sorted(
-                results,
-                key=lambda x: x["position"]
-                if isinstance(x.get("position"), int)
-                else 9999,
+    driver_teams = {}
+    for (driver_num, session_key), info in driver_map.items():
+        info = driver_info(info)
+        driver_number_to_name[str(driver_num)] = info["name"]
+        if info.get("team_name"):
+            team = {field: info[field] for field in TEAM_FIELDS if info.get(field)}
+            for session in sessions.get(str(session_key), [str(session_key)]):
+                driver_teams[(str(driver_num), session)] = team
+    return all_race_results, driver_number_to_name, driver_teams
+
+
+def team_color(team):
+    colour = team.get("team_colour")
+    if not colour:
+        return None
+    return colour if colour.startswith("#") else f"#{colour}"
+
+
+def score_season(
+    year, all_race_results, driver_number_to_name, driver_teams=None, use_snapshot=True
+):
+    # Returns a dict with the race labels, driver names and (races, drivers)
+    # cumulative points, the same for teams, and each driver's and team's
+    # line colour. Driver and team points come from one scoring pass; a
+    # sprint weekend is one race, standing after its last session.
+    with metrics.stage("compute", year=year):
+        snapshot = season_standings(
+            year, all_race_results, use_snapshot=use_snapshot, teams=driver_teams
+        )
+        cumulative = snapshot_matrix(snapshot)
+    columns = snapshot["drivers"]
+    drivers = [i for i, c in enumerate(columns) if not c.startswith(TEAM_COLUMN_PREFIX)]
+    teams = [i for i, c in enumerate(columns) if c.startswith(TEAM_COLUMN_PREFIX)]
+    rows = meeting_rows([race for race, _ in all_race_results])
+    # Colours of each driver's latest team
+    order = {
+        str(race["session_key"]): i for i, (race, _) in enumerate(all_race_results)
+    }
+    colors = {}
+    team_colors = {}
+    for (driver, session_key), team in sorted(
+        (driver_teams or {}).items(), key=lambda item: order.get(item[0][1], -1)
+    ):
+        colour = team_color(team)
+        if colour:
+            colors[driver_number_to_name.get(driver, driver)] = colour
+            team_colors[team["team_name"]] = colour
+    return {
+        "year": year,
+        "race_names": [race_display_name(all_race_results[i][0]) for i in rows],
+        "driver_names": [
+            driver_number_to_name.get(columns[i], columns[i]) for i in drivers
+        ],
+        "cumulative": cumulative[rows][:, drivers],
+        "colors": colors,
+        "team_names": [columns[i][len(TEAM_COLUMN_PREFIX) :] for i in teams],
+        "team_cumulative": cumulative[rows][:, teams],
+        "team_colors": team_colors,
+    }
+
+
+def constructors_season(season):
+    # A season dict's team standings, in the shape of its driver standings
+    return dict(
+        season,
+        driver_names=season["team_names"],
+        cumulative=season["team_cumulative"],
+        colors=season["team_colors"],
+    )
+
+
+def build_season(year, force_update=False, update_cache=False, ttl=None, source=None):
+    # Fetches and scores one season, or returns None if there is nothing to chart
+    season = load_season(year, force_update, update_cache, ttl, source)
+    if season is None:
+        return None
+    return score_season(year, *season, use_snapshot=not force_update)
+
+
+def recompute_standings(years, rule_sets=None, options=None):
+    # Final standings of each season under each rule set (default: every
+    # SCORING_RULES entry) as {year: {rules: {driver name: points}}}, best
+    # first. Seasons come from the cache only, never the API (or from an
+    # export, with options {"source": dir}); seasons that aren't there are
+    # left out. Each is ranked once for all the rule sets.
+    rule_sets = list(rule_sets or SCORING_RULES)
+    source = (options or {}).get("source")
+    standings = {}
+    for year in years:
+        if source:
+            loaded = load_season(year, source=source)
+        else:
+            loaded = load_cached_season(year)
+        if loaded is None:
+            continue
+        all_race_results, driver_number_to_name, _ = loaded
+        with metrics.stage("compute", year=year):
+            drivers, matrices = points_matrices(
+                all_race_results, rule_sets, season=year
             )
-            for i, result in enumerate(results):
-                if i < len(points_table):
-                    points = points_table[i]
-                else:
-                    points = 0
-                driver_num = result.get("driver_number", "Unknown")
-                name = driver_number_to_name.get(str(driver_num), str(driver_num))
-                driver_points.setdefault(name, 0)
-                driver_points[name] += points
-            standings_progression.append(driver_points.copy())
-
-        def get_race_name(r):
-            # Try to get country code for flag
-            country_code = r.get("country_code") or r.get("country_alpha2")
-            flag = country_code_to_flag(country_code) if country_code else ""
-            base = (
-                r.get("meeting_name")
-                or r.get("location")
-                or r.get("circuit_short_name")
-                or r.get("date_start", "Unknown")
+            totals = matrices.sum(axis=1).tolist()
+        names = [driver_number_to_name.get(d, d) for d in drivers]
+        standings[year] = {
+            rules: dict(
+                sorted(
+                    named_progression(names, [row])[0].items(),
+                    key=lambda item: -item[1],
+                )
             )
-            return f"{flag} {base}" if flag else f"{country_code}: {base}"
+            for rules, row in zip(rule_sets, totals)
+        }
+    return standings
+
+
+def render_key(
+    all_race_results,
+    driver_number_to_name,
+    driver_teams,
+    title,
+    mode,
+    view="drivers",
+    chart_filter=None,
+):
+    # Content hash of everything a season chart is drawn from: the ordered
+    # session keys with a digest of each session's results (points included,
+    # they decide fastest-lap bonuses), the driver names and teams, the
+    # scoring rules and the plot options. Only plain Python is used so a
+    # cache hit never has to score the season or import pandas or plotly.
+    digest = hashlib.sha256()
+    for race, results in all_race_results:
+        rows = [
+            [r.get("driver_number"), r.get("position"), r.get("points")]
+            for r in results
+        ]
+        results_digest = hashlib.sha256(json.dumps(rows).encode()).hexdigest()
+        digest.update(
+            json.dumps(
+                [
+                    race["session_key"],
+                    race.get("session_name"),
+                    race_display_name(race),
+                    results_digest,
+                ]
+            ).encode()
+        )
+    digest.update(
+        json.dumps(
+            {
+                "version": RENDER_CACHE_VERSION,
+                "drivers": driver_number_to_name,
+                "teams": {
+                    f"{driver}:{session_key}": team
+                    for (driver, session_key), team in (driver_teams or {}).items()
+                },
+                "scoring_rules": SCORING_RULES,
+                "points_scale": POINTS_SCALE,
+                "title": title,
+                "mode": mode,
+                "view": view,
+                "filter": chart_filter,
+                "large_chart": LARGE_CHART,
+            },
+            sort_keys=True,
+        ).encode()
+    )
+    return digest.hexdigest()
+
+
+def render_manifest_path(output):
+    return os.path.join(os.path.dirname(output), RENDER_MANIFEST_FILE)
+
 
-        # Sort driver_names by final points (descending) before passing to plot_standings
-        if standings_progression:
-            final_points = standings_progression[-1]
-            sorted_driver_names = sorted(
-                final_points, key=lambda n: final_points[n], reverse=True
+def load_render_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def chart_is_current(output, key):
+    # True if output exists and was last rendered from inputs with this
+    # render_key, according to the render manifest next to it
+    manifest = load_render_manifest(render_manifest_path(output))
+    return manifest.get(os.path.basename(output)) == key and os.path.exists(output)
+
+
+def save_render_keys(keys):
+    # Records {output: render_key} in the outputs' render manifests. The
+    # read-merge-write is locked, as pool workers share a manifest.
+    manifests = {}
+    for output, key in keys.items():
+        entries = manifests.setdefault(render_manifest_path(output), {})
+        entries[os.path.basename(output)] = key
+    for path, entries in manifests.items():
+        with cache_lock(os.path.abspath(path)):
+            manifest = load_render_manifest(path)
+            manifest.update(entries)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            write_json_atomic(path, manifest)
+
+
+def render_season(
+    year,
+    options,
+    output=CHART_OUTPUT,
+    title="F1 Driver Standings Progression",
+    mode="inline",
+    need_season=False,
+    constructors=False,
+    export=None,
+):
+    # Fetches one season and charts it (its constructors' standings with
+    # constructors). When output already holds a chart of the same inputs it
+    # is left untouched; the season is then only scored if need_season, and
+    # pandas/plotly are never imported. export=(root, fmt) also writes the
+    # loaded season to a columnar export directory.
+    season = load_season(year, **options)
+    if season is None:
+        return None
+    if export:
+        import columnar
+
+        columnar.export_season(year, season, *export)
+    all_race_results, driver_number_to_name, driver_teams = season
+    output = chart_output_path(output, mode)
+    key = render_key(
+        all_race_results,
+        driver_number_to_name,
+        driver_teams,
+        title,
+        mode,
+        view="constructors" if constructors else "drivers",
+    )
+    current = chart_is_current(output, key)
+    if current:
+        metrics.incr("render_cache.hits")
+        logger.info("%s is up to date", output)
+        if not need_season:
+            return None
+    season = score_season(
+        year,
+        all_race_results,
+        driver_number_to_name,
+        driver_teams,
+        use_snapshot=not options.get("force_update"),
+    )
+    if constructors and not season["team_names"]:
+        logger.warning("No team data for the %s season, not writing %s", year, output)
+        return None
+    if not current:
+        plot_season(
+            constructors_season(season) if constructors else season,
+            output=output,
+            title=title,
+            mode=mode,
+        )
+        save_render_keys({output: key})
+    return season
+
+
+def season_dataframe(season):
+    return standings_dataframe(
+        season["race_names"], season["driver_names"], season["cumulative"]
+    )
+
+
+def combine_seasons(seasons):
+    # All-time view: seasons back to back, with each driver's running total
+    # carried over from one season into the next
+    import numpy as np
+
+    names = []
+    index = {}
+    for season in seasons:
+        for name in season["driver_names"]:
+            if name not in index:
+                index[name] = len(names)
+                names.append(name)
+    rows = sum(len(season["race_names"]) for season in seasons)
+    dtype = np.result_type(*(season["cumulative"] for season in seasons))
+    cumulative = np.zeros((rows, len(names)), dtype=dtype)
+    carried = np.zeros(len(names), dtype=dtype)
+    race_names = []
+    colors = {}
+    start = 0
+    for season in seasons:
+        colors.update(season.get("colors", {}))
+        end = start + len(season["race_names"])
+        block = cumulative[start:end]
+        for column, name in enumerate(season["driver_names"]):
+            block[:, index[name]] += season["cumulative"][:, column]
+        block += carried
+        carried = block[-1].copy()
+        race_names += [f"{season['year']} {name}" for name in season["race_names"]]
+        start = end
+    return {
+        "year": f"{seasons[0]['year']}-{seasons[-1]['year']}",
+        "race_names": race_names,
+        "driver_names": names,
+        "cumulative": cumulative,
+        "colors": colors,
+    }
+
+
+def parse_years(spec):
+    # "2018-2025", "2019,2021,2023" or a mix such as "2014-2016,2021"
+    years = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        try:
+            if sep:
+                years.extend(range(int(first), int(last) + 1))
+            else:
+                years.append(int(first))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid year range: {part!r}")
+    if not years:
+        raise argparse.ArgumentTypeError("no years given")
+    return sorted(set(years))
+
+
+def worker_rate_limits(workers, rate_limits=OPENF1_RATE_LIMITS, index=0):
+    # Pool worker index's share of rate_limits: a burst of rate // workers
+    # requests (at least one) over a period stretched so the workers' buckets
+    # refill at rate / per between them. 3/1s over 8 workers is 1 per 8/3s.
+    # The buckets start (nearly) empty and staggered, worker index getting
+    # its first token index * per / rate in, so the pool's first requests
+    # are spread out at the full rate instead of all going out at once.
+    shares = []
+    for rate, per in rate_limits:
+        burst = max(1, rate // workers)
+        shares.append((burst, per * burst * workers / rate, 1 - index / workers))
+    return shares
+
+
+def init_season_worker(
+    cache_backend, workers, worker_counter=None, log_options=None, large_chart=None
+):
+    # Runs in each pool process: use the parent's cache backend, logging and
+    # chart settings, and its share of the OpenF1 rate limits. worker_counter
+    # (a shared multiprocessing.Value) numbers the workers.
+    global CACHE_BACKEND, _http_client
+    CACHE_BACKEND = cache_backend
+    index = 0
+    if worker_counter is not None:
+        with worker_counter.get_lock():
+            index = worker_counter.value % workers
+            worker_counter.value += 1
+    _http_client = OpenF1Client(rate_limits=worker_rate_limits(workers, index=index))
+    init_render_worker(log_options, large_chart)
+
+
+def init_render_worker(log_options=None, large_chart=None):
+    # Forked workers inherit the parent's counters; start from zero so the
+    # snapshots they send back can simply be added up
+    global LARGE_CHART
+    metrics.reset()
+    if log_options:
+        configure_logging(**log_options)
+    if large_chart:
+        LARGE_CHART = large_chart
+
+
+def chart_season(year, options, output_dir="", output_mode="inline", export=None):
+    return render_season(
+        year,
+        options,
+        output=os.path.join(output_dir, SEASON_CHART_PATTERN.format(year=year)),
+        title=f"F1 {year} Driver Standings Progression",
+        mode=output_mode,
+        need_season=True,
+        export=export,
+    )
+
+
+def chart_season_job(year, options, output_dir, output_mode, export):
+    # Pool version of chart_season, also returning the worker's metrics
+    season = chart_season(year, options, output_dir, output_mode, export)
+    snapshot = metrics.snapshot()
+    metrics.reset()
+    return season, snapshot
+
+
+def chart_seasons(
+    years,
+    options,
+    workers=None,
+    combined=False,
+    output_dir="",
+    output_mode="inline",
+    export=None,
+):
+    # One chart per season, each season fetched, scored and rendered in its
+    # own process; the caches are shared through CACHE_DIR
+    workers = max(1, min(workers or os.cpu_count() or 1, len(years)))
+    if workers == 1:
+        seasons = [
+            chart_season(year, options, output_dir, output_mode, export)
+            for year in years
+        ]
+    else:
+        if CACHE_BACKEND == "sqlite":
+            # Create and migrate the database before the workers start, and
+            # don't hand them the parent's connection
+            get_cache_store()
+            close_cache_store()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_season_worker,
+            initargs=(
+                CACHE_BACKEND,
+                workers,
+                multiprocessing.Value("i", 0),
+                logging_options(),
+                LARGE_CHART,
+            ),
+        ) as executor:
+            seasons = []
+            for season, snapshot in executor.map(
+                chart_season_job,
+                years,
+                [options] * len(years),
+                [output_dir] * len(years),
+                [output_mode] * len(years),
+                [export] * len(years),
+            ):
+                metrics.merge(snapshot)
+                seasons.append(season)
+    seasons = [season for season in seasons if season is not None]
+    if combined and seasons:
+        all_time = combine_seasons(seasons)
+        plot_season(
+            all_time,
+            output=os.path.join(
+                output_dir,
+                COMBINED_CHART_PATTERN.format(
+                    first=seasons[0]["year"], last=seasons[-1]["year"]
+                ),
+            ),
+            title=f"F1 Driver Standings Progression {all_time['year']}",
+            mode=output_mode,
+        )
+    return seasons
+
+
+def filter_season(season, chart_filter):
+    # Narrows a season to the drivers selected by chart_filter:
+    # {"top": N} keeps the N drivers with the most points at the end,
+    # {"drivers": [names]} keeps the named drivers
+    if not chart_filter:
+        return season
+    names = season["driver_names"]
+    final = {}
+    if len(season["race_names"]):
+        for name, total in zip(names, season["cumulative"][-1]):
+            final[name] = final.get(name, 0) + total
+    if "top" in chart_filter:
+        ranked = sorted(final, key=lambda n: final[n], reverse=True)
+        selected = set(ranked[: chart_filter["top"]])
+    elif "drivers" in chart_filter:
+        selected = set(chart_filter["drivers"])
+    else:
+        raise ValueError(f"Unknown chart filter: {chart_filter}")
+    columns = [i for i, name in enumerate(names) if name in selected]
+    return dict(
+        season,
+        driver_names=[names[i] for i in columns],
+        cumulative=season["cumulative"][:, columns],
+    )
+
+
+def filter_slug(chart_filter):
+    if not chart_filter:
+        return ""
+    if "top" in chart_filter:
+        return f"_top{chart_filter['top']}"
+    return "_" + "-".join(
+        "".join(c for c in name.lower() if c.isalnum())
+        for name in chart_filter.get("drivers", [])
+    )
+
+
+def render_chart_job(job):
+    plot_season(
+        job["season"],
+        output=job["output"],
+        title=job["title"],
+        mode=job["mode"],
+    )
+    return job["output"]
+
+
+def render_chart_worker(job):
+    output = render_chart_job(job)
+    snapshot = metrics.snapshot()
+    metrics.reset()
+    return output, snapshot
+
+
+def render_batch(specs, options, output_dir="", output_mode="inline", workers=None):
+    # Renders many charts from a list of specs such as
+    #   {"season": 2024, "filter": {"top": 10}, "output": "top10.html"}
+    # Each season is fetched once however many charts use it. Charts whose
+    # render_key matches the render manifest and whose file still exists are
+    # skipped (as in render_season); seasons are only scored for the others,
+    # which are rendered in a process pool.
+    loaded = {}
+    for year in dict.fromkeys(spec["season"] for spec in specs):
+        loaded[year] = load_season(year, **options)
+    seasons = {}
+    keys = {}
+    jobs = []
+    skipped = []
+    for spec in specs:
+        year = spec["season"]
+        if loaded[year] is None:
+            continue
+        chart_filter = spec.get("filter")
+        title = spec.get("title", f"F1 {year} Driver Standings Progression")
+        output = spec.get("output") or SEASON_CHART_PATTERN.format(
+            year=f"{year}{filter_slug(chart_filter)}"
+        )
+        output = chart_output_path(os.path.join(output_dir, output), output_mode)
+        key = render_key(*loaded[year], title, output_mode, chart_filter=chart_filter)
+        if chart_is_current(output, key):
+            metrics.incr("render_cache.hits")
+            skipped.append(output)
+            continue
+        if year not in seasons:
+            seasons[year] = score_season(
+                year, *loaded[year], use_snapshot=not options.get("force_update")
             )
-        else:
-            sorted_driver_names = list(driver_points.keys())
-        return (
-            standings_progression,
-            [get_race_name(race) for (race, _) in all_race_results],
-            sorted_driver_names,
+        keys[output] = key
+        jobs.append(
+            {
+                "season": filter_season(seasons[year], chart_filter),
+                "output": output,
+                "title": title,
+                "mode": output_mode,
+            }
         )
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+    if workers == 1:
+        rendered = [render_chart_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_render_worker,
+            initargs=(logging_options(), LARGE_CHART),
+        ) as executor:
+            rendered = []
+            for output, snapshot in executor.map(render_chart_worker, jobs):
+                metrics.merge(snapshot)
+                rendered.append(output)
+    save_render_keys(keys)
+    logger.info("Rendered %d charts, %d unchanged", len(rendered), len(skipped))
+    return rendered, skipped
 
-    standings_progression, race_names, driver_names = calculate_standings_with_names(
-        races, all_race_results, driver_number_to_name
+
+def main():
+    parser = argparse.ArgumentParser(description="F1 Standings Chart Generator")
+    seasons = parser.add_mutually_exclusive_group()
+    seasons.add_argument(
+        "--year", type=int, help="Year of the F1 season to chart (e.g. 2024)"
+    )
+    seasons.add_argument(
+        "--years",
+        type=parse_years,
+        help="Several seasons, one chart each (e.g. 2018-2025 or 2021,2023)",
+    )
+    seasons.add_argument(
+        "--render-batch",
+        metavar="SPECS",
+        help="JSON file with a list of chart specs to render, e.g. "
+        '[{"season": 2024, "filter": {"top": 10}}]',
+    )
+    parser.add_argument(
+        "--combined",
+        action="store_true",
+        help="With --years, also write an all-time chart across the seasons",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="With --years or --render-batch, number of parallel processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--force-update", action="store_true", help="Force update season cache from API"
+    )
+    parser.add_argument(
+        "--update-cache",
+        action="store_true",
+        help="Add new races to cache without replacing existing ones",
+    )
+    parser.add_argument(
+        "--cache-backend",
+        choices=CACHE_BACKENDS,
+        help="Cache storage: one JSON file per key (default) or a single SQLite file",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        help=f"Seconds before a running season's cache is revalidated (default {SEASON_CACHE_TTL})",
+    )
+    parser.add_argument(
+        "--output",
+        default=CHART_OUTPUT,
+        help=f"Chart file for a single season (default {CHART_OUTPUT})",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="",
+        help="With --years or --render-batch, directory for the chart files (default: current directory)",
+    )
+    parser.add_argument(
+        "--output-mode",
+        choices=OUTPUT_MODES,
+        default="inline",
+        help="inline: self-contained HTML (default); directory: HTML sharing a local "
+        "plotly.min.js; cdn: HTML loading plotly.js from the CDN; json: figure "
+        "spec for the shared viewer.html",
+    )
+    parser.add_argument(
+        "--constructors",
+        action="store_true",
+        help="With --year, chart the constructors' standings instead of the drivers'",
+    )
+    parser.add_argument(
+        "--export",
+        metavar="DIR",
+        help="With --year or --years, also write the seasons' sessions, results "
+        "and drivers as columnar tables under DIR (needs pyarrow)",
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=EXPORT_FORMATS,
+        default="arrow",
+        help="arrow: memory-mappable Arrow IPC files (default); parquet: "
+        "compressed Parquet files",
+    )
+    parser.add_argument(
+        "--from-export",
+        metavar="DIR",
+        help="Read seasons from a --export directory instead of the API and cache",
+    )
+    parser.add_argument(
+        "--large-chart",
+        choices=LARGE_CHART_SETTINGS,
+        help="WebGL chart with the low scorers collapsed into a band and thinned "
+        f"points: auto (default) above {LARGE_CHART_CELLS} races x drivers, "
+        "on or off",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=("text", "json"),
+        default="text",
+        help="text: progress messages (default); json: JSON lines on stderr, "
+        "including stage timings and a final metrics summary",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print stage timings, HTTP and cache counts when done",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Show debug messages"
+    )
+    commands = parser.add_subparsers(dest="command")
+    serve_parser = commands.add_parser(
+        "serve",
+        help="Serve charts over HTTP from an in-memory cache",
+        description="Serve charts over HTTP: /seasons/<year>.html or .json "
+        "(?top=N), /seasons/<year>/standings.json and /stats",
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=SERVE_PORT)
+    serve_parser.add_argument(
+        "--cache-mb",
+        type=int,
+        default=SERVE_CACHE_MB,
+        help=f"Memory cap for cached seasons and charts (default {SERVE_CACHE_MB})",
+    )
+    serve_parser.add_argument(
+        "--refresh-interval",
+        type=int,
+        default=SERVE_REFRESH_INTERVAL,
+        help="Seconds between checks for new races in the current season "
+        f"(default {SERVE_REFRESH_INTERVAL}, 0 to disable)",
+    )
+    serve_parser.add_argument(
+        "--chart-mode",
+        choices=("cdn", "inline"),
+        default="cdn",
+        help="How HTML charts load plotly.js (default cdn)",
+    )
+    args = parser.parse_args()
+    configure_logging(args.log_format, args.verbose)
+    with metrics.stage("total"):
+        run(args)
+    if args.log_format == "json":
+        logger.info("metrics summary", extra={"event": "summary", **metrics.summary()})
+    if args.profile:
+        print(metrics.format_summary(), file=sys.stderr)
+
+
+def run(args):
+    global CACHE_BACKEND, LARGE_CHART
+    if args.cache_backend:
+        CACHE_BACKEND = args.cache_backend
+    if args.large_chart:
+        LARGE_CHART = args.large_chart
+    options = {
+        "force_update": args.force_update,
+        "update_cache": args.update_cache,
+        "ttl": args.cache_ttl,
+        "source": args.from_export,
+    }
+    if args.command == "serve":
+        import server
+
+        server.serve(
+            options,
+            host=args.host,
+            port=args.port,
+            cache_mb=args.cache_mb,
+            refresh_interval=args.refresh_interval,
+            chart_mode=args.chart_mode,
+        )
+        return
+    if args.render_batch:
+        with open(args.render_batch, "r") as f:
+            specs = json.load(f)
+        render_batch(
+            specs,
+            options,
+            output_dir=args.output_dir,
+            output_mode=args.output_mode,
+            workers=args.workers,
+        )
+        return
+    # Seasons are exported as they are loaded for charting
+    export = (args.export, args.export_format) if args.export else None
+    if args.years:
+        chart_seasons(
+            args.years,
+            options,
+            workers=args.workers,
+            combined=args.combined,
+            output_dir=args.output_dir,
+            output_mode=args.output_mode,
+            export=export,
+        )
+        return
+    if args.constructors:
+        render_season(
+            season_to_chart(args.year),
+            options,
+            output=args.output,
+            title="F1 Constructors' Standings Progression",
+            mode=args.output_mode,
+            constructors=True,
+            export=export,
+        )
+        return
+    render_season(
+        season_to_chart(args.year),
+        options,
+        output=args.output,
+        mode=args.output_mode,
+        export=export,
     )
-    plot_standings(standings_progression, race_names, driver_names)
 
 
 if __name__ == "__main__":
-    main()
+    # Run as the "main" module, so modules that import main (server.py) share
+    # its state, and process pool workers can find its functions
+    import main
+
+    main.main()
@@ -0,0 +1,179 @@
+import json
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Logging and metrics for the pipeline. Progress messages go through the
+# "f1chart" logger; stage timings, HTTP and cache counters are collected in
+# the process-wide `metrics` object and emitted as events on
+# "f1chart.metrics", which is only shown in JSON lines mode or with -v.
+
+logger = logging.getLogger("f1chart")
+metrics_logger = logging.getLogger("f1chart.metrics")
+
+STAGES = (
+    "fetch_seasons",
+    "fetch_results",
+    "driver_map",
+    "read_export",
+    "compute",
+    "render",
+    "export",
+)
+
+# Standard LogRecord attributes, everything else was passed in extra=
+RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+}
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.timings = Counter()
+        self.calls = Counter()
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def record_time(self, name, seconds):
+        with self.lock:
+            self.timings[name] += seconds
+            self.calls[name] += 1
+
+    @contextmanager
+    def stage(self, name, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record_time(name, elapsed)
+            metrics_logger.info(
+                "stage %s took %.3fs",
+                name,
+                elapsed,
+                extra={"event": "stage", "stage": name, "seconds": elapsed, **fields},
+            )
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "timings": dict(self.timings),
+                "calls": dict(self.calls),
+            }
+
+    def merge(self, snapshot):
+        # Adds the metrics of a worker process
+        with self.lock:
+            self.counters.update(snapshot["counters"])
+            self.timings.update(snapshot["timings"])
+            self.calls.update(snapshot["calls"])
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timings.clear()
+            self.calls.clear()
+
+    def summary(self):
+        snapshot = self.snapshot()
+        counters = snapshot["counters"]
+        hits = counters.get("cache.hits", 0)
+        misses = counters.get("cache.misses", 0)
+        return {
+            "stages": {
+                name: {
+                    "calls": snapshot["calls"][name],
+                    "seconds": round(seconds, 4),
+                }
+                for name, seconds in snapshot["timings"].items()
+            },
+            "counters": counters,
+            "cache_hit_ratio": (
+                round(hits / (hits + misses), 3) if hits + misses else None
+            ),
+        }
+
+    def format_summary(self):
+        summary = self.summary()
+        counters = summary["counters"]
+        lines = [f"{'stage':<16}{'calls':>6}{'seconds':>10}"]
+        stages = sorted(
+            summary["stages"],
+            key=lambda n: STAGES.index(n) if n in STAGES else len(STAGES),
+        )
+        for name in stages:
+            stage = summary["stages"][name]
+            lines.append(f"{name:<16}{stage['calls']:>6}{stage['seconds']:>10.3f}")
+        lines.append(
+            f"HTTP: {counters.get('http.requests', 0)} requests,"
+            f" {counters.get('http.retries', 0)} retries,"
+            f" {counters.get('http.429', 0)} rate limited,"
+            f" {counters.get('http.errors', 0)} failed,"
+            f" {counters.get('http.bytes', 0) / 1024:.1f} KB received"
+        )
+        ratio = summary["cache_hit_ratio"]
+        lines.append(
+            f"Cache: {counters.get('cache.hits', 0)} hits,"
+            f" {counters.get('cache.misses', 0)} misses"
+            + (f" ({ratio:.0%} hit rate)" if ratio is not None else "")
+        )
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": getattr(record, "event", "log"),
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_FIELDS and name not in entry:
+                entry[name] = value
+        return json.dumps(entry, default=str)
+
+
+_logging_options = None
+
+
+def logging_options():
+    # Arguments of the last configure_logging call, for worker processes
+    return _logging_options
+
+
+def configure_logging(log_format="text", verbose=False, stream=None):
+    # text: plain progress messages as before; json: one JSON object per line
+    # for every message and metrics event
+    global _logging_options
+    _logging_options = {"log_format": log_format, "verbose": verbose}
+    if stream is None:
+        stream = sys.stderr if log_format == "json" else sys.stdout
+    handler = logging.StreamHandler(stream)
+    if log_format == "json":
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    logger.propagate = False
+    # Metrics events are machine-oriented: always on in JSON mode, only with
+    # -v in text mode
+    metrics_logger.setLevel(
+        logging.DEBUG
+        if verbose
+        else logging.INFO if log_format == "json" else logging.WARNING
+    )
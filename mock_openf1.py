@@ -0,0 +1,349 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+# Offline stand-in for the OpenF1 API: serves /sessions, /session_result and
+# /drivers from synthetic but deterministic season data, with optional
+# latency, jitter, injected 429s and failures. Point main.py at it with
+# OPENF1_API_BASE=http://127.0.0.1:<port>/v1
+
+FILTER_RE = re.compile(r"^(\w+)(>=|<=|>|<|=)(.*)$")
+
+POINTS_TABLE = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
+
+# (country_code, location) per round
+CALENDAR = [
+    ("BRN", "Sakhir"),
+    ("KSA", "Jeddah"),
+    ("AUS", "Melbourne"),
+    ("JPN", "Suzuka"),
+    ("CHN", "Shanghai"),
+    ("USA", "Miami"),
+    ("ITA", "Imola"),
+    ("MON", "Monaco"),
+    ("CAN", "Montréal"),
+    ("ESP", "Barcelona"),
+    ("AUT", "Spielberg"),
+    ("GBR", "Silverstone"),
+    ("HUN", "Budapest"),
+    ("BEL", "Spa-Francorchamps"),
+    ("NED", "Zandvoort"),
+    ("ITA", "Monza"),
+    ("AZE", "Baku"),
+    ("SGP", "Marina Bay"),
+    ("USA", "Austin"),
+    ("MEX", "Mexico City"),
+    ("BRA", "São Paulo"),
+    ("USA", "Las Vegas"),
+    ("QAT", "Lusail"),
+    ("UAE", "Yas Marina"),
+]
+
+TEAMS = [
+    ("Red Bull Racing", "3671C6"),
+    ("Ferrari", "E8002D"),
+    ("Mercedes", "27F4D2"),
+    ("McLaren", "FF8000"),
+    ("Aston Martin", "229971"),
+    ("Alpine", "FF87BC"),
+    ("Williams", "64C4FF"),
+    ("RB", "6692FF"),
+    ("Kick Sauber", "52E252"),
+    ("Haas F1 Team", "B6BABD"),
+]
+
+# Every SPRINT_EVERY-th round also has a sprint
+SPRINT_EVERY = 4
+
+
+class MockOpenF1:
+    def __init__(
+        self,
+        seasons=range(2021, 2025),
+        races_per_season=len(CALENDAR),
+        drivers=20,
+        latency=0.0,
+        jitter=0.0,
+        rate_limit_ratio=0.0,
+        failure_ratio=0.0,
+        retry_after=0,
+        seed=0,
+    ):
+        self.seasons = list(seasons)
+        self.races_per_season = races_per_season
+        self.drivers = drivers
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.failure_ratio = failure_ratio
+        self.retry_after = retry_after
+        self.seed = seed
+        # Number of rounds already run per season; lower it to simulate a
+        # season in progress, raise it to "run" the next race
+        self.released = {year: races_per_season for year in self.seasons}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.server = None
+        self.thread = None
+
+    # Synthetic data
+
+    def sessions(self, year):
+        sessions = []
+        for i in range(self.released.get(year, 0)):
+            country_code, location = CALENDAR[i % len(CALENDAR)]
+            meeting_key = year * 100 + i + 1
+            race_day = (date(year, 3, 1) + timedelta(days=9 * i)).isoformat()
+            common = {
+                "meeting_key": meeting_key,
+                "year": year,
+                "country_code": country_code,
+                "location": location,
+                "circuit_short_name": location,
+                "session_type": "Race",
+            }
+            if (i + 1) % SPRINT_EVERY == 0:
+                sessions.append(
+                    dict(
+                        common,
+                        session_key=meeting_key * 10 + 1,
+                        session_name="Sprint",
+                        date_start=f"{race_day}T10:00:00+00:00",
+                    )
+                )
+            sessions.append(
+                dict(
+                    common,
+                    session_key=meeting_key * 10 + 2,
+                    session_name="Race",
+                    date_start=f"{race_day}T14:00:00+00:00",
+                )
+            )
+        return sessions
+
+    def session(self, session_key):
+        year = session_key // 1000
+        for session in self.sessions(year):
+            if session["session_key"] == session_key:
+                return session
+        return None
+
+    def driver_numbers(self, year):
+        return [year % 7 + i * 3 + 1 for i in range(self.drivers)]
+
+    def session_drivers(self, session_key):
+        session = self.session(session_key)
+        if session is None:
+            return []
+        drivers = []
+        for i, number in enumerate(self.driver_numbers(session["year"])):
+            team_name, team_colour = TEAMS[i // 2 % len(TEAMS)]
+            drivers.append(
+                {
+                    "driver_number": number,
+                    "full_name": f"Driver {number}",
+                    "broadcast_name": f"D {number}",
+                    "name_acronym": f"D{number:02d}",
+                    "team_name": team_name,
+                    "team_colour": team_colour,
+                    "session_key": session_key,
+                    "meeting_key": session["meeting_key"],
+                }
+            )
+        return drivers
+
+    def session_result(self, session_key):
+        session = self.session(session_key)
+        if session is None:
+            return []
+        numbers = self.driver_numbers(session["year"])
+        random.Random(session_key).shuffle(numbers)
+        sprint = session["session_name"] == "Sprint"
+        table = [8, 7, 6, 5, 4, 3, 2, 1] if sprint else POINTS_TABLE
+        results = []
+        for i, number in enumerate(numbers):
+            # The last car of every race retires
+            finished = i < len(numbers) - 1
+            results.append(
+                {
+                    "driver_number": number,
+                    "position": i + 1 if finished else None,
+                    "points": table[i] if i < len(table) else 0,
+                    "dnf": not finished,
+                    "session_key": session_key,
+                    "meeting_key": session["meeting_key"],
+                }
+            )
+        return results
+
+    # Request handling
+
+    def query(self, path, params):
+        rows = {
+            "/v1/sessions": lambda: [
+                s for year in self.seasons for s in self.sessions(year)
+            ],
+            "/v1/session_result": lambda: self.session_result(
+                int(params.get("session_key", ("=", 0))[1])
+            ),
+            "/v1/drivers": lambda: self.session_drivers(
+                int(params.get("session_key", ("=", 0))[1])
+            ),
+        }.get(path)
+        if rows is None:
+            return None
+        return [row for row in rows() if matches(row, params)]
+
+    def respond(self, url):
+        # Returns (status, headers, body) for a GET of url
+        parts = urlsplit(url)
+        params = parse_filters(parts.query)
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats[parts.path] += 1
+            roll = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-1, 1) * self.jitter)
+        time.sleep(delay)
+        if roll < self.rate_limit_ratio:
+            with self.lock:
+                self.stats["429"] += 1
+            return 429, {"Retry-After": str(self.retry_after)}, b"{}"
+        if roll < self.rate_limit_ratio + self.failure_ratio:
+            with self.lock:
+                self.stats["500"] += 1
+            return 500, {}, b"{}"
+        rows = self.query(parts.path, params)
+        if rows is None:
+            return 404, {}, b'{"detail": "Not Found"}'
+        body = json.dumps(rows).encode()
+        with self.lock:
+            self.stats["bytes"] += len(body)
+        return 200, {"Content-Type": "application/json"}, body
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = Counter()
+
+    def start(self, host="127.0.0.1", port=0):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, headers, body = mock.respond(self.path)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            daemon=True,
+        )
+        self.thread.start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_filters(query):
+    # OpenF1 filters look like year=2024 or date_start>2024-05-01, so
+    # urllib.parse.parse_qs can't be used
+    params = {}
+    for part in query.split("&"):
+        match = FILTER_RE.match(unquote(part))
+        if match:
+            name, op, value = match.groups()
+            params[name] = (op, value)
+    return params
+
+
+def matches(row, params):
+    for name, (op, value) in params.items():
+        if name not in row:
+            continue
+        actual = row[name]
+        if isinstance(actual, int):
+            value = int(value)
+        if op == "=" and actual != value:
+            return False
+        if op == ">" and not actual > value:
+            return False
+        if op == ">=" and not actual >= value:
+            return False
+        if op == "<" and not actual < value:
+            return False
+        if op == "<=" and not actual <= value:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline mock of the OpenF1 API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-year", type=int, default=2021)
+    parser.add_argument("--last-year", type=int, default=2024)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per request"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Random +/- seconds added to latency"
+    )
+    parser.add_argument(
+        "--rate-limit-ratio", type=float, default=0.0, help="Share of requests to 429"
+    )
+    parser.add_argument(
+        "--failure-ratio", type=float, default=0.0, help="Share of requests to 500"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    mock = MockOpenF1(
+        seasons=range(args.first_year, args.last_year + 1),
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit_ratio=args.rate_limit_ratio,
+        failure_ratio=args.failure_ratio,
+        seed=args.seed,
+    )
+    mock.start(args.host, args.port)
+    print(f"Mock OpenF1 API at {mock.url} (Ctrl+C to stop)")
+    try:
+        mock.thread.join()
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+import main
+from metrics import logger, metrics
+
+# Long-running chart server (python main.py serve). Seasons are scored once
+# and kept in memory together with their rendered charts, in an LRU cache
+# with a size cap, so a warm chart is served without touching the disk cache,
+# pandas or plotly. A background thread refreshes the current season.
+
+CONTENT_TYPES = {
+    "html": "text/html; charset=utf-8",
+    "json": "application/json",
+}
+# Seasons outside FIRST_SEASON..next year are answered with a 404 without
+# asking the API
+FIRST_SEASON = 1950
+
+
+class LRUCache:
+    # Least recently used entries are dropped once the total size of the
+    # values goes over max_bytes. Sizes are supplied by the caller.
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                self._remove(next(iter(self.entries)))
+
+    def discard(self, predicate):
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def season_size(season):
+    # Rough in-memory size of a scored season
+    labels = season["race_names"] + season["driver_names"] + season["team_names"]
+    return (
+        season["cumulative"].nbytes
+        + season["team_cumulative"].nbytes
+        + sum(len(label) * 4 + 50 for label in labels)
+    )
+
+
+class ChartService:
+    def __init__(self, options, chart_mode="cdn", max_bytes=main.SERVE_CACHE_MB << 20):
+        self.options = options
+        self.chart_mode = chart_mode
+        self.cache = LRUCache(max_bytes)
+        self.build_locks = {}
+        self.build_locks_lock = threading.Lock()
+
+    def build_lock(self, year):
+        # Concurrent requests for a cold season wait for one build, and
+        # refresh() waits for charts being rendered from the old season
+        with self.build_locks_lock:
+            return self.build_locks.setdefault(year, threading.RLock())
+
+    def season(self, year):
+        # Returns the cached {"season", "key"} entry for year, building it on
+        # first use; None if the season has nothing to chart
+        if not FIRST_SEASON <= year <= datetime.now().year + 1:
+            return None
+        entry = self.cached_season(year)
+        if entry is None:
+            with self.build_lock(year):
+                entry = self.cached_season(year)
+                if entry is None:
+                    entry = self.build(year, self.options)
+        return entry if entry["season"] is not None else None
+
+    def cached_season(self, year):
+        # Seasons without results are cached too (with "season" None), until
+        # SEASON_CACHE_TTL has passed
+        entry = self.cache.get(("season", year))
+        if (
+            entry is not None
+            and entry["season"] is None
+            and time.time() - entry["built_at"] > main.SEASON_CACHE_TTL
+        ):
+            return None
+        return entry
+
+    def build(self, year, options):
+        loaded = main.load_season(year, **options)
+        if loaded is None:
+            entry = {"season": None, "key": None, "built_at": time.time()}
+            self.cache.put(("season", year), entry, 100)
+            return entry
+        key = main.render_key(*loaded, None, None)
+        entry = {
+            "season": main.score_season(year, *loaded),
+            "key": key,
+            "built_at": time.time(),
+        }
+        self.cache.put(("season", year), entry, season_size(entry["season"]))
+        return entry
+
+    def refresh(self, year):
+        # Checks the API for new races. Returns True if the season changed, in
+        # which case its cached charts are dropped.
+        with self.build_lock(year):
+            old = self.cache.get(("season", year))
+            loaded = main.load_season(year, **dict(self.options, update_cache=True))
+            if loaded is None:
+                return False
+            key = main.render_key(*loaded, None, None)
+            if old is not None and old["key"] == key:
+                return False
+            self.cache.discard(lambda k: k[0] == "chart" and k[1] == year)
+            entry = {
+                "season": main.score_season(year, *loaded),
+                "key": key,
+                "built_at": time.time(),
+            }
+            self.cache.put(("season", year), entry, season_size(entry["season"]))
+            return True
+
+    def chart(self, year, fmt, top=None):
+        # Rendered chart as bytes, or None if the season has nothing to chart
+        cache_key = ("chart", year, fmt, top)
+        body = self.cache.get(cache_key)
+        if body is not None:
+            return body
+        with self.build_lock(year):
+            body = self.cache.get(cache_key)
+            if body is not None:
+                return body
+            entry = self.season(year)
+            if entry is None:
+                return None
+            season = entry["season"]
+            if top:
+                season = main.filter_season(season, {"top": top})
+            with metrics.stage("render", year=year, format=fmt):
+                fig = main.season_figure(
+                    season, title=f"F1 {year} Driver Standings Progression"
+                )
+                if fmt == "json":
+                    body = fig.to_json().encode()
+                else:
+                    body = fig.to_html(include_plotlyjs=self.chart_mode).encode()
+            self.cache.put(cache_key, body, len(body))
+        return body
+
+    def standings(self, year):
+        entry = self.season(year)
+        if entry is None:
+            return None
+        season = entry["season"]
+        return json.dumps(
+            {
+                "year": year,
+                "race_names": season["race_names"],
+                "driver_names": season["driver_names"],
+                "cumulative": season["cumulative"].tolist(),
+                "team_names": season["team_names"],
+                "team_cumulative": season["team_cumulative"].tolist(),
+            }
+        ).encode()
+
+    def refresh_loop(self, year, interval, stop):
+        while not stop.wait(interval):
+            try:
+                if self.refresh(year):
+                    logger.info("Season %s updated", year)
+            except Exception:
+                logger.exception("Refreshing season %s failed", year)
+
+    def stats(self):
+        return {"cache": self.cache.stats(), "metrics": metrics.summary()}
+
+
+def make_handler(service, current_year):
+    class Handler(BaseHTTPRequestHandler):
+        # GET /                              -> redirect to the current season
+        # GET /seasons/<year>.html|.json     -> chart (?top=N for the top N)
+        # GET /seasons/<year>/standings.json -> cumulative points
+        # GET /stats                         -> cache and metrics counters
+        def do_GET(self):
+            start = time.perf_counter()
+            parts = urlsplit(self.path)
+            path = parts.path.strip("/").split("/")
+            try:
+                if parts.path == "/":
+                    self.send_response(302)
+                    self.send_header("Location", f"/seasons/{current_year}.html")
+                    self.end_headers()
+                    return
+                if path == ["stats"]:
+                    self.reply(200, "json", json.dumps(service.stats()).encode())
+                    return
+                if (
+                    len(path) == 3
+                    and path[0] == "seasons"
+                    and path[2] == ("standings.json")
+                ):
+                    body = service.standings(int(path[1]))
+                    self.reply_or_404(body, "json")
+                    return
+                if len(path) == 2 and path[0] == "seasons":
+                    year, _, fmt = path[1].partition(".")
+                    if fmt in CONTENT_TYPES:
+                        top = parse_qs(parts.query).get("top")
+                        body = service.chart(
+                            int(year), fmt, int(top[0]) if top else None
+                        )
+                        self.reply_or_404(body, fmt)
+                        return
+                self.reply(404, "json", b'{"error": "not found"}')
+            except requests.exceptions.RequestException:
+                logger.exception("Building %s failed", self.path)
+                self.reply(502, "json", b'{"error": "upstream API unavailable"}')
+            except ValueError:
+                self.reply(400, "json", b'{"error": "bad request"}')
+            except Exception:
+                logger.exception("Building %s failed", self.path)
+                self.reply(500, "json", b'{"error": "internal error"}')
+            finally:
+                metrics.record_time("request", time.perf_counter() - start)
+
+        def reply_or_404(self, body, fmt):
+            if body is None:
+                self.reply(404, "json", b'{"error": "no results for this season"}')
+            else:
+                self.reply(200, fmt, body)
+
+        def reply(self, status, fmt, body):
+            self.send_response(status)
+            self.send_header("Content-Type", CONTENT_TYPES[fmt])
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+    return Handler
+
+
+def serve(
+    options,
+    host="127.0.0.1",
+    port=main.SERVE_PORT,
+    cache_mb=main.SERVE_CACHE_MB,
+    refresh_interval=main.SERVE_REFRESH_INTERVAL,
+    chart_mode="cdn",
+):
+    current_year = datetime.now().year
+    service = ChartService(options, chart_mode=chart_mode, max_bytes=cache_mb << 20)
+    server = ThreadingHTTPServer((host, port), make_handler(service, current_year))
+    server.daemon_threads = True
+    stop = threading.Event()
+    if refresh_interval:
+        threading.Thread(
+            target=service.refresh_loop,
+            args=(current_year, refresh_interval, stop),
+            daemon=True,
+        ).start()
+    logger.info("Serving charts on http://%s:%d/", host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
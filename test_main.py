@@ -1,16 +1,45 @@
 import unittest
+import importlib.util
 from unittest.mock import patch, MagicMock
 import main
+import multiprocessing
 import os
+import io
+import copy
+import pickle
 import json
+import tempfile
+import warnings
+import numpy as np
+import bench_startup
+import server
+from mock_openf1 import MockOpenF1
+
+
+def migrate_json_cache(cache_dir):
+    # Pool worker: open the cache database and import the JSON cache
+    from cache_store import SQLiteCache
+
+    store = SQLiteCache(os.path.join(cache_dir, main.SQLITE_CACHE_FILE))
+    try:
+        return store.migrate_json_dir(cache_dir, main.DRIVER_CACHE_FILE)
+    finally:
+        store.close()
 
 
 class TestMain(unittest.TestCase):
     def setUp(self):
         self.cache_dir = main.CACHE_DIR
         os.makedirs(self.cache_dir, exist_ok=True)
+        # Fresh client per test, without rate limiting
+        client_patch = patch.object(
+            main, "_http_client", main.OpenF1Client(rate_limits=())
+        )
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
 
     def tearDown(self):
+        main.close_cache_store()
         # Clean up cache files created during tests
         for f in os.listdir(self.cache_dir):
             os.remove(os.path.join(self.cache_dir, f))
@@ -22,6 +51,86 @@ class TestMain(unittest.TestCase):
         loaded = main.load_cache(fname)
         self.assertEqual(data, loaded)
 
+    def test_save_cache_is_atomic(self):
+        fname = "atomic_cache.json"
+        main.save_cache(fname, {"foo": "bar"})
+        # A failing write leaves the previous file intact and no temp files
+        with self.assertRaises(TypeError):
+            main.save_cache(fname, {"foo": object()})
+        self.assertEqual(main.load_cache(fname), {"foo": "bar"})
+        self.assertFalse([f for f in os.listdir(self.cache_dir) if f.endswith(".tmp")])
+
+    def test_cache_locks_use_a_fixed_set_of_files(self):
+        for session_key in range(100):
+            main.save_cache(
+                main.RACE_RESULT_CACHE_PATTERN.format(session_key=session_key), []
+            )
+        locks = [f for f in os.listdir(self.cache_dir) if f.startswith(".lock-")]
+        self.assertLessEqual(len(locks), main.CACHE_LOCK_FILES)
+        self.assertFalse([f for f in os.listdir(self.cache_dir) if f.endswith(".lock")])
+
+    def test_save_driver_names_concurrent(self):
+        names = [{f"{n}:1": f"Driver {n}"} for n in range(20)]
+        with main.ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(main.save_driver_names, names))
+        cache = main.load_cache(main.DRIVER_CACHE_FILE)
+        self.assertEqual(len(cache), 20)
+
+    def test_sqlite_cache_backend(self):
+        with patch.object(main, "CACHE_BACKEND", "sqlite"):
+            main.save_cache("season_2025_races.json", [{"session_key": 1}])
+            main.save_cache("race_result_1.json", [{"driver_number": 44}])
+            self.assertEqual(
+                main.load_cache("season_2025_races.json"), [{"session_key": 1}]
+            )
+            self.assertIsNone(main.load_cache("nonexistent_cache.json"))
+            store = main.get_cache_store()
+            self.assertEqual(store.get_race_results([1]), {1: [{"driver_number": 44}]})
+            main.save_driver_names({"44:1": "Lewis Hamilton"})
+            self.assertEqual(
+                main.load_driver_names(["44:1", "33:1"]), {"44:1": "Lewis Hamilton"}
+            )
+        # Nothing was written as individual JSON files
+        self.assertFalse(
+            os.path.exists(os.path.join(self.cache_dir, "season_2025_races.json"))
+        )
+
+    def test_sqlite_cache_migrates_json_files(self):
+        main.save_cache("race_result_9.json", [{"driver_number": 1}])
+        main.save_cache(main.DRIVER_CACHE_FILE, {"1:9": "Max Verstappen"})
+        with patch.object(main, "CACHE_BACKEND", "sqlite"):
+            self.assertEqual(
+                main.load_cache("race_result_9.json"), [{"driver_number": 1}]
+            )
+            self.assertEqual(main.load_driver_names(["1:9"]), {"1:9": "Max Verstappen"})
+            # The import only runs once per database
+            self.assertEqual(
+                main.get_cache_store().migrate_json_dir(
+                    self.cache_dir, main.DRIVER_CACHE_FILE
+                ),
+                0,
+            )
+
+    def test_sqlite_cache_concurrent_migration(self):
+        for n in range(20):
+            main.save_cache(f"race_result_{n}.json", [{"driver_number": n}])
+        # Fresh interpreters, like separate runs of main.py
+        with main.ProcessPoolExecutor(
+            max_workers=4, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            migrated = list(executor.map(migrate_json_cache, [self.cache_dir] * 4))
+        # Exactly one process imported the files, none failed
+        self.assertEqual(sorted(migrated), [0, 0, 0, 20])
+
+    def test_sqlite_race_results_batched(self):
+        main.save_cache("race_result_1.json", [{"driver_number": 44}])
+        with patch.object(main, "CACHE_BACKEND", "sqlite"):
+            with patch.object(main, "get_race_results") as fetch:
+                fetch.return_value = []
+                results = main.get_race_results_many([1, 2])
+        self.assertEqual(results, {1: [{"driver_number": 44}], 2: []})
+        fetch.assert_called_once_with(2, max_retries=3)
+
     def test_country_code_to_flag_standard(self):
         self.assertEqual(main.country_code_to_flag("GB"), "🇬🇧")
         self.assertEqual(main.country_code_to_flag("DE"), "🇩🇪")
@@ -32,12 +141,21 @@ class TestMain(unittest.TestCase):
         self.assertEqual(main.country_code_to_flag("MON"), "🇲🇨")
         self.assertEqual(main.country_code_to_flag("UAE"), "🇦🇪")
 
+    def test_country_code_to_flag_iso_alpha3(self):
+        self.assertEqual(main.country_code_to_flag("ITA"), "🇮🇹")
+        self.assertEqual(main.country_code_to_flag("aus"), "🇦🇺")
+
+    def test_flag_table_info(self):
+        info = main.flag_table_info()
+        self.assertGreater(info["entries"], 240)
+        self.assertGreater(info["bytes"], 0)
+
     def test_country_code_to_flag_invalid(self):
         self.assertEqual(main.country_code_to_flag(None), "")
         self.assertEqual(main.country_code_to_flag("ZZZ"), "")
         self.assertEqual(main.country_code_to_flag("123"), "")
 
-    @patch("main.requests.get")
+    @patch("main.requests.Session.get")
     def test_get_races_and_results(self, mock_get):
         # Mock race sessions
         mock_get.return_value.status_code = 200
@@ -58,7 +176,111 @@ class TestMain(unittest.TestCase):
         self.assertEqual(len(results), 2)
         self.assertEqual(results[0]["driver_number"], 44)
 
-    @patch("main.requests.get")
+    @patch("main.requests.Session.get")
+    def test_get_races_uses_fresh_cache(self, mock_get):
+        year = main.datetime.now().year
+        main.save_cache(
+            main.SEASON_CACHE_PATTERN.format(year=year),
+            [{"session_key": 1, "date_start": f"{year}-03-01"}],
+        )
+        main.save_cache(
+            main.SEASON_META_PATTERN.format(year=year),
+            {"fetched_at": main.time.time()},
+        )
+        races = main.get_races(year)
+        self.assertEqual(len(races), 1)
+        mock_get.assert_not_called()
+
+    @patch("main.requests.Session.get")
+    def test_get_races_revalidates_stale_cache_incrementally(self, mock_get):
+        year = main.datetime.now().year
+        main.save_cache(
+            main.SEASON_CACHE_PATTERN.format(year=year),
+            [{"session_key": 1, "date_start": f"{year}-03-01T15:00:00+00:00"}],
+        )
+        main.save_cache(
+            main.SEASON_META_PATTERN.format(year=year),
+            {"fetched_at": main.time.time() - 2 * main.SEASON_CACHE_TTL},
+        )
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {"ETag": '"abc"'}
+        mock_get.return_value.json.return_value = [
+            {"session_key": 2, "date_start": f"{year}-04-01T15:00:00+00:00"}
+        ]
+        races = main.get_races(year)
+        self.assertEqual([r["session_key"] for r in races], [1, 2])
+        url = mock_get.call_args[0][0]
+        self.assertIn(f"date_start>{year}-03-01T15%3A00%3A00%2B00%3A00", url)
+        meta = main.load_cache(main.SEASON_META_PATTERN.format(year=year))
+        self.assertEqual(meta["etag"], '"abc"')
+
+        # Nothing changed upstream: conditional request answered with 304
+        meta["fetched_at"] -= 2 * main.SEASON_CACHE_TTL
+        meta["path"] = meta["path"].replace("03-01", "04-01")
+        main.save_cache(main.SEASON_META_PATTERN.format(year=year), meta)
+        mock_get.return_value.status_code = 304
+        races = main.get_races(year)
+        self.assertEqual(len(races), 2)
+        self.assertEqual(mock_get.call_args[1]["headers"], {"If-None-Match": '"abc"'})
+
+    def test_season_cache_is_fresh(self):
+        now = main.time.time()
+        year = main.datetime.now().year
+        self.assertTrue(main.season_cache_is_fresh(year, {"fetched_at": now}, 60))
+        self.assertFalse(
+            main.season_cache_is_fresh(year, {"fetched_at": now - 120}, 60, now)
+        )
+        # Fetched after the season ended: never stale
+        finished = {"fetched_at": main.datetime(year, 1, 2).timestamp()}
+        self.assertTrue(main.season_cache_is_fresh(year - 1, finished, 0))
+        # Legacy cache without metadata
+        self.assertTrue(main.season_cache_is_fresh(year - 1, None, 0))
+        self.assertFalse(main.season_cache_is_fresh(year, None, 0))
+
+    @patch("main.requests.Session.get")
+    def test_get_race_results_many(self, mock_get):
+        main.save_cache(
+            main.RACE_RESULT_CACHE_PATTERN.format(session_key=1),
+            [{"driver_number": 1, "position": 1}],
+        )
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = [{"driver_number": 44, "position": 1}]
+        results = main.get_race_results_many([1, 2, 3, 2], max_workers=2)
+        self.assertEqual(list(results), [1, 2, 3])
+        self.assertEqual(results[1][0]["driver_number"], 1)
+        self.assertEqual(results[3][0]["driver_number"], 44)
+        # Only the two uncached sessions hit the API
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("main.requests.Session.get")
+    def test_get_race_results_many_projected(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = [
+            {
+                "driver_number": 44,
+                "position": 1,
+                "points": 25,
+                "gap_to_leader": 0,
+                "duration": 5400.1,
+            },
+            {"driver_number": 33, "position": None, "dnf": True},
+        ]
+        results = main.get_race_results_many([1], project=True)[1]
+        self.assertEqual(results[0], main.RaceResult(44, 1, 25))
+        self.assertFalse(hasattr(results[0], "__dict__"))
+        self.assertEqual(results[1].get("points", 0), 0)
+        self.assertIsNone(results[1].get("position"))
+        # Fields only: tuple methods are not row keys
+        self.assertIsNone(results[0].get("count"))
+        self.assertEqual(results[0].get("index", "missing"), "missing")
+        # Records cross process boundaries (pool workers) intact
+        self.assertEqual(pickle.loads(pickle.dumps(results)), results)
+        self.assertEqual(copy.deepcopy(results[0]), results[0])
+        # The raw payload is still what ends up in the cache
+        cached = main.load_cache(main.RACE_RESULT_CACHE_PATTERN.format(session_key=1))
+        self.assertEqual(cached[0]["duration"], 5400.1)
+
+    @patch("main.requests.Session.get")
     def test_get_driver_map(self, mock_get):
         # Mock driver API response
         mock_get.return_value.status_code = 200
@@ -67,6 +289,23 @@ class TestMain(unittest.TestCase):
         driver_map = main.get_driver_map(pairs)
         self.assertEqual(driver_map[("44", "1")], "Lewis Hamilton")
 
+    @patch("main.requests.Session.get")
+    def test_get_driver_map_by_session(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = [
+            {"driver_number": 44, "full_name": "Lewis Hamilton"},
+            {"driver_number": 1, "broadcast_name": "M VERSTAPPEN"},
+        ]
+        pairs = [(44, 7), (1, 7), (99, 7)]
+        driver_map = main.get_driver_map(pairs, by_session=True)
+        # One request for the whole session instead of one per driver
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(driver_map[("44", "7")], "Lewis Hamilton")
+        self.assertEqual(driver_map[("1", "7")], "M VERSTAPPEN")
+        self.assertEqual(driver_map[("99", "7")], "99")
+        cache = main.load_cache(main.DRIVER_CACHE_FILE)
+        self.assertEqual(cache["44:7"], {"name": "Lewis Hamilton"})
+
     def test_calculate_standings(self):
         # Use sample races and driver map
         races = [
@@ -74,18 +313,19 @@ class TestMain(unittest.TestCase):
             {"session_key": 2, "meeting_name": "Test GP2"},
         ]
         driver_map = {"44": "Lewis Hamilton", "33": "Max Verstappen"}
-        # Patch get_race_results to return fixed results with 'points' field
-        with patch("main.get_race_results") as mock_results:
-            mock_results.side_effect = [
-                [
-                    {"driver_number": 44, "position": 1, "points": 25},
-                    {"driver_number": 33, "position": 2, "points": 18},
-                ],
-                [
-                    {"driver_number": 33, "position": 1, "points": 25},
-                    {"driver_number": 44, "position": 2, "points": 18},
-                ],
-            ]
+        results = {
+            1: [
+                {"driver_number": 44, "position": 1, "points": 25},
+                {"driver_number": 33, "position": 2, "points": 18},
+            ],
+            2: [
+                {"driver_number": 33, "position": 1, "points": 25},
+                {"driver_number": 44, "position": 2, "points": 18},
+            ],
+        }
+        with patch(
+            "main.get_race_results", side_effect=lambda key, **kwargs: results[key]
+        ) as mock_results:
             standings, race_names, driver_names = main.calculate_standings(
                 races, driver_map
             )
@@ -93,6 +333,918 @@ class TestMain(unittest.TestCase):
             self.assertEqual(standings[-1]["Max Verstappen"], 43)  # 18+25
             self.assertIn("Test GP", race_names[0])
             self.assertIn("Lewis Hamilton", driver_names)
+            # Each result set is fetched once
+            self.assertEqual(mock_results.call_count, 2)
+
+    def test_calculate_standings_uses_points_table(self):
+        races = [{"session_key": 1, "meeting_name": "Test GP"}]
+        # API points disagree with the finishing order; the points table wins,
+        # as in the main pipeline
+        with patch(
+            "main.get_race_results",
+            return_value=[
+                {"driver_number": 44, "position": 2, "points": 25},
+                {"driver_number": 33, "position": 1, "points": 0},
+            ],
+        ):
+            standings, _, _ = main.calculate_standings(races, {})
+        self.assertEqual(standings, [{"44": 18, "33": 25}])
+
+    def test_calculate_standings_merges_sprint_weekends(self):
+        races = [
+            {"session_key": 1, "meeting_key": 10, "meeting_name": "GP1"},
+            {
+                "session_key": 2,
+                "meeting_key": 11,
+                "meeting_name": "GP2",
+                "session_name": "Sprint",
+                "year": 2022,
+            },
+            {"session_key": 3, "meeting_key": 11, "meeting_name": "GP2"},
+        ]
+        results = {
+            1: [{"driver_number": 44, "position": 1}],
+            2: [{"driver_number": 44, "position": 1}],
+            3: [{"driver_number": 44, "position": 1}],
+        }
+        with patch(
+            "main.get_race_results", side_effect=lambda key, **kwargs: results[key]
+        ):
+            standings, race_names, _ = main.calculate_standings(races, {})
+        # One row per meeting, after its last session
+        self.assertEqual(race_names, ["GP1", "GP2"])
+        self.assertEqual(standings, [{"44": 25}, {"44": 25 + 8 + 25}])
+
+    def test_standings_snapshot_is_incremental(self):
+        race_results = [
+            (
+                {"session_key": 1, "meeting_name": "GP1"},
+                [
+                    {"driver_number": 44, "position": 1},
+                    {"driver_number": 33, "position": 2},
+                ],
+            ),
+            (
+                {"session_key": 2, "meeting_name": "GP2"},
+                [
+                    {"driver_number": 33, "position": 1},
+                    {"driver_number": 44, "position": 2},
+                ],
+            ),
+        ]
+        names = {"44": "Lewis Hamilton", "33": "Max Verstappen"}
+        main.score_season(2025, race_results, names)
+        snapshot = main.load_cache(main.STANDINGS_CACHE_PATTERN.format(year=2025))
+        self.assertEqual(snapshot["progression"], [[25, 18], [43, 43]])
+        # Whole points stay integers (25, not 25.0)
+        self.assertEqual(
+            {type(v) for row in snapshot["progression"] for v in row}, {int}
+        )
+
+        # Only the new race is scored: earlier results are not looked at again
+        race_results[0] = (race_results[0][0], [])
+        race_results.append(
+            (
+                {"session_key": 3, "meeting_name": "GP3"},
+                [
+                    {"driver_number": 1, "position": 1},
+                    {"driver_number": 44, "position": None},
+                ],
+            )
+        )
+        season = main.score_season(2025, race_results, names)
+        self.assertEqual(
+            season["driver_names"], ["Lewis Hamilton", "Max Verstappen", "1"]
+        )
+        self.assertEqual(season["cumulative"][-1].tolist(), [61, 43, 25])
+        snapshot = main.load_cache(main.STANDINGS_CACHE_PATTERN.format(year=2025))
+        self.assertEqual(snapshot["progression"][1], [43, 43])
+
+        # A snapshot that no longer matches the races is recomputed
+        season = main.score_season(2025, race_results[1:], names)
+        final = dict(zip(season["driver_names"], season["cumulative"][-1].tolist()))
+        self.assertEqual(final["Lewis Hamilton"], 36)
+        self.assertEqual(season["cumulative"].dtype.kind, "i")
+
+    def test_standings_snapshot_dtype(self):
+        race = (
+            {"session_key": 1},
+            [{"driver_number": 44, "position": 1, "points": 25}],
+        )
+        rules = main.SCORING_RULES["2022"]
+        snapshot = main.update_standings_snapshot(None, [race], rules)
+        self.assertEqual(snapshot["progression"], [[25]])
+        self.assertIsInstance(snapshot["progression"][0][0], int)
+        # Half points make the season fractional, and it stays so
+        with patch.dict(main.POINTS_SCALE, {2: 0.5}):
+            second = ({"session_key": 2}, race[1])
+            snapshot = main.update_standings_snapshot(None, [race, second], rules)
+            self.assertEqual(snapshot["progression"], [[25.0], [37.5]])
+            third = ({"session_key": 3}, race[1])
+            snapshot = main.update_standings_snapshot(
+                snapshot, [race, second, third], rules
+            )
+        self.assertEqual(snapshot["progression"][-1], [62.5])
+
+    def test_render_key_covers_points(self):
+        race = {"session_key": 1, "meeting_name": "GP1"}
+        results = [{"driver_number": 44, "position": 1, "points": 25}]
+        key = main.render_key([(race, results)], {}, None, "t", "inline")
+        # A fastest-lap point changes the standings, so it changes the key
+        bonus = [dict(results[0], points=26)]
+        self.assertNotEqual(
+            main.render_key([(race, bonus)], {}, None, "t", "inline"), key
+        )
+
+    def test_points_matrix(self):
+        race_results = [
+            (
+                {"session_key": 1},
+                [
+                    {"driver_number": 33, "position": None},
+                    {"driver_number": 44, "position": 2},
+                    {"driver_number": 16, "position": 1},
+                ],
+            ),
+            ({"session_key": 2}, [{"driver_number": 33, "position": 1}]),
+        ]
+        drivers, matrix = main.points_matrix(race_results)
+        self.assertEqual(drivers, ["33", "44", "16"])
+        self.assertEqual(matrix.tolist(), [[15, 18, 25], [25, 0, 0]])
+        self.assertEqual(matrix.cumsum(axis=0)[-1].tolist(), [40, 18, 25])
+
+    def test_standings_dataframe(self):
+        df = main.standings_dataframe(
+            ["GP1", "GP2"],
+            ["Max Verstappen", "Lewis Hamilton", "Max Verstappen"],
+            [[10, 25, 0], [10, 43, 25]],
+        )
+        self.assertEqual(list(df.columns), ["Race", "Driver", "Points"])
+        # Same name merged, legend ordered by final points
+        self.assertEqual(
+            list(df["Driver"].unique()), ["Lewis Hamilton", "Max Verstappen"]
+        )
+        self.assertEqual(df["Points"].tolist(), [25, 43, 10, 35])
+
+    def test_parse_years(self):
+        self.assertEqual(main.parse_years("2018-2020"), [2018, 2019, 2020])
+        self.assertEqual(main.parse_years("2023, 2021,2021-2022"), [2021, 2022, 2023])
+        with self.assertRaises(main.argparse.ArgumentTypeError):
+            main.parse_years("20x8")
+
+    def test_combine_seasons(self):
+        seasons = [
+            {
+                "year": 2023,
+                "race_names": ["GP1", "GP2"],
+                "driver_names": ["A", "B"],
+                "cumulative": np.array([[25, 18], [43, 43]]),
+            },
+            {
+                "year": 2024,
+                "race_names": ["GP1"],
+                "driver_names": ["C", "A"],
+                "cumulative": np.array([[25, 18]]),
+            },
+        ]
+        combined = main.combine_seasons(seasons)
+        self.assertEqual(combined["year"], "2023-2024")
+        self.assertEqual(combined["race_names"], ["2023 GP1", "2023 GP2", "2024 GP1"])
+        self.assertEqual(combined["driver_names"], ["A", "B", "C"])
+        self.assertEqual(
+            combined["cumulative"].tolist(), [[25, 18, 0], [43, 43, 0], [61, 43, 25]]
+        )
+
+    def test_chart_seasons(self):
+        with (
+            patch(
+                "main.get_races",
+                side_effect=lambda year, **kwargs: [
+                    {"session_key": year, "meeting_name": "Test GP"}
+                ],
+            ),
+            patch(
+                "main.get_race_results",
+                return_value=[{"driver_number": 44, "position": 1}],
+            ),
+            patch("main.get_driver_map", return_value={}),
+            patch("main.plot_standings_dataframe") as mock_plot,
+            tempfile.TemporaryDirectory() as out,
+        ):
+            seasons = main.chart_seasons(
+                [2023, 2024],
+                {"force_update": True},
+                workers=1,
+                combined=True,
+                output_dir=out,
+            )
+        self.assertEqual([season["year"] for season in seasons], [2023, 2024])
+        outputs = [call.kwargs["output"] for call in mock_plot.call_args_list]
+        self.assertEqual(
+            outputs,
+            [
+                os.path.join(out, "f1_standings_2023.html"),
+                os.path.join(out, "f1_standings_2024.html"),
+                os.path.join(out, "f1_standings_2023-2024.html"),
+            ],
+        )
+
+    def test_worker_rate_limits_stay_within_the_limits(self):
+        # Every worker sends requests back to back from the start; no window
+        # of one period, the first one included, may see more than the limit
+        for rate, per in [(3, 1.0), (30, 60.0)]:
+            for workers in (1, 2, 3, 8, 40):
+                clock = [0.0]
+                with patch.object(main.time, "monotonic", lambda: clock[0]):
+                    buckets = [
+                        main.TokenBucket(
+                            *main.worker_rate_limits(workers, [(rate, per)], i)[0]
+                        )
+                        for i in range(workers)
+                    ]
+                    ready = [0.0] * workers
+                    sent = []
+                    while min(ready) < 3 * per:
+                        i = ready.index(min(ready))
+                        clock[0] = ready[i]
+                        wait = buckets[i].reserve()
+                        if wait > 0:
+                            ready[i] += max(wait, 1e-9)  # rounding can leave tiny waits
+                        else:
+                            sent.append(clock[0])
+                for start in [0.0, *sent]:
+                    in_window = [t for t in sent if start <= t < start + per - 1e-9]
+                    self.assertLessEqual(len(in_window), rate, (rate, workers, start))
+                # ... while the pool as a whole still gets the full rate
+                self.assertGreaterEqual(len(sent), 3 * rate)
+        self.assertEqual(main.worker_rate_limits(8, [(3, 1.0)]), [(1, 8 / 3, 1)])
+
+    def test_chart_seasons_in_worker_processes(self):
+        with MockOpenF1(seasons=[2021, 2022], races_per_season=2) as mock:
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with patch.object(main, "_http_client", client):
+                for year in (2021, 2022):
+                    main.load_season(year)
+        # Both seasons are cached; the workers read and render them. Earlier
+        # tests may have started native (pyarrow, numpy) threads before the
+        # pool forks.
+        with tempfile.TemporaryDirectory() as out, warnings.catch_warnings():
+            warnings.filterwarnings("ignore", "This process .* is multi-threaded")
+            seasons = main.chart_seasons(
+                [2021, 2022], {}, workers=2, output_dir=out, output_mode="cdn"
+            )
+            self.assertEqual([season["year"] for season in seasons], [2021, 2022])
+            self.assertEqual(
+                sorted(os.listdir(out)),
+                [
+                    "f1_standings_2021.html",
+                    "f1_standings_2022.html",
+                    main.RENDER_MANIFEST_FILE,
+                ],
+            )
+            # Both workers recorded their chart in the shared manifest
+            manifest = main.load_render_manifest(
+                os.path.join(out, main.RENDER_MANIFEST_FILE)
+            )
+            self.assertEqual(
+                sorted(manifest), ["f1_standings_2021.html", "f1_standings_2022.html"]
+            )
+            specs = [
+                {"season": 2022, "filter": {"top": 2}},
+                {"season": 2022, "filter": {"top": 3}},
+            ]
+            rendered, _ = main.render_batch(
+                specs, {}, output_dir=out, output_mode="cdn", workers=2
+            )
+            self.assertEqual(
+                rendered,
+                [
+                    os.path.join(out, "f1_standings_2022_top2.html"),
+                    os.path.join(out, "f1_standings_2022_top3.html"),
+                ],
+            )
+            self.assertTrue(all(os.path.exists(path) for path in rendered))
+
+    def test_render_batch_skips_unchanged_charts(self):
+        loaded = (
+            [
+                (
+                    {"session_key": 1, "meeting_name": "GP1", "year": 2024},
+                    [
+                        main.RaceResult(1, 1, None),
+                        main.RaceResult(2, 2, None),
+                        main.RaceResult(3, 3, None),
+                    ],
+                ),
+                (
+                    {"session_key": 2, "meeting_name": "GP2", "year": 2024},
+                    [
+                        main.RaceResult(2, 1, None),
+                        main.RaceResult(1, 2, None),
+                        main.RaceResult(3, 3, None),
+                    ],
+                ),
+            ],
+            {"1": "A", "2": "B", "3": "C"},
+            {},
+        )
+        specs = [
+            {"season": 2024, "filter": {"top": 2}},
+            {"season": 2024, "filter": {"drivers": ["C"]}, "output": "c.html"},
+        ]
+        with (
+            tempfile.TemporaryDirectory() as out,
+            patch("main.load_season", return_value=loaded) as mock_load,
+            patch("main.score_season", wraps=main.score_season) as mock_score,
+            patch("main.plot_standings_dataframe") as mock_plot,
+        ):
+            rendered, skipped = main.render_batch(specs, {}, output_dir=out, workers=1)
+            # The season is loaded and scored once for both charts
+            mock_load.assert_called_once_with(2024)
+            self.assertEqual(mock_score.call_count, 1)
+            self.assertEqual(
+                rendered,
+                [
+                    os.path.join(out, "f1_standings_2024_top2.html"),
+                    os.path.join(out, "c.html"),
+                ],
+            )
+            self.assertEqual(skipped, [])
+            frame = mock_plot.call_args_list[0].args[0]
+            self.assertEqual(sorted(frame["Driver"].unique()), ["A", "B"])
+            for path in rendered:
+                open(path, "w").close()
+            rendered, skipped = main.render_batch(specs, {}, output_dir=out, workers=1)
+            self.assertEqual(rendered, [])
+            self.assertEqual(len(skipped), 2)
+            # Unchanged charts are found from the inputs, without scoring
+            self.assertEqual(mock_score.call_count, 1)
+
+    def test_render_season_skips_identical_chart(self):
+        with tempfile.TemporaryDirectory() as out:
+            output = os.path.join(out, "chart.html")
+
+            def write_output(df, output, **kwargs):
+                open(output, "w").close()
+
+            with (
+                patch(
+                    "main.get_races",
+                    return_value=[{"session_key": 1, "meeting_name": "Test GP"}],
+                ),
+                patch(
+                    "main.get_race_results",
+                    return_value=[{"driver_number": 44, "position": 1}],
+                ),
+                patch("main.get_driver_map", return_value={("44", "1"): "A"}),
+                patch(
+                    "main.plot_standings_dataframe", side_effect=write_output
+                ) as mock_plot,
+            ):
+                main.render_season(2025, {}, output=output)
+                with patch("main.score_season") as mock_score:
+                    main.render_season(2025, {}, output=output)
+                    # Cache hit: nothing is scored or plotted
+                    mock_score.assert_not_called()
+                mock_plot.assert_called_once()
+                # A different title is a different chart
+                main.render_season(2025, {}, output=output, title="Other")
+                self.assertEqual(mock_plot.call_count, 2)
+            # One render cache: the manifest next to the chart, as for batches
+            manifest = main.load_render_manifest(
+                os.path.join(out, main.RENDER_MANIFEST_FILE)
+            )
+            self.assertEqual(list(manifest), ["chart.html"])
+            self.assertFalse(
+                [f for f in os.listdir(self.cache_dir) if f.startswith("render_")]
+            )
+
+    def test_build_season_against_mock_server(self):
+        with MockOpenF1(seasons=[2024], races_per_season=2) as mock:
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with patch.object(main, "_http_client", client):
+                season = main.build_season(2024)
+                # sessions + one session_result and one /drivers per race
+                self.assertEqual(mock.stats["requests"], 5)
+                self.assertEqual(len(season["race_names"]), 2)
+                self.assertIn("Driver 5", season["driver_names"])
+                mock.reset_stats()
+                main.build_season(2024)
+                self.assertEqual(mock.stats["requests"], 0)
+
+    def test_client_retries_injected_rate_limits(self):
+        with MockOpenF1(rate_limit_ratio=1.0) as mock:
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with self.assertRaises(main.requests.exceptions.HTTPError):
+                client.get_json("/sessions?year=2024", max_retries=3)
+            self.assertEqual(mock.stats["429"], 3)
+
+    def test_metrics_count_stages_requests_and_cache(self):
+        main.metrics.reset()
+        with MockOpenF1(seasons=[2024], races_per_season=2) as mock:
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with patch.object(main, "_http_client", client):
+                main.build_season(2024)
+        counters = main.metrics.summary()["counters"]
+        self.assertEqual(counters["http.requests"], 5)
+        self.assertGreater(counters["http.bytes"], 0)
+        self.assertGreater(counters["cache.misses"], 0)
+        for stage in ("fetch_seasons", "fetch_results", "driver_map", "compute"):
+            self.assertEqual(main.metrics.calls[stage], 1)
+        self.assertIn("HTTP: 5 requests", main.metrics.format_summary())
+
+    def test_json_lines_logging(self):
+        stream = io.StringIO()
+        main.configure_logging("json", stream=stream)
+        self.addCleanup(main.logger.handlers.clear)
+        with main.metrics.stage("compute", year=2024):
+            main.logger.info("Fetching F1 %s season data...", 2024)
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(lines[0]["message"], "Fetching F1 2024 season data...")
+        self.assertEqual(lines[1]["event"], "stage")
+        self.assertEqual(lines[1]["stage"], "compute")
+        self.assertEqual(lines[1]["year"], 2024)
+
+    @unittest.skipUnless(importlib.util.find_spec("httpx"), "httpx not installed")
+    def test_async_api_shares_in_flight_requests(self):
+        import asyncio
+        import async_api
+
+        async def run(url):
+            async with async_api.AsyncOpenF1Client(base_url=url, rate_limits=()) as c:
+                first, second = await asyncio.gather(
+                    async_api.async_get_races(2024, client=c),
+                    async_api.async_get_races(2024, client=c),
+                )
+                season = await async_api.async_load_season(2024, client=c)
+            return first, second, season
+
+        with MockOpenF1(seasons=[2024], races_per_season=2, latency=0.05) as mock:
+            first, second, season = asyncio.run(run(mock.url))
+            # Both callers got the season from a single upstream request
+            self.assertEqual(mock.stats["/v1/sessions"], 1)
+            self.assertEqual(first, second)
+            self.assertEqual(len(season[0]), 2)
+            self.assertEqual(season[1]["5"], "Driver 5")
+            self.assertEqual(mock.stats["/v1/drivers"], 2)
+
+    @unittest.skipUnless(importlib.util.find_spec("httpx"), "httpx not installed")
+    def test_async_api_shares_sync_limits_and_keeps_io_off_the_loop(self):
+        import asyncio
+        import threading
+        import async_api
+
+        loop_threads = set()
+        io_threads = []
+        load_cache = main.load_cache
+
+        def tracked_load_cache(filename):
+            io_threads.append(threading.current_thread())
+            return load_cache(filename)
+
+        async def run(url):
+            loop_threads.add(threading.current_thread())
+            async with async_api.AsyncOpenF1Client(base_url=url) as c:
+                # One token budget for sync and async requests
+                self.assertIs(c.buckets, main.get_http_client().buckets)
+                return await async_api.async_load_season(2024, client=c)
+
+        with (
+            MockOpenF1(seasons=[2024], races_per_season=2) as mock,
+            patch.object(async_api, "load_cache", tracked_load_cache),
+            patch.object(main, "load_cache", tracked_load_cache),
+        ):
+            season = asyncio.run(run(mock.url))
+        self.assertEqual(len(season[0]), 2)
+        self.assertTrue(io_threads)
+        self.assertFalse(loop_threads & set(io_threads))
+
+    @unittest.skipUnless(importlib.util.find_spec("httpx"), "httpx not installed")
+    def test_async_races_revalidate_with_304(self):
+        import asyncio
+        import async_api
+        import httpx
+
+        year = main.datetime.now().year
+        sessions = [{"session_key": 1, "date_start": f"{year}-03-01T15:00:00+00:00"}]
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, json=sessions, headers={"ETag": '"v1"'})
+
+        async def run():
+            async with async_api.AsyncOpenF1Client(rate_limits=()) as c:
+                c.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+                first = await async_api.async_get_races(year, ttl=0, client=c)
+                await async_api.async_get_races(year, ttl=0, client=c)
+                meta = main.load_cache(main.SEASON_META_PATTERN.format(year=year))
+                main.save_cache(
+                    main.SEASON_META_PATTERN.format(year=year),
+                    dict(meta, fetched_at=0),
+                )
+                third = await async_api.async_get_races(year, ttl=0, client=c)
+            return first, third
+
+        main.metrics.reset()
+        first, third = asyncio.run(run())
+        self.assertEqual(third, first)
+        self.assertEqual(requests_seen[-1].headers["If-None-Match"], '"v1"')
+        counters = main.metrics.snapshot()["counters"]
+        self.assertEqual(counters.get("http.not_modified"), 1)
+        self.assertNotIn("http.errors", counters)
+        # The 304 counts as a fetch: the season is fresh again
+        meta = main.load_cache(main.SEASON_META_PATTERN.format(year=year))
+        self.assertGreater(meta["fetched_at"], 0)
+
+    @unittest.skipUnless(importlib.util.find_spec("httpx"), "httpx not installed")
+    def test_async_client_retries_without_blocking(self):
+        import asyncio
+        import async_api
+        import httpx
+
+        async def run(url):
+            async with async_api.AsyncOpenF1Client(base_url=url, rate_limits=()) as c:
+                ticks = 0
+
+                async def tick():
+                    nonlocal ticks
+                    while True:
+                        ticks += 1
+                        await asyncio.sleep(0.01)
+
+                ticker = asyncio.ensure_future(tick())
+                try:
+                    with self.assertRaises(httpx.HTTPStatusError):
+                        await c.get_json("/sessions?year=2024", max_retries=2)
+                finally:
+                    ticker.cancel()
+            return ticks
+
+        with MockOpenF1(rate_limit_ratio=1.0, retry_after=0.2) as mock:
+            ticks = asyncio.run(run(mock.url))
+            self.assertEqual(mock.stats["429"], 2)
+            # The event loop kept running during the Retry-After wait
+            self.assertGreater(ticks, 5)
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = server.LRUCache(max_bytes=100)
+        cache.put("a", "A", 40)
+        cache.put("b", "B", 40)
+        self.assertEqual(cache.get("a"), "A")
+        cache.put("c", "C", 40)
+        # "b" was the least recently used entry
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.stats()["bytes"], 80)
+
+    def test_chart_service_caches_and_refreshes(self):
+        with MockOpenF1(seasons=[2024], races_per_season=3) as mock:
+            mock.released[2024] = 2
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with patch.object(main, "_http_client", client):
+                service = server.ChartService({})
+                chart = service.chart(2024, "json")
+                with patch("main.standings_figure") as mock_figure:
+                    self.assertEqual(service.chart(2024, "json"), chart)
+                    mock_figure.assert_not_called()
+                self.assertFalse(service.refresh(2024))
+                mock.released[2024] = 3
+                self.assertTrue(service.refresh(2024))
+                standings = json.loads(service.standings(2024))
+                self.assertEqual(len(standings["race_names"]), 3)
+                self.assertIsNone(service.cache.get(("chart", 2024, "json", None)))
+
+    def test_chart_service_refresh_waits_for_renders(self):
+        import threading
+
+        with MockOpenF1(seasons=[2024], races_per_season=3) as mock:
+            mock.released[2024] = 2
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with patch.object(main, "_http_client", client):
+                service = server.ChartService({})
+                season_figure = main.season_figure
+                refreshes = []
+                refreshed = []
+
+                def render_during_refresh(*args, **kwargs):
+                    # The season changes while its old chart is being rendered
+                    mock.released[2024] = 3
+                    thread = threading.Thread(
+                        target=lambda: refreshed.append(service.refresh(2024))
+                    )
+                    thread.start()
+                    thread.join(0.2)
+                    self.assertTrue(thread.is_alive())
+                    refreshes.append(thread)
+                    return season_figure(*args, **kwargs)
+
+                with patch("main.season_figure", side_effect=render_during_refresh):
+                    service.chart(2024, "json")
+                refreshes[0].join()
+        self.assertEqual(refreshed, [True])
+        # The stale chart was dropped by the refresh, not served afterwards
+        self.assertIsNone(service.cache.get(("chart", 2024, "json", None)))
+
+    def test_server_replies_when_a_build_fails(self):
+        import threading
+        import urllib.error
+        import urllib.request
+
+        service = server.ChartService({})
+        httpd = server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), server.make_handler(service, 2024)
+        )
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+
+        def get(path):
+            url = f"http://127.0.0.1:{httpd.server_address[1]}{path}"
+            try:
+                with urllib.request.urlopen(url) as resp:
+                    return resp.status, json.loads(resp.read())
+            except urllib.error.HTTPError as e:
+                return e.code, json.loads(e.read())
+
+        down = main.requests.exceptions.ConnectionError("API down")
+        with (
+            patch.object(service, "build", side_effect=down),
+            self.assertLogs(main.logger, "ERROR"),
+        ):
+            self.assertEqual(get("/seasons/2024.json")[0], 502)
+        with (
+            patch.object(service, "build", side_effect=RuntimeError("bug")),
+            self.assertLogs(main.logger, "ERROR"),
+        ):
+            status, body = get("/seasons/2024/standings.json")
+        self.assertEqual((status, body), (500, {"error": "internal error"}))
+        with patch("main.load_season", return_value=None) as load_season:
+            # Out of range years never reach the API, empty seasons once
+            self.assertEqual(get("/seasons/1.html")[0], 404)
+            self.assertEqual(get("/seasons/2000.json")[0], 404)
+            self.assertEqual(get("/seasons/2000/standings.json")[0], 404)
+        self.assertEqual(load_season.call_count, 1)
+
+    def test_large_standings_figure_bands_and_thins(self):
+        races = [f"R{i}" for i in range(1000)]
+        drivers = [f"D{i}" for i in range(60)]
+        cumulative = np.cumsum(np.ones((1000, 60), dtype=int) * np.arange(60), axis=0)
+        fig = main.large_standings_figure(races, drivers, cumulative, top_drivers=10)
+        self.assertTrue(all(trace.type == "scattergl" for trace in fig.data))
+        # 10 drivers plus the two edges of the band
+        self.assertEqual(len(fig.data), 12)
+        self.assertEqual(fig.data[0].name, "D59")
+        self.assertEqual(fig.data[-1].name, "Other 50 drivers")
+        self.assertEqual(fig.data[-1].fill, "tonexty")
+        self.assertLessEqual(len(fig.data[0].x), main.LARGE_CHART_MAX_POINTS)
+        self.assertEqual(fig.data[0].x[-1], "R999")
+        self.assertEqual(fig.data[0].mode, "lines")
+
+    def test_plot_season_switches_to_large_chart(self):
+        season = {
+            "race_names": ["R1", "R2"],
+            "driver_names": ["A", "A", "B"],
+            "cumulative": np.array([[1, 2, 3], [4, 5, 6]]),
+        }
+        with patch("main.plot_standings_dataframe") as mock_plot:
+            main.plot_season(season, output="out.json", mode="json")
+            mock_plot.assert_called_once()
+        with (
+            patch.object(main, "LARGE_CHART", "on"),
+            patch("main.write_chart") as mock_write,
+        ):
+            main.plot_season(season, output="out.json", mode="json")
+            fig = mock_write.call_args.args[0]
+            # Drivers sharing a name are drawn as one line
+            self.assertEqual([trace.name for trace in fig.data], ["A", "B"])
+            self.assertEqual(list(fig.data[0].y), [3, 9])
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow not installed")
+    def test_columnar_export_round_trips_season(self):
+        import columnar
+
+        def as_rows(season):
+            all_race_results, names, teams = season
+            return (
+                [(race, list(results)) for race, results in all_race_results],
+                names,
+                teams,
+            )
+
+        with (
+            MockOpenF1(seasons=[2024], races_per_season=4) as mock,
+            patch.object(
+                main,
+                "_http_client",
+                main.OpenF1Client(base_url=mock.url, rate_limits=()),
+            ),
+            tempfile.TemporaryDirectory() as root,
+        ):
+            paths = columnar.export_seasons([2024], {}, root)
+            self.assertIn(
+                os.path.join(root, "results", "year=2024", "part-0.arrow"), paths
+            )
+            loaded = main.load_season(2024)
+            requests_before = mock.stats["requests"]
+            exported = main.load_season(2024, source=root)
+            self.assertEqual(mock.stats["requests"], requests_before)
+            # Results come back as column arrays, scored without records
+            for _, results in exported[0]:
+                self.assertIsInstance(results, main.ResultColumns)
+            self.assertEqual(as_rows(exported), loaded)
+            drivers, matrix = main.points_matrix(exported[0])
+            expected_drivers, expected = main.points_matrix(loaded[0])
+            self.assertEqual(drivers, expected_drivers)
+            self.assertEqual(matrix.tolist(), expected.tolist())
+            # Re-exporting as Parquet replaces the Arrow files, without
+            # fetching the season again
+            columnar.export_season(2024, loaded, root, fmt="parquet")
+            self.assertEqual(mock.stats["requests"], requests_before)
+            self.assertEqual(as_rows(columnar.read_season(2024, root)), loaded)
+            self.assertIsNone(columnar.find_table(root, "results", 2023))
+            self.assertIsNone(columnar.read_season(2023, root))
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow not installed")
+    def test_export_reuses_the_charted_season(self):
+        with (
+            MockOpenF1(seasons=[2024], races_per_season=4) as mock,
+            patch.object(
+                main,
+                "_http_client",
+                main.OpenF1Client(base_url=mock.url, rate_limits=()),
+            ),
+            tempfile.TemporaryDirectory() as root,
+            patch("main.load_season", wraps=main.load_season) as load_season,
+        ):
+            main.chart_seasons(
+                [2024],
+                {},
+                output_dir=root,
+                output_mode="json",
+                export=(os.path.join(root, "export"), "arrow"),
+            )
+            self.assertEqual(load_season.call_count, 1)
+            self.assertTrue(
+                os.path.exists(
+                    os.path.join(root, "export", "drivers", "year=2024", "part-0.arrow")
+                )
+            )
+
+    def test_points_matrices_apply_each_rule_set(self):
+        race = (
+            {"session_key": 1, "year": 2019},
+            [
+                {"driver_number": 44, "position": 1, "points": 25},
+                {"driver_number": 33, "position": 2, "points": 18},
+                # Fastest lap bonus, as reported by the API
+                {"driver_number": 16, "position": 3, "points": 16},
+            ],
+        )
+        sprint = (
+            {"session_key": 2, "year": 2022, "session_name": "Sprint"},
+            [{"driver_number": 33, "position": 1, "points": 8}],
+        )
+        drivers, matrices = main.points_matrices(
+            [race, sprint], [None, "1950", "2010", "2021"]
+        )
+        self.assertEqual(drivers, ["44", "33", "16"])
+        self.assertEqual(matrices[0].tolist(), [[25, 18, 16], [0, 8, 0]])
+        self.assertEqual(matrices[1].tolist(), [[8, 6, 5], [0, 0, 0]])
+        self.assertEqual(matrices[2].tolist(), [[25, 18, 15], [0, 0, 0]])
+        self.assertEqual(matrices[3].tolist(), [[25, 18, 16], [0, 3, 0]])
+        with patch.dict(main.POINTS_SCALE, {1: 0.5}):
+            _, matrix = main.points_matrix([race], "2010")
+        self.assertEqual(matrix.tolist(), [[12.5, 9.0, 7.5]])
+
+    def test_recompute_standings_under_other_rules(self):
+        with MockOpenF1(seasons=[2024], races_per_season=4) as mock:
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with patch.object(main, "_http_client", client):
+                main.load_season(2024)
+        # The API is never asked, not even for a driver missing from the
+        # cache, and seasons that aren't cached are left out
+        drivers = main.load_cache(main.DRIVER_CACHE_FILE)
+        del drivers[sorted(drivers)[0]]
+        main.save_cache(main.DRIVER_CACHE_FILE, drivers)
+        with patch.object(main, "get_http_client", side_effect=AssertionError):
+            standings = main.recompute_standings([2023, 2024], ["2003", "2022"])
+        self.assertEqual(list(standings), [2024])
+        actual, old = standings[2024]["2022"], standings[2024]["2003"]
+        # 4 races and the round 4 sprint (36 points under 2022 rules)
+        self.assertEqual(sum(actual.values()), 4 * 101 + 36)
+        self.assertEqual(sum(old.values()), 4 * 39)
+        self.assertEqual(list(actual.values()), sorted(actual.values(), reverse=True))
+
+    def test_driver_cache_keeps_teams(self):
+        main.save_driver_names({"33:7": "Max Verstappen"})
+        with patch("main.requests.Session.get") as mock_get:
+            mock_get.return_value.status_code = 200
+            mock_get.return_value.json.return_value = [
+                {
+                    "driver_number": 44,
+                    "full_name": "Lewis Hamilton",
+                    "team_name": "Ferrari",
+                    "team_colour": "E8002D",
+                }
+            ]
+            # Name-only entries from older caches still answer name lookups
+            self.assertEqual(
+                main.get_driver_map([(33, 7)]), {("33", "7"): "Max Verstappen"}
+            )
+            self.assertEqual(mock_get.call_count, 0)
+            # but are looked up again when teams are wanted
+            pairs = [(44, 7), (33, 7)]
+            driver_map = main.get_driver_map(pairs, by_session=True, teams=True)
+            self.assertEqual(mock_get.call_count, 1)
+            self.assertEqual(driver_map[("44", "7")]["team_name"], "Ferrari")
+            # Missing from the reply: keeps its name, and isn't asked for again
+            self.assertEqual(driver_map[("33", "7")], {"name": "Max Verstappen"})
+            main.get_driver_map(pairs, by_session=True, teams=True)
+            self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(
+            main.get_driver_map([(44, 7)]), {("44", "7"): "Lewis Hamilton"}
+        )
+        cache = main.load_cache(main.DRIVER_CACHE_FILE)
+        with patch.object(main, "CACHE_BACKEND", "sqlite"):
+            entries = {"44:7": cache["44:7"], "33:7": cache["33:7"], "1:7": "Max"}
+            main.save_driver_names(entries)
+            self.assertEqual(main.load_driver_names(list(entries)), entries)
+
+    def test_constructors_refresh_name_only_driver_cache(self):
+        with MockOpenF1(seasons=[2024], races_per_season=2) as mock:
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with patch.object(main, "_http_client", client):
+                main.load_season(2024)
+                # A driver cache from before teams were kept: names only
+                cache = main.load_cache(main.DRIVER_CACHE_FILE)
+                main.save_cache(
+                    main.DRIVER_CACHE_FILE,
+                    {key: entry["name"] for key, entry in cache.items()},
+                )
+                loaded = main.load_season(2024)
+            # The names are looked up again, once per session
+            self.assertEqual(mock.stats["/v1/drivers"], 4)
+        self.assertEqual(len(main.score_season(2024, *loaded)["team_names"]), 10)
+        # Without any team data there is no constructors' chart to write
+        no_teams = (loaded[0], loaded[1], {})
+        with (
+            tempfile.TemporaryDirectory() as out,
+            patch.object(main, "load_season", return_value=no_teams),
+            self.assertLogs(main.logger, "WARNING"),
+        ):
+            output = os.path.join(out, "teams.html")
+            self.assertIsNone(
+                main.render_season(2024, {}, output=output, constructors=True)
+            )
+            self.assertFalse(os.path.exists(output))
+
+    def test_score_season_team_standings(self):
+        with MockOpenF1(seasons=[2024], races_per_season=3) as mock:
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with patch.object(main, "_http_client", client):
+                loaded = main.load_season(2024)
+            # Teams come with the driver names: one /drivers request per race
+            self.assertEqual(mock.stats["/v1/drivers"], 3)
+        season = main.score_season(2024, *loaded)
+        self.assertEqual(len(season["team_names"]), 10)
+        self.assertEqual(
+            season["team_cumulative"][-1].sum(), season["cumulative"][-1].sum()
+        )
+        self.assertEqual(season["team_colors"]["Ferrari"], "#E8002D")
+        # Teammates share their team's colour
+        self.assertEqual(season["colors"]["Driver 5"], season["colors"]["Driver 2"])
+        constructors = main.constructors_season(season)
+        self.assertEqual(constructors["driver_names"], season["team_names"])
+        fig = main.season_figure(season)
+        dashes = {trace.name: trace.line.dash for trace in fig.data}
+        self.assertEqual({dashes["Driver 5"], dashes["Driver 2"]}, {"solid", "dash"})
+
+    def test_sprint_weekend_is_one_race(self):
+        with MockOpenF1(seasons=[2024], races_per_season=4) as mock:
+            client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+            with patch.object(main, "_http_client", client):
+                loaded = main.load_season(2024)
+            # Sprint and race come from one /sessions request, and the
+            # sprint reuses its race's /drivers reply
+            self.assertEqual(mock.stats["/v1/sessions"], 1)
+            self.assertEqual(mock.stats["/v1/session_result"], 5)
+            self.assertEqual(mock.stats["/v1/drivers"], 4)
+        all_race_results, names, driver_teams = loaded
+        self.assertEqual(
+            [race["session_name"] for race, _ in all_race_results],
+            ["Race", "Race", "Race", "Sprint", "Race"],
+        )
+        self.assertEqual(driver_teams[("2", "2024041")]["team_name"], "Red Bull Racing")
+        season = main.score_season(2024, *loaded)
+        self.assertEqual(len(season["race_names"]), 4)
+        self.assertEqual(season["cumulative"].shape, (4, 20))
+        self.assertEqual(season["cumulative"][-1].sum(), 4 * 101 + 36)
+
+    def test_startup_does_not_import_heavy_modules(self):
+        self.assertEqual(bench_startup.eager_heavy_modules(), [])
 
     def test_season_to_chart(self):
         self.assertEqual(main.season_to_chart(2025), 2025)
@@ -111,21 +1263,21 @@ class TestMain(unittest.TestCase):
         with self.assertRaises(json.JSONDecodeError):
             main.load_cache(fname)
 
-    @patch("main.requests.get")
+    @patch("main.requests.Session.get")
     def test_get_races_api_error(self, mock_get):
         mock_get.return_value.status_code = 500
         mock_get.return_value.raise_for_status.side_effect = Exception("API error")
         with self.assertRaises(Exception):
             main.get_races(2025, force_update=True)
 
-    @patch("main.requests.get")
+    @patch("main.requests.Session.get")
     def test_get_race_results_api_error(self, mock_get):
         mock_get.return_value.status_code = 500
         mock_get.return_value.raise_for_status.side_effect = Exception("API error")
         with self.assertRaises(Exception):
             main.get_race_results(1)
 
-    @patch("main.requests.get")
+    @patch("main.requests.Session.get")
     def test_get_driver_map_rate_limit(self, mock_get):
         # Simulate rate limit then success
         resp_429 = MagicMock()
@@ -141,7 +1293,43 @@ class TestMain(unittest.TestCase):
         driver_map = main.get_driver_map(pairs, max_retries=2)
         self.assertEqual(driver_map[("99", "1")], "Test Driver")
 
-    @patch("main.pd.DataFrame")
+    def test_token_bucket(self):
+        bucket = main.TokenBucket(2, 1.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        # Bucket is empty: the next token is about half a second away
+        self.assertAlmostEqual(bucket.reserve(), 0.5, delta=0.05)
+
+    @patch("main.time.sleep")
+    @patch("main.requests.Session.get")
+    def test_http_client_honors_retry_after(self, mock_get, mock_sleep):
+        resp_503 = MagicMock()
+        resp_503.status_code = 503
+        resp_503.headers = {"Retry-After": "7"}
+        resp_503.raise_for_status.side_effect = main.requests.exceptions.HTTPError(
+            "503", response=resp_503
+        )
+        resp_200 = MagicMock()
+        resp_200.status_code = 200
+        resp_200.json.return_value = [{"session_key": 1}]
+        mock_get.side_effect = [resp_503, resp_200]
+        data = main.get_http_client().get_json("/sessions?year=2025")
+        self.assertEqual(data, [{"session_key": 1}])
+        mock_sleep.assert_called_once_with(7.0)
+
+    @patch("main.requests.Session.get")
+    def test_http_client_no_retry_on_404(self, mock_get):
+        resp_404 = MagicMock()
+        resp_404.status_code = 404
+        resp_404.raise_for_status.side_effect = main.requests.exceptions.HTTPError(
+            "404", response=resp_404
+        )
+        mock_get.return_value = resp_404
+        with self.assertRaises(main.requests.exceptions.HTTPError):
+            main.get_http_client().get_json("/sessions?year=1900")
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("pandas.DataFrame")
     def test_plot_standings(self, mock_df):
         # Test that plot_standings calls DataFrame and write_html
         mock_df.return_value.ffill.return_value.fillna.return_value = (
@@ -149,13 +1337,58 @@ class TestMain(unittest.TestCase):
         )
         mock_df.return_value.melt.return_value = mock_df.return_value
         mock_fig = MagicMock()
-        with patch("main.px.line", return_value=mock_fig):
+        with patch("plotly.express.line", return_value=mock_fig):
             main.plot_standings([{"A": 1}], ["Race1"], ["A"])
             mock_fig.write_html.assert_called_once()
 
+    def test_write_chart_modes(self):
+        import plotly.graph_objects as go
+
+        fig = go.Figure(go.Scatter(x=["GP1", "GP2"], y=[25, 43]))
+        with tempfile.TemporaryDirectory() as out:
+            inline = os.path.join(out, "inline.html")
+            main.write_chart(fig, inline)
+            shared = os.path.join(out, "shared.html")
+            main.write_chart(fig, shared, mode="directory")
+            self.assertTrue(os.path.exists(os.path.join(out, main.PLOTLY_JS_FILE)))
+            # The shared chart no longer embeds the multi-MB plotly.js bundle
+            self.assertLess(os.path.getsize(shared) * 50, os.path.getsize(inline))
+
+            spec = main.chart_output_path(os.path.join(out, "spec.html"), "json")
+            main.write_chart(fig, spec, mode="json")
+            with open(spec) as f:
+                self.assertEqual(json.load(f)["data"][0]["y"], [25, 43])
+            self.assertTrue(os.path.exists(os.path.join(out, main.VIEWER_FILE)))
+
     @patch(
         "main.argparse.ArgumentParser.parse_args",
-        return_value=type("Args", (), {"year": 2025, "force_update": False})(),
+        return_value=type(
+            "Args",
+            (),
+            {
+                "year": 2025,
+                "force_update": False,
+                "update_cache": False,
+                "cache_backend": None,
+                "cache_ttl": None,
+                "years": None,
+                "render_batch": None,
+                "combined": False,
+                "workers": None,
+                "output": "f1_standings.html",
+                "output_dir": "",
+                "output_mode": "inline",
+                "log_format": "text",
+                "profile": False,
+                "verbose": False,
+                "command": None,
+                "large_chart": None,
+                "constructors": False,
+                "export": None,
+                "export_format": "arrow",
+                "from_export": None,
+            },
+        )(),
     )
     def test_main_flow(self, mock_args):
         # Patch all network and plotting calls
@@ -169,7 +1402,9 @@ class TestMain(unittest.TestCase):
                 return_value=[{"driver_number": 44, "position": 1}],
             ),
             patch("main.get_driver_map", return_value={("44", "1"): "Lewis Hamilton"}),
-            patch("main.plot_standings") as mock_plot,
+            patch("main.plot_standings_dataframe") as mock_plot,
+            # Nothing is drawn, so nothing to record in the render manifest
+            patch("main.save_render_keys"),
         ):
             main.main()
             mock_plot.assert_called_once()
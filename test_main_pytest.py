@@ -1,16 +1,38 @@
 import pytest
+import multiprocessing
 import os
+import io
+import copy
+import pickle
 import json
 import main
+import numpy as np
+import bench_startup
+import server
+from mock_openf1 import MockOpenF1
 from unittest.mock import patch, MagicMock
 
 
+def migrate_json_cache(cache_dir):
+    # Pool worker: open the cache database and import the JSON cache
+    from cache_store import SQLiteCache
+
+    store = SQLiteCache(os.path.join(cache_dir, main.SQLITE_CACHE_FILE))
+    try:
+        return store.migrate_json_dir(cache_dir, main.DRIVER_CACHE_FILE)
+    finally:
+        store.close()
+
+
 @pytest.fixture(autouse=True)
 def setup_and_teardown(tmp_path, monkeypatch):
     # Patch CACHE_DIR to use a temp dir
     monkeypatch.setattr(main, "CACHE_DIR", str(tmp_path))
+    # Fresh client per test, without rate limiting
+    monkeypatch.setattr(main, "_http_client", main.OpenF1Client(rate_limits=()))
     os.makedirs(main.CACHE_DIR, exist_ok=True)
     yield
+    main.close_cache_store()
     # Clean up cache files
     for f in os.listdir(main.CACHE_DIR):
         os.remove(os.path.join(main.CACHE_DIR, f))
@@ -40,6 +62,17 @@ def test_country_code_to_flag_manual_map(code, expected):
     assert main.country_code_to_flag(code) == expected
 
 
+@pytest.mark.parametrize("code,expected", [("ITA", "🇮🇹"), ("aus", "🇦🇺")])
+def test_country_code_to_flag_iso_alpha3(code, expected):
+    assert main.country_code_to_flag(code) == expected
+
+
+def test_flag_table_info():
+    info = main.flag_table_info()
+    assert info["entries"] > 240
+    assert info["bytes"] > 0
+
+
 @pytest.mark.parametrize("code", [None, "ZZZ", "123"])
 def test_country_code_to_flag_invalid(code):
     assert main.country_code_to_flag(code) == ""
@@ -53,7 +86,81 @@ def test_load_and_save_cache():
     assert data == loaded
 
 
-@patch("main.requests.get")
+def test_save_cache_is_atomic():
+    fname = "atomic_cache.json"
+    main.save_cache(fname, {"foo": "bar"})
+    # A failing write leaves the previous file intact and no temp files
+    with pytest.raises(TypeError):
+        main.save_cache(fname, {"foo": object()})
+    assert main.load_cache(fname) == {"foo": "bar"}
+    assert not [f for f in os.listdir(main.CACHE_DIR) if f.endswith(".tmp")]
+
+
+def test_cache_locks_use_a_fixed_set_of_files():
+    for session_key in range(100):
+        main.save_cache(
+            main.RACE_RESULT_CACHE_PATTERN.format(session_key=session_key), []
+        )
+    locks = [f for f in os.listdir(main.CACHE_DIR) if f.startswith(".lock-")]
+    assert len(locks) <= main.CACHE_LOCK_FILES
+    assert not [f for f in os.listdir(main.CACHE_DIR) if f.endswith(".lock")]
+
+
+def test_save_driver_names_concurrent():
+    names = [{f"{n}:1": f"Driver {n}"} for n in range(20)]
+    with main.ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(main.save_driver_names, names))
+    assert len(main.load_cache(main.DRIVER_CACHE_FILE)) == 20
+
+
+def test_sqlite_cache_backend(monkeypatch):
+    monkeypatch.setattr(main, "CACHE_BACKEND", "sqlite")
+    main.save_cache("season_2025_races.json", [{"session_key": 1}])
+    main.save_cache("race_result_1.json", [{"driver_number": 44}])
+    assert main.load_cache("season_2025_races.json") == [{"session_key": 1}]
+    assert main.load_cache("nonexistent_cache.json") is None
+    store = main.get_cache_store()
+    assert store.get_race_results([1]) == {1: [{"driver_number": 44}]}
+    main.save_driver_names({"44:1": "Lewis Hamilton"})
+    assert main.load_driver_names(["44:1", "33:1"]) == {"44:1": "Lewis Hamilton"}
+    # Nothing was written as individual JSON files
+    assert not os.path.exists(os.path.join(main.CACHE_DIR, "season_2025_races.json"))
+
+
+def test_sqlite_cache_migrates_json_files(monkeypatch):
+    main.save_cache("race_result_9.json", [{"driver_number": 1}])
+    main.save_cache(main.DRIVER_CACHE_FILE, {"1:9": "Max Verstappen"})
+    monkeypatch.setattr(main, "CACHE_BACKEND", "sqlite")
+    assert main.load_cache("race_result_9.json") == [{"driver_number": 1}]
+    assert main.load_driver_names(["1:9"]) == {"1:9": "Max Verstappen"}
+    # The import only runs once per database
+    store = main.get_cache_store()
+    assert store.migrate_json_dir(main.CACHE_DIR, main.DRIVER_CACHE_FILE) == 0
+
+
+def test_sqlite_cache_concurrent_migration():
+    for n in range(20):
+        main.save_cache(f"race_result_{n}.json", [{"driver_number": n}])
+    # Fresh interpreters, like separate runs of main.py
+    with main.ProcessPoolExecutor(
+        max_workers=4, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        migrated = list(executor.map(migrate_json_cache, [main.CACHE_DIR] * 4))
+    # Exactly one process imported the files, none failed
+    assert sorted(migrated) == [0, 0, 0, 20]
+
+
+def test_sqlite_race_results_batched(monkeypatch):
+    main.save_cache("race_result_1.json", [{"driver_number": 44}])
+    monkeypatch.setattr(main, "CACHE_BACKEND", "sqlite")
+    with patch.object(main, "get_race_results") as fetch:
+        fetch.return_value = []
+        results = main.get_race_results_many([1, 2])
+    assert results == {1: [{"driver_number": 44}], 2: []}
+    fetch.assert_called_once_with(2, max_retries=3)
+
+
+@patch("main.requests.Session.get")
 def test_get_races_and_results(mock_get):
     # Mock race sessions
     mock_get.return_value.status_code = 200
@@ -75,7 +182,111 @@ def test_get_races_and_results(mock_get):
     assert results[0]["driver_number"] == 44
 
 
-@patch("main.requests.get")
+@patch("main.requests.Session.get")
+def test_get_races_uses_fresh_cache(mock_get):
+    year = main.datetime.now().year
+    main.save_cache(
+        main.SEASON_CACHE_PATTERN.format(year=year),
+        [{"session_key": 1, "date_start": f"{year}-03-01"}],
+    )
+    main.save_cache(
+        main.SEASON_META_PATTERN.format(year=year), {"fetched_at": main.time.time()}
+    )
+    assert len(main.get_races(year)) == 1
+    mock_get.assert_not_called()
+
+
+@patch("main.requests.Session.get")
+def test_get_races_revalidates_stale_cache_incrementally(mock_get):
+    year = main.datetime.now().year
+    main.save_cache(
+        main.SEASON_CACHE_PATTERN.format(year=year),
+        [{"session_key": 1, "date_start": f"{year}-03-01T15:00:00+00:00"}],
+    )
+    main.save_cache(
+        main.SEASON_META_PATTERN.format(year=year),
+        {"fetched_at": main.time.time() - 2 * main.SEASON_CACHE_TTL},
+    )
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.headers = {"ETag": '"abc"'}
+    mock_get.return_value.json.return_value = [
+        {"session_key": 2, "date_start": f"{year}-04-01T15:00:00+00:00"}
+    ]
+    races = main.get_races(year)
+    assert [r["session_key"] for r in races] == [1, 2]
+    url = mock_get.call_args[0][0]
+    assert f"date_start>{year}-03-01T15%3A00%3A00%2B00%3A00" in url
+    meta = main.load_cache(main.SEASON_META_PATTERN.format(year=year))
+    assert meta["etag"] == '"abc"'
+
+    # Nothing changed upstream: conditional request answered with 304
+    meta["fetched_at"] -= 2 * main.SEASON_CACHE_TTL
+    meta["path"] = meta["path"].replace("03-01", "04-01")
+    main.save_cache(main.SEASON_META_PATTERN.format(year=year), meta)
+    mock_get.return_value.status_code = 304
+    assert len(main.get_races(year)) == 2
+    assert mock_get.call_args[1]["headers"] == {"If-None-Match": '"abc"'}
+
+
+def test_season_cache_is_fresh():
+    now = main.time.time()
+    year = main.datetime.now().year
+    assert main.season_cache_is_fresh(year, {"fetched_at": now}, 60)
+    assert not main.season_cache_is_fresh(year, {"fetched_at": now - 120}, 60, now)
+    # Fetched after the season ended: never stale
+    finished = {"fetched_at": main.datetime(year, 1, 2).timestamp()}
+    assert main.season_cache_is_fresh(year - 1, finished, 0)
+    # Legacy cache without metadata
+    assert main.season_cache_is_fresh(year - 1, None, 0)
+    assert not main.season_cache_is_fresh(year, None, 0)
+
+
+@patch("main.requests.Session.get")
+def test_get_race_results_many(mock_get):
+    main.save_cache(
+        main.RACE_RESULT_CACHE_PATTERN.format(session_key=1),
+        [{"driver_number": 1, "position": 1}],
+    )
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = [{"driver_number": 44, "position": 1}]
+    results = main.get_race_results_many([1, 2, 3, 2], max_workers=2)
+    assert list(results) == [1, 2, 3]
+    assert results[1][0]["driver_number"] == 1
+    assert results[3][0]["driver_number"] == 44
+    # Only the two uncached sessions hit the API
+    assert mock_get.call_count == 2
+
+
+@patch("main.requests.Session.get")
+def test_get_race_results_many_projected(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = [
+        {
+            "driver_number": 44,
+            "position": 1,
+            "points": 25,
+            "gap_to_leader": 0,
+            "duration": 5400.1,
+        },
+        {"driver_number": 33, "position": None, "dnf": True},
+    ]
+    results = main.get_race_results_many([1], project=True)[1]
+    assert results[0] == main.RaceResult(44, 1, 25)
+    assert not hasattr(results[0], "__dict__")
+    assert results[1].get("points", 0) == 0
+    assert results[1].get("position") is None
+    # Fields only: tuple methods are not row keys
+    assert results[0].get("count") is None
+    assert results[0].get("index", "missing") == "missing"
+    # Records cross process boundaries (pool workers) intact
+    assert pickle.loads(pickle.dumps(results)) == results
+    assert copy.deepcopy(results[0]) == results[0]
+    # The raw payload is still what ends up in the cache
+    cached = main.load_cache(main.RACE_RESULT_CACHE_PATTERN.format(session_key=1))
+    assert cached[0]["duration"] == 5400.1
+
+
+@patch("main.requests.Session.get")
 def test_get_driver_map(mock_get):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = [{"full_name": "Lewis Hamilton"}]
@@ -84,6 +295,23 @@ def test_get_driver_map(mock_get):
     assert driver_map[("44", "1")] == "Lewis Hamilton"
 
 
+@patch("main.requests.Session.get")
+def test_get_driver_map_by_session(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = [
+        {"driver_number": 44, "full_name": "Lewis Hamilton"},
+        {"driver_number": 1, "broadcast_name": "M VERSTAPPEN"},
+    ]
+    pairs = [(44, 7), (1, 7), (99, 7)]
+    driver_map = main.get_driver_map(pairs, by_session=True)
+    # One request for the whole session instead of one per driver
+    assert mock_get.call_count == 1
+    assert driver_map[("44", "7")] == "Lewis Hamilton"
+    assert driver_map[("1", "7")] == "M VERSTAPPEN"
+    assert driver_map[("99", "7")] == "99"
+    assert main.load_cache(main.DRIVER_CACHE_FILE)["44:7"] == {"name": "Lewis Hamilton"}
+
+
 @patch("main.get_race_results")
 def test_calculate_standings(mock_results):
     races = [
@@ -91,21 +319,913 @@ def test_calculate_standings(mock_results):
         {"session_key": 2, "meeting_name": "Test GP2"},
     ]
     driver_map = {"44": "Lewis Hamilton", "33": "Max Verstappen"}
-    mock_results.side_effect = [
-        [
+    results = {
+        1: [
             {"driver_number": 44, "position": 1, "points": 25},
             {"driver_number": 33, "position": 2, "points": 18},
         ],
-        [
+        2: [
             {"driver_number": 33, "position": 1, "points": 25},
             {"driver_number": 44, "position": 2, "points": 18},
         ],
-    ]
+    }
+    mock_results.side_effect = lambda key, **kwargs: results[key]
     standings, race_names, driver_names = main.calculate_standings(races, driver_map)
     assert standings[-1]["Lewis Hamilton"] == 43
     assert standings[-1]["Max Verstappen"] == 43
     assert "Test GP" in race_names[0]
     assert "Lewis Hamilton" in driver_names
+    # Each result set is fetched once
+    assert mock_results.call_count == 2
+
+
+def test_calculate_standings_uses_points_table():
+    races = [{"session_key": 1, "meeting_name": "Test GP"}]
+    # API points disagree with the finishing order; the points table wins, as
+    # in the main pipeline
+    with patch(
+        "main.get_race_results",
+        return_value=[
+            {"driver_number": 44, "position": 2, "points": 25},
+            {"driver_number": 33, "position": 1, "points": 0},
+        ],
+    ):
+        standings, _, _ = main.calculate_standings(races, {})
+    assert standings == [{"44": 18, "33": 25}]
+
+
+def test_calculate_standings_merges_sprint_weekends():
+    races = [
+        {"session_key": 1, "meeting_key": 10, "meeting_name": "GP1"},
+        {
+            "session_key": 2,
+            "meeting_key": 11,
+            "meeting_name": "GP2",
+            "session_name": "Sprint",
+            "year": 2022,
+        },
+        {"session_key": 3, "meeting_key": 11, "meeting_name": "GP2"},
+    ]
+    results = {
+        1: [{"driver_number": 44, "position": 1}],
+        2: [{"driver_number": 44, "position": 1}],
+        3: [{"driver_number": 44, "position": 1}],
+    }
+    with patch("main.get_race_results", side_effect=lambda key, **kwargs: results[key]):
+        standings, race_names, _ = main.calculate_standings(races, {})
+    # One row per meeting, after its last session
+    assert race_names == ["GP1", "GP2"]
+    assert standings == [{"44": 25}, {"44": 25 + 8 + 25}]
+
+
+def test_standings_snapshot_is_incremental():
+    race_results = [
+        (
+            {"session_key": 1, "meeting_name": "GP1"},
+            [
+                {"driver_number": 44, "position": 1},
+                {"driver_number": 33, "position": 2},
+            ],
+        ),
+        (
+            {"session_key": 2, "meeting_name": "GP2"},
+            [
+                {"driver_number": 33, "position": 1},
+                {"driver_number": 44, "position": 2},
+            ],
+        ),
+    ]
+    names = {"44": "Lewis Hamilton", "33": "Max Verstappen"}
+    main.score_season(2025, race_results, names)
+    snapshot = main.load_cache(main.STANDINGS_CACHE_PATTERN.format(year=2025))
+    assert snapshot["progression"] == [[25, 18], [43, 43]]
+    # Whole points stay integers (25, not 25.0)
+    assert {type(v) for row in snapshot["progression"] for v in row} == {int}
+
+    # Only the new race is scored: earlier results are not looked at again
+    race_results[0] = (race_results[0][0], [])
+    race_results.append(
+        (
+            {"session_key": 3, "meeting_name": "GP3"},
+            [
+                {"driver_number": 1, "position": 1},
+                {"driver_number": 44, "position": None},
+            ],
+        )
+    )
+    season = main.score_season(2025, race_results, names)
+    assert season["driver_names"] == ["Lewis Hamilton", "Max Verstappen", "1"]
+    assert season["cumulative"][-1].tolist() == [61, 43, 25]
+    snapshot = main.load_cache(main.STANDINGS_CACHE_PATTERN.format(year=2025))
+    assert snapshot["progression"][1] == [43, 43]
+
+    # A snapshot that no longer matches the races is recomputed
+    season = main.score_season(2025, race_results[1:], names)
+    final = dict(zip(season["driver_names"], season["cumulative"][-1].tolist()))
+    assert final["Lewis Hamilton"] == 36
+    assert season["cumulative"].dtype.kind == "i"
+
+
+def test_standings_snapshot_dtype():
+    race = ({"session_key": 1}, [{"driver_number": 44, "position": 1, "points": 25}])
+    rules = main.SCORING_RULES["2022"]
+    snapshot = main.update_standings_snapshot(None, [race], rules)
+    assert snapshot["progression"] == [[25]]
+    assert isinstance(snapshot["progression"][0][0], int)
+    # Half points make the season fractional, and it stays so
+    with patch.dict(main.POINTS_SCALE, {2: 0.5}):
+        second = ({"session_key": 2}, race[1])
+        snapshot = main.update_standings_snapshot(None, [race, second], rules)
+        assert snapshot["progression"] == [[25.0], [37.5]]
+        third = ({"session_key": 3}, race[1])
+        snapshot = main.update_standings_snapshot(
+            snapshot, [race, second, third], rules
+        )
+    assert snapshot["progression"][-1] == [62.5]
+
+
+def test_render_key_covers_points():
+    race = {"session_key": 1, "meeting_name": "GP1"}
+    results = [{"driver_number": 44, "position": 1, "points": 25}]
+    key = main.render_key([(race, results)], {}, None, "t", "inline")
+    # A fastest-lap point changes the standings, so it changes the key
+    bonus = [dict(results[0], points=26)]
+    assert main.render_key([(race, bonus)], {}, None, "t", "inline") != key
+
+
+def test_points_matrix():
+    race_results = [
+        (
+            {"session_key": 1},
+            [
+                {"driver_number": 33, "position": None},
+                {"driver_number": 44, "position": 2},
+                {"driver_number": 16, "position": 1},
+            ],
+        ),
+        ({"session_key": 2}, [{"driver_number": 33, "position": 1}]),
+    ]
+    drivers, matrix = main.points_matrix(race_results)
+    assert drivers == ["33", "44", "16"]
+    assert matrix.tolist() == [[15, 18, 25], [25, 0, 0]]
+    assert matrix.cumsum(axis=0)[-1].tolist() == [40, 18, 25]
+
+
+def test_standings_dataframe():
+    df = main.standings_dataframe(
+        ["GP1", "GP2"],
+        ["Max Verstappen", "Lewis Hamilton", "Max Verstappen"],
+        [[10, 25, 0], [10, 43, 25]],
+    )
+    assert list(df.columns) == ["Race", "Driver", "Points"]
+    # Same name merged, legend ordered by final points
+    assert list(df["Driver"].unique()) == ["Lewis Hamilton", "Max Verstappen"]
+    assert df["Points"].tolist() == [25, 43, 10, 35]
+
+
+def test_parse_years():
+    assert main.parse_years("2018-2020") == [2018, 2019, 2020]
+    assert main.parse_years("2023, 2021,2021-2022") == [2021, 2022, 2023]
+    with pytest.raises(main.argparse.ArgumentTypeError):
+        main.parse_years("20x8")
+
+
+def test_combine_seasons():
+    seasons = [
+        {
+            "year": 2023,
+            "race_names": ["GP1", "GP2"],
+            "driver_names": ["A", "B"],
+            "cumulative": np.array([[25, 18], [43, 43]]),
+        },
+        {
+            "year": 2024,
+            "race_names": ["GP1"],
+            "driver_names": ["C", "A"],
+            "cumulative": np.array([[25, 18]]),
+        },
+    ]
+    combined = main.combine_seasons(seasons)
+    assert combined["year"] == "2023-2024"
+    assert combined["race_names"] == ["2023 GP1", "2023 GP2", "2024 GP1"]
+    assert combined["driver_names"] == ["A", "B", "C"]
+    assert combined["cumulative"].tolist() == [[25, 18, 0], [43, 43, 0], [61, 43, 25]]
+
+
+def test_chart_seasons(tmp_path_factory):
+    out = str(tmp_path_factory.mktemp("charts"))
+    with (
+        patch(
+            "main.get_races",
+            side_effect=lambda year, **kwargs: [
+                {"session_key": year, "meeting_name": "Test GP"}
+            ],
+        ),
+        patch(
+            "main.get_race_results",
+            return_value=[{"driver_number": 44, "position": 1}],
+        ),
+        patch("main.get_driver_map", return_value={}),
+        patch("main.plot_standings_dataframe") as mock_plot,
+    ):
+        seasons = main.chart_seasons(
+            [2023, 2024],
+            {"force_update": True},
+            workers=1,
+            combined=True,
+            output_dir=out,
+        )
+    assert [season["year"] for season in seasons] == [2023, 2024]
+    assert [call.kwargs["output"] for call in mock_plot.call_args_list] == [
+        os.path.join(out, "f1_standings_2023.html"),
+        os.path.join(out, "f1_standings_2024.html"),
+        os.path.join(out, "f1_standings_2023-2024.html"),
+    ]
+
+
+def test_worker_rate_limits_stay_within_the_limits():
+    # Every worker sends requests back to back from the start; no window of
+    # one period, the first one included, may see more than the limit
+    for rate, per in [(3, 1.0), (30, 60.0)]:
+        for workers in (1, 2, 3, 8, 40):
+            clock = [0.0]
+            with patch.object(main.time, "monotonic", lambda: clock[0]):
+                buckets = [
+                    main.TokenBucket(
+                        *main.worker_rate_limits(workers, [(rate, per)], i)[0]
+                    )
+                    for i in range(workers)
+                ]
+                ready = [0.0] * workers
+                sent = []
+                while min(ready) < 3 * per:
+                    i = ready.index(min(ready))
+                    clock[0] = ready[i]
+                    wait = buckets[i].reserve()
+                    if wait > 0:
+                        ready[i] += max(wait, 1e-9)  # rounding can leave tiny waits
+                    else:
+                        sent.append(clock[0])
+            for start in [0.0, *sent]:
+                in_window = [t for t in sent if start <= t < start + per - 1e-9]
+                assert len(in_window) <= rate, (rate, workers, start)
+            # ... while the pool as a whole still gets the full rate
+            assert len(sent) >= 3 * rate
+    assert main.worker_rate_limits(8, [(3, 1.0)]) == [(1, 8 / 3, 1)]
+
+
+# Earlier tests may have started native (pyarrow, numpy) threads before the
+# pool forks
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded")
+def test_chart_seasons_in_worker_processes(tmp_path_factory):
+    with MockOpenF1(seasons=[2021, 2022], races_per_season=2) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            for year in (2021, 2022):
+                main.load_season(year)
+    # Both seasons are cached; the workers read and render them
+    out = str(tmp_path_factory.mktemp("workers"))
+    seasons = main.chart_seasons(
+        [2021, 2022], {}, workers=2, output_dir=out, output_mode="cdn"
+    )
+    assert [season["year"] for season in seasons] == [2021, 2022]
+    assert sorted(os.listdir(out)) == [
+        "f1_standings_2021.html",
+        "f1_standings_2022.html",
+        main.RENDER_MANIFEST_FILE,
+    ]
+    # Both workers recorded their chart in the shared manifest
+    manifest = main.load_render_manifest(os.path.join(out, main.RENDER_MANIFEST_FILE))
+    assert sorted(manifest) == ["f1_standings_2021.html", "f1_standings_2022.html"]
+    specs = [
+        {"season": 2022, "filter": {"top": 2}},
+        {"season": 2022, "filter": {"top": 3}},
+    ]
+    rendered, _ = main.render_batch(
+        specs, {}, output_dir=out, output_mode="cdn", workers=2
+    )
+    assert rendered == [
+        os.path.join(out, "f1_standings_2022_top2.html"),
+        os.path.join(out, "f1_standings_2022_top3.html"),
+    ]
+    assert all(os.path.exists(path) for path in rendered)
+
+
+def test_render_batch_skips_unchanged_charts(tmp_path_factory):
+    loaded = (
+        [
+            (
+                {"session_key": 1, "meeting_name": "GP1", "year": 2024},
+                [
+                    main.RaceResult(1, 1, None),
+                    main.RaceResult(2, 2, None),
+                    main.RaceResult(3, 3, None),
+                ],
+            ),
+            (
+                {"session_key": 2, "meeting_name": "GP2", "year": 2024},
+                [
+                    main.RaceResult(2, 1, None),
+                    main.RaceResult(1, 2, None),
+                    main.RaceResult(3, 3, None),
+                ],
+            ),
+        ],
+        {"1": "A", "2": "B", "3": "C"},
+        {},
+    )
+    specs = [
+        {"season": 2024, "filter": {"top": 2}},
+        {"season": 2024, "filter": {"drivers": ["C"]}, "output": "c.html"},
+    ]
+    out = str(tmp_path_factory.mktemp("batch"))
+    with (
+        patch("main.load_season", return_value=loaded) as mock_load,
+        patch("main.score_season", wraps=main.score_season) as mock_score,
+        patch("main.plot_standings_dataframe") as mock_plot,
+    ):
+        rendered, skipped = main.render_batch(specs, {}, output_dir=out, workers=1)
+        # The season is loaded and scored once for both charts
+        mock_load.assert_called_once_with(2024)
+        assert mock_score.call_count == 1
+        assert rendered == [
+            os.path.join(out, "f1_standings_2024_top2.html"),
+            os.path.join(out, "c.html"),
+        ]
+        assert skipped == []
+        frame = mock_plot.call_args_list[0].args[0]
+        assert sorted(frame["Driver"].unique()) == ["A", "B"]
+        for path in rendered:
+            open(path, "w").close()
+        rendered, skipped = main.render_batch(specs, {}, output_dir=out, workers=1)
+        assert rendered == []
+        assert len(skipped) == 2
+        # Unchanged charts are found from the inputs, without scoring
+        assert mock_score.call_count == 1
+
+
+def test_render_season_skips_identical_chart(tmp_path_factory):
+    output = str(tmp_path_factory.mktemp("render") / "chart.html")
+
+    def write_output(df, output, **kwargs):
+        open(output, "w").close()
+
+    with (
+        patch(
+            "main.get_races",
+            return_value=[{"session_key": 1, "meeting_name": "Test GP"}],
+        ),
+        patch(
+            "main.get_race_results",
+            return_value=[{"driver_number": 44, "position": 1}],
+        ),
+        patch("main.get_driver_map", return_value={("44", "1"): "A"}),
+        patch("main.plot_standings_dataframe", side_effect=write_output) as mock_plot,
+    ):
+        main.render_season(2025, {}, output=output)
+        with patch("main.score_season") as mock_score:
+            main.render_season(2025, {}, output=output)
+            # Cache hit: nothing is scored or plotted
+            mock_score.assert_not_called()
+        mock_plot.assert_called_once()
+        # A different title is a different chart
+        main.render_season(2025, {}, output=output, title="Other")
+        assert mock_plot.call_count == 2
+    # One render cache: the manifest next to the chart, as for batches
+    manifest = main.load_render_manifest(
+        os.path.join(os.path.dirname(output), main.RENDER_MANIFEST_FILE)
+    )
+    assert list(manifest) == ["chart.html"]
+    assert not [f for f in os.listdir(main.CACHE_DIR) if f.startswith("render_")]
+
+
+def test_build_season_against_mock_server():
+    with MockOpenF1(seasons=[2024], races_per_season=2) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            season = main.build_season(2024)
+            # sessions + one session_result and one /drivers per race
+            assert mock.stats["requests"] == 5
+            assert len(season["race_names"]) == 2
+            assert "Driver 5" in season["driver_names"]
+            mock.reset_stats()
+            main.build_season(2024)
+            assert mock.stats["requests"] == 0
+
+
+def test_client_retries_injected_rate_limits():
+    with MockOpenF1(rate_limit_ratio=1.0) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with pytest.raises(main.requests.exceptions.HTTPError):
+            client.get_json("/sessions?year=2024", max_retries=3)
+        assert mock.stats["429"] == 3
+
+
+def test_metrics_count_stages_requests_and_cache():
+    main.metrics.reset()
+    with MockOpenF1(seasons=[2024], races_per_season=2) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            main.build_season(2024)
+    counters = main.metrics.summary()["counters"]
+    assert counters["http.requests"] == 5
+    assert counters["http.bytes"] > 0
+    assert counters["cache.misses"] > 0
+    for stage in ("fetch_seasons", "fetch_results", "driver_map", "compute"):
+        assert main.metrics.calls[stage] == 1
+    assert "HTTP: 5 requests" in main.metrics.format_summary()
+
+
+def test_json_lines_logging():
+    stream = io.StringIO()
+    main.configure_logging("json", stream=stream)
+    try:
+        with main.metrics.stage("compute", year=2024):
+            main.logger.info("Fetching F1 %s season data...", 2024)
+    finally:
+        main.logger.handlers.clear()
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0]["message"] == "Fetching F1 2024 season data..."
+    assert lines[1]["event"] == "stage"
+    assert lines[1]["stage"] == "compute"
+    assert lines[1]["year"] == 2024
+
+
+def test_async_api_shares_in_flight_requests():
+    pytest.importorskip("httpx")
+    import asyncio
+    import async_api
+
+    async def run(url):
+        async with async_api.AsyncOpenF1Client(base_url=url, rate_limits=()) as c:
+            first, second = await asyncio.gather(
+                async_api.async_get_races(2024, client=c),
+                async_api.async_get_races(2024, client=c),
+            )
+            season = await async_api.async_load_season(2024, client=c)
+        return first, second, season
+
+    with MockOpenF1(seasons=[2024], races_per_season=2, latency=0.05) as mock:
+        first, second, season = asyncio.run(run(mock.url))
+        # Both callers got the season from a single upstream request
+        assert mock.stats["/v1/sessions"] == 1
+        assert first == second
+        assert len(season[0]) == 2
+        assert season[1]["5"] == "Driver 5"
+        assert mock.stats["/v1/drivers"] == 2
+
+
+def test_async_api_shares_sync_limits_and_keeps_io_off_the_loop(monkeypatch):
+    pytest.importorskip("httpx")
+    import asyncio
+    import threading
+    import async_api
+
+    loop_threads = set()
+    io_threads = []
+    load_cache = main.load_cache
+
+    def tracked_load_cache(filename):
+        io_threads.append(threading.current_thread())
+        return load_cache(filename)
+
+    monkeypatch.setattr(async_api, "load_cache", tracked_load_cache)
+    monkeypatch.setattr(main, "load_cache", tracked_load_cache)
+
+    async def run(url):
+        loop_threads.add(threading.current_thread())
+        async with async_api.AsyncOpenF1Client(base_url=url) as c:
+            # One token budget for sync and async requests
+            assert c.buckets is main.get_http_client().buckets
+            return await async_api.async_load_season(2024, client=c)
+
+    with MockOpenF1(seasons=[2024], races_per_season=2) as mock:
+        season = asyncio.run(run(mock.url))
+    assert len(season[0]) == 2
+    assert io_threads
+    assert not loop_threads & set(io_threads)
+
+
+def test_async_races_revalidate_with_304():
+    asyncio = pytest.importorskip("asyncio")
+    httpx = pytest.importorskip("httpx")
+    import async_api
+
+    year = main.datetime.now().year
+    sessions = [{"session_key": 1, "date_start": f"{year}-03-01T15:00:00+00:00"}]
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json=sessions, headers={"ETag": '"v1"'})
+
+    async def run():
+        async with async_api.AsyncOpenF1Client(rate_limits=()) as c:
+            c.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            first = await async_api.async_get_races(year, ttl=0, client=c)
+            await async_api.async_get_races(year, ttl=0, client=c)
+            meta = main.load_cache(main.SEASON_META_PATTERN.format(year=year))
+            main.save_cache(
+                main.SEASON_META_PATTERN.format(year=year), dict(meta, fetched_at=0)
+            )
+            third = await async_api.async_get_races(year, ttl=0, client=c)
+        return first, third
+
+    main.metrics.reset()
+    first, third = asyncio.run(run())
+    assert third == first
+    assert requests_seen[-1].headers["If-None-Match"] == '"v1"'
+    counters = main.metrics.snapshot()["counters"]
+    assert counters.get("http.not_modified") == 1
+    assert "http.errors" not in counters
+    # The 304 counts as a fetch: the season is fresh again
+    meta = main.load_cache(main.SEASON_META_PATTERN.format(year=year))
+    assert meta["fetched_at"] > 0
+
+
+def test_async_client_retries_without_blocking():
+    httpx = pytest.importorskip("httpx")
+    import asyncio
+    import async_api
+
+    async def run(url):
+        async with async_api.AsyncOpenF1Client(base_url=url, rate_limits=()) as c:
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.ensure_future(tick())
+            try:
+                with pytest.raises(httpx.HTTPStatusError):
+                    await c.get_json("/sessions?year=2024", max_retries=2)
+            finally:
+                ticker.cancel()
+        return ticks
+
+    with MockOpenF1(rate_limit_ratio=1.0, retry_after=0.2) as mock:
+        ticks = asyncio.run(run(mock.url))
+        assert mock.stats["429"] == 2
+        # The event loop kept running during the Retry-After wait
+        assert ticks > 5
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = server.LRUCache(max_bytes=100)
+    cache.put("a", "A", 40)
+    cache.put("b", "B", 40)
+    assert cache.get("a") == "A"
+    cache.put("c", "C", 40)
+    # "b" was the least recently used entry
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.stats()["bytes"] == 80
+
+
+def test_chart_service_caches_and_refreshes():
+    with MockOpenF1(seasons=[2024], races_per_season=3) as mock:
+        mock.released[2024] = 2
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            service = server.ChartService({})
+            chart = service.chart(2024, "json")
+            with patch("main.standings_figure") as mock_figure:
+                assert service.chart(2024, "json") == chart
+                mock_figure.assert_not_called()
+            assert not service.refresh(2024)
+            mock.released[2024] = 3
+            assert service.refresh(2024)
+            standings = json.loads(service.standings(2024))
+            assert len(standings["race_names"]) == 3
+            assert service.cache.get(("chart", 2024, "json", None)) is None
+
+
+def test_chart_service_refresh_waits_for_renders():
+    import threading
+
+    with MockOpenF1(seasons=[2024], races_per_season=3) as mock:
+        mock.released[2024] = 2
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            service = server.ChartService({})
+            season_figure = main.season_figure
+            refreshes = []
+            refreshed = []
+
+            def render_during_refresh(*args, **kwargs):
+                # The season changes while its old chart is being rendered
+                mock.released[2024] = 3
+                thread = threading.Thread(
+                    target=lambda: refreshed.append(service.refresh(2024))
+                )
+                thread.start()
+                thread.join(0.2)
+                assert thread.is_alive()
+                refreshes.append(thread)
+                return season_figure(*args, **kwargs)
+
+            with patch("main.season_figure", side_effect=render_during_refresh):
+                service.chart(2024, "json")
+            refreshes[0].join()
+    assert refreshed == [True]
+    # The stale chart was dropped by the refresh, not served afterwards
+    assert service.cache.get(("chart", 2024, "json", None)) is None
+
+
+@pytest.fixture
+def chart_server():
+    import threading
+
+    service = server.ChartService({})
+    httpd = server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), server.make_handler(service, 2024)
+    )
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield service, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_server_replies_when_a_build_fails(chart_server, caplog):
+    import urllib.error
+    import urllib.request
+
+    service, base_url = chart_server
+
+    def get(path):
+        try:
+            with urllib.request.urlopen(base_url + path) as resp:
+                return resp.status, json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    down = main.requests.exceptions.ConnectionError("API down")
+    with patch.object(service, "build", side_effect=down):
+        assert get("/seasons/2024.json")[0] == 502
+    with patch.object(service, "build", side_effect=RuntimeError("bug")):
+        status, body = get("/seasons/2024/standings.json")
+    assert (status, body) == (500, {"error": "internal error"})
+    assert "Building /seasons/2024.json failed" in caplog.text
+    with patch("main.load_season", return_value=None) as load_season:
+        # Out of range years never reach the API, empty seasons once
+        assert get("/seasons/1.html")[0] == 404
+        assert get("/seasons/2000.json")[0] == 404
+        assert get("/seasons/2000/standings.json")[0] == 404
+    assert load_season.call_count == 1
+
+
+def test_large_standings_figure_bands_and_thins():
+    races = [f"R{i}" for i in range(1000)]
+    drivers = [f"D{i}" for i in range(60)]
+    cumulative = np.cumsum(np.ones((1000, 60), dtype=int) * np.arange(60), axis=0)
+    fig = main.large_standings_figure(races, drivers, cumulative, top_drivers=10)
+    assert all(trace.type == "scattergl" for trace in fig.data)
+    # 10 drivers plus the two edges of the band
+    assert len(fig.data) == 12
+    assert fig.data[0].name == "D59"
+    assert fig.data[-1].name == "Other 50 drivers"
+    assert fig.data[-1].fill == "tonexty"
+    assert len(fig.data[0].x) <= main.LARGE_CHART_MAX_POINTS
+    assert fig.data[0].x[-1] == "R999"
+    assert fig.data[0].mode == "lines"
+
+
+def test_plot_season_switches_to_large_chart():
+    season = {
+        "race_names": ["R1", "R2"],
+        "driver_names": ["A", "A", "B"],
+        "cumulative": np.array([[1, 2, 3], [4, 5, 6]]),
+    }
+    with patch("main.plot_standings_dataframe") as mock_plot:
+        main.plot_season(season, output="out.json", mode="json")
+        mock_plot.assert_called_once()
+    with (
+        patch.object(main, "LARGE_CHART", "on"),
+        patch("main.write_chart") as mock_write,
+    ):
+        main.plot_season(season, output="out.json", mode="json")
+        fig = mock_write.call_args.args[0]
+        # Drivers sharing a name are drawn as one line
+        assert [trace.name for trace in fig.data] == ["A", "B"]
+        assert list(fig.data[0].y) == [3, 9]
+
+
+def test_columnar_export_round_trips_season(tmp_path_factory):
+    pytest.importorskip("pyarrow")
+    import columnar
+
+    def as_rows(season):
+        all_race_results, names, teams = season
+        return (
+            [(race, list(results)) for race, results in all_race_results],
+            names,
+            teams,
+        )
+
+    root = str(tmp_path_factory.mktemp("export"))
+    with MockOpenF1(seasons=[2024], races_per_season=4) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            paths = columnar.export_seasons([2024], {}, root)
+            assert os.path.join(root, "results", "year=2024", "part-0.arrow") in paths
+            loaded = main.load_season(2024)
+            requests_before = mock.stats["requests"]
+            exported = main.load_season(2024, source=root)
+            assert mock.stats["requests"] == requests_before
+            # Results come back as column arrays, scored without records
+            assert all(
+                isinstance(results, main.ResultColumns) for _, results in exported[0]
+            )
+            assert as_rows(exported) == loaded
+            drivers, matrix = main.points_matrix(exported[0])
+            expected_drivers, expected = main.points_matrix(loaded[0])
+            assert drivers == expected_drivers
+            assert matrix.tolist() == expected.tolist()
+            # Re-exporting as Parquet replaces the Arrow files, without
+            # fetching the season again
+            columnar.export_season(2024, loaded, root, fmt="parquet")
+            assert mock.stats["requests"] == requests_before
+            assert as_rows(columnar.read_season(2024, root)) == loaded
+            assert columnar.find_table(root, "results", 2023) is None
+            assert columnar.read_season(2023, root) is None
+
+
+def test_export_reuses_the_charted_season(tmp_path_factory):
+    pytest.importorskip("pyarrow")
+    root = str(tmp_path_factory.mktemp("charts"))
+    with MockOpenF1(seasons=[2024], races_per_season=4) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with (
+            patch.object(main, "_http_client", client),
+            patch("main.load_season", wraps=main.load_season) as load_season,
+        ):
+            main.chart_seasons(
+                [2024],
+                {},
+                output_dir=root,
+                output_mode="json",
+                export=(os.path.join(root, "export"), "arrow"),
+            )
+    assert load_season.call_count == 1
+    assert os.path.exists(
+        os.path.join(root, "export", "drivers", "year=2024", "part-0.arrow")
+    )
+
+
+def test_points_matrices_apply_each_rule_set():
+    race = (
+        {"session_key": 1, "year": 2019},
+        [
+            {"driver_number": 44, "position": 1, "points": 25},
+            {"driver_number": 33, "position": 2, "points": 18},
+            # Fastest lap bonus, as reported by the API
+            {"driver_number": 16, "position": 3, "points": 16},
+        ],
+    )
+    sprint = (
+        {"session_key": 2, "year": 2022, "session_name": "Sprint"},
+        [{"driver_number": 33, "position": 1, "points": 8}],
+    )
+    drivers, matrices = main.points_matrices(
+        [race, sprint], [None, "1950", "2010", "2021"]
+    )
+    assert drivers == ["44", "33", "16"]
+    assert matrices[0].tolist() == [[25, 18, 16], [0, 8, 0]]
+    assert matrices[1].tolist() == [[8, 6, 5], [0, 0, 0]]
+    assert matrices[2].tolist() == [[25, 18, 15], [0, 0, 0]]
+    assert matrices[3].tolist() == [[25, 18, 16], [0, 3, 0]]
+    with patch.dict(main.POINTS_SCALE, {1: 0.5}):
+        _, matrix = main.points_matrix([race], "2010")
+    assert matrix.tolist() == [[12.5, 9.0, 7.5]]
+
+
+def test_recompute_standings_under_other_rules():
+    with MockOpenF1(seasons=[2024], races_per_season=4) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            main.load_season(2024)
+    # The API is never asked, not even for a driver missing from the cache,
+    # and seasons that aren't cached are left out
+    drivers = main.load_cache(main.DRIVER_CACHE_FILE)
+    del drivers[sorted(drivers)[0]]
+    main.save_cache(main.DRIVER_CACHE_FILE, drivers)
+    with patch.object(main, "get_http_client", side_effect=AssertionError):
+        standings = main.recompute_standings([2023, 2024], ["2003", "2022"])
+    assert list(standings) == [2024]
+    actual, old = standings[2024]["2022"], standings[2024]["2003"]
+    # 4 races and the round 4 sprint (36 points under 2022 rules)
+    assert sum(actual.values()) == 4 * 101 + 36
+    assert sum(old.values()) == 4 * 39
+    assert list(actual.values()) == sorted(actual.values(), reverse=True)
+
+
+def test_driver_cache_keeps_teams(monkeypatch):
+    main.save_driver_names({"33:7": "Max Verstappen"})
+    with patch("main.requests.Session.get") as mock_get:
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = [
+            {
+                "driver_number": 44,
+                "full_name": "Lewis Hamilton",
+                "team_name": "Ferrari",
+                "team_colour": "E8002D",
+            }
+        ]
+        # Name-only entries from older caches still answer name lookups
+        assert main.get_driver_map([(33, 7)]) == {("33", "7"): "Max Verstappen"}
+        assert mock_get.call_count == 0
+        # but are looked up again when teams are wanted
+        pairs = [(44, 7), (33, 7)]
+        driver_map = main.get_driver_map(pairs, by_session=True, teams=True)
+        assert mock_get.call_count == 1
+        assert driver_map[("44", "7")]["team_name"] == "Ferrari"
+        # Missing from the reply: keeps its name, and isn't asked for again
+        assert driver_map[("33", "7")] == {"name": "Max Verstappen"}
+        main.get_driver_map(pairs, by_session=True, teams=True)
+        assert mock_get.call_count == 1
+    assert main.get_driver_map([(44, 7)]) == {("44", "7"): "Lewis Hamilton"}
+    cache = main.load_cache(main.DRIVER_CACHE_FILE)
+    monkeypatch.setattr(main, "CACHE_BACKEND", "sqlite")
+    entries = {"44:7": cache["44:7"], "33:7": cache["33:7"], "1:7": "Max"}
+    main.save_driver_names(entries)
+    assert main.load_driver_names(list(entries)) == entries
+
+
+def test_constructors_refresh_name_only_driver_cache(tmp_path_factory, caplog):
+    with MockOpenF1(seasons=[2024], races_per_season=2) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            main.load_season(2024)
+            # A driver cache from before teams were kept: names only
+            cache = main.load_cache(main.DRIVER_CACHE_FILE)
+            main.save_cache(
+                main.DRIVER_CACHE_FILE,
+                {key: entry["name"] for key, entry in cache.items()},
+            )
+            loaded = main.load_season(2024)
+        # The names are looked up again, once per session
+        assert mock.stats["/v1/drivers"] == 4
+    assert len(main.score_season(2024, *loaded)["team_names"]) == 10
+    # Without any team data there is no constructors' chart to write
+    output = str(tmp_path_factory.mktemp("teams") / "teams.html")
+    with patch.object(main, "load_season", return_value=(loaded[0], loaded[1], {})):
+        assert main.render_season(2024, {}, output=output, constructors=True) is None
+    assert not os.path.exists(output)
+    assert "No team data" in caplog.text
+
+
+def test_score_season_team_standings():
+    with MockOpenF1(seasons=[2024], races_per_season=3) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            loaded = main.load_season(2024)
+        # Teams come with the driver names: one /drivers request per race
+        assert mock.stats["/v1/drivers"] == 3
+    season = main.score_season(2024, *loaded)
+    assert len(season["team_names"]) == 10
+    assert season["team_cumulative"][-1].sum() == season["cumulative"][-1].sum()
+    assert season["team_colors"]["Ferrari"] == "#E8002D"
+    # Teammates share their team's colour
+    assert season["colors"]["Driver 5"] == season["colors"]["Driver 2"]
+    constructors = main.constructors_season(season)
+    assert constructors["driver_names"] == season["team_names"]
+    fig = main.season_figure(season)
+    dashes = {trace.name: trace.line.dash for trace in fig.data}
+    assert {dashes["Driver 5"], dashes["Driver 2"]} == {"solid", "dash"}
+
+
+def test_sprint_weekend_is_one_race():
+    with MockOpenF1(seasons=[2024], races_per_season=4) as mock:
+        client = main.OpenF1Client(base_url=mock.url, rate_limits=())
+        with patch.object(main, "_http_client", client):
+            loaded = main.load_season(2024)
+        # Sprint and race come from one /sessions request, and the sprint
+        # reuses its race's /drivers reply
+        assert mock.stats["/v1/sessions"] == 1
+        assert mock.stats["/v1/session_result"] == 5
+        assert mock.stats["/v1/drivers"] == 4
+    all_race_results, names, driver_teams = loaded
+    assert [race["session_name"] for race, _ in all_race_results] == [
+        "Race",
+        "Race",
+        "Race",
+        "Sprint",
+        "Race",
+    ]
+    assert driver_teams[("2", "2024041")]["team_name"] == "Red Bull Racing"
+    season = main.score_season(2024, *loaded)
+    assert len(season["race_names"]) == 4
+    assert season["cumulative"].shape == (4, 20)
+    assert season["cumulative"][-1].sum() == 4 * 101 + 36
+
+
+def test_startup_does_not_import_heavy_modules():
+    assert bench_startup.eager_heavy_modules() == []
 
 
 def test_season_to_chart():
@@ -126,7 +1246,7 @@ def test_load_cache_invalid_json(tmp_path):
         main.load_cache(fname)
 
 
-@patch("main.requests.get")
+@patch("main.requests.Session.get")
 def test_get_races_api_error(mock_get):
     mock_get.return_value.status_code = 500
     mock_get.return_value.raise_for_status.side_effect = Exception("API error")
@@ -134,7 +1254,7 @@ def test_get_races_api_error(mock_get):
         main.get_races(2025, force_update=True)
 
 
-@patch("main.requests.get")
+@patch("main.requests.Session.get")
 def test_get_race_results_api_error(mock_get):
     mock_get.return_value.status_code = 500
     mock_get.return_value.raise_for_status.side_effect = Exception("API error")
@@ -142,7 +1262,7 @@ def test_get_race_results_api_error(mock_get):
         main.get_race_results(1)
 
 
-@patch("main.requests.get")
+@patch("main.requests.Session.get")
 def test_get_driver_map_rate_limit(mock_get):
     resp_429 = MagicMock()
     resp_429.status_code = 429
@@ -158,19 +1278,104 @@ def test_get_driver_map_rate_limit(mock_get):
     assert driver_map[("99", "1")] == "Test Driver"
 
 
-@patch("main.pd.DataFrame")
+def test_token_bucket():
+    bucket = main.TokenBucket(2, 1.0)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    # Bucket is empty: the next token is about half a second away
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.05)
+
+
+@patch("main.time.sleep")
+@patch("main.requests.Session.get")
+def test_http_client_honors_retry_after(mock_get, mock_sleep):
+    resp_503 = MagicMock()
+    resp_503.status_code = 503
+    resp_503.headers = {"Retry-After": "7"}
+    resp_503.raise_for_status.side_effect = main.requests.exceptions.HTTPError(
+        "503", response=resp_503
+    )
+    resp_200 = MagicMock()
+    resp_200.status_code = 200
+    resp_200.json.return_value = [{"session_key": 1}]
+    mock_get.side_effect = [resp_503, resp_200]
+    data = main.get_http_client().get_json("/sessions?year=2025")
+    assert data == [{"session_key": 1}]
+    mock_sleep.assert_called_once_with(7.0)
+
+
+@patch("main.requests.Session.get")
+def test_http_client_no_retry_on_404(mock_get):
+    resp_404 = MagicMock()
+    resp_404.status_code = 404
+    resp_404.raise_for_status.side_effect = main.requests.exceptions.HTTPError(
+        "404", response=resp_404
+    )
+    mock_get.return_value = resp_404
+    with pytest.raises(main.requests.exceptions.HTTPError):
+        main.get_http_client().get_json("/sessions?year=1900")
+    assert mock_get.call_count == 1
+
+
+@patch("pandas.DataFrame")
 def test_plot_standings(mock_df):
     mock_df.return_value.ffill.return_value.fillna.return_value = mock_df.return_value
     mock_df.return_value.melt.return_value = mock_df.return_value
     mock_fig = MagicMock()
-    with patch("main.px.line", return_value=mock_fig):
+    with patch("plotly.express.line", return_value=mock_fig):
         main.plot_standings([{"A": 1}], ["Race1"], ["A"])
         mock_fig.write_html.assert_called_once()
 
 
+def test_write_chart_modes(tmp_path_factory):
+    import plotly.graph_objects as go
+
+    fig = go.Figure(go.Scatter(x=["GP1", "GP2"], y=[25, 43]))
+    out = tmp_path_factory.mktemp("charts")
+    inline = str(out / "inline.html")
+    main.write_chart(fig, inline)
+    shared = str(out / "shared.html")
+    main.write_chart(fig, shared, mode="directory")
+    assert (out / main.PLOTLY_JS_FILE).exists()
+    # The shared chart no longer embeds the multi-MB plotly.js bundle
+    assert os.path.getsize(shared) * 50 < os.path.getsize(inline)
+
+    spec = main.chart_output_path(str(out / "spec.html"), "json")
+    main.write_chart(fig, spec, mode="json")
+    with open(spec) as f:
+        assert json.load(f)["data"][0]["y"] == [25, 43]
+    assert (out / main.VIEWER_FILE).exists()
+
+
 @patch(
     "main.argparse.ArgumentParser.parse_args",
-    return_value=type("Args", (), {"year": 2025, "force_update": False})(),
+    return_value=type(
+        "Args",
+        (),
+        {
+            "year": 2025,
+            "force_update": False,
+            "update_cache": False,
+            "cache_backend": None,
+            "cache_ttl": None,
+            "years": None,
+            "render_batch": None,
+            "combined": False,
+            "workers": None,
+            "output": "f1_standings.html",
+            "output_dir": "",
+            "output_mode": "inline",
+            "log_format": "text",
+            "profile": False,
+            "verbose": False,
+            "command": None,
+            "large_chart": None,
+            "constructors": False,
+            "export": None,
+            "export_format": "arrow",
+            "from_export": None,
+        },
+    )(),
 )
 def test_main_flow(mock_args):
     with (
@@ -183,7 +1388,9 @@ def test_main_flow(mock_args):
             return_value=[{"driver_number": 44, "position": 1}],
         ),
         patch("main.get_driver_map", return_value={("44", "1"): "Lewis Hamilton"}),
-        patch("main.plot_standings") as mock_plot,
+        patch("main.plot_standings_dataframe") as mock_plot,
+        # Nothing is drawn, so nothing to record in the render manifest
+        patch("main.save_render_keys"),
     ):
         main.main()
         mock_plot.assert_called_once()